@@ -0,0 +1,9 @@
+import pandas
+
+
+def transform(df: pandas.DataFrame) -> pandas.DataFrame:
+    df_res = df.copy()
+    df_res["test"] = "testing"
+    # chunks of source.csv infer int or str for Code, load it as text
+    df_res["Code"] = df_res["Code"].astype(str)
+    return df_res
@@ -56,7 +56,15 @@ def docs():
     required=False,
 )
 @click.option("--job", default=None, help="Job to be run", required=False)
-def run(profiles_dir, project_dir, job):
+@click.option(
+    "--workers",
+    envvar="INBOUND_WORKERS",
+    default=None,
+    type=int,
+    help="Number of jobs to run concurrently",
+    required=False,
+)
+def run(profiles_dir, project_dir, job, workers):
     dir = here
     if Path(project_dir).is_dir():
         dir = project_dir
@@ -66,10 +74,10 @@ def run(profiles_dir, project_dir, job):
     if job:  # run single job
         source = os.path.join(dir, job)
         click.echo(f"run job: {source}")
-        return run_job(source, profiles_dir)
+        return run_job(source, profiles_dir, workers=workers)
     else:  # run all jobs in jobs directory
         click.echo(f"run all jobs in directory: {dir}")
-        return run_jobs(dir, profiles_dir)
+        return run_jobs(dir, profiles_dir, workers=workers)
 
 
 @inbound.command
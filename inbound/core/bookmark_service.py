@@ -1,6 +1,12 @@
-from typing import Protocol
+import datetime
+import threading
+from typing import Optional, Protocol
+
+import duckdb
 
 from inbound.core.logging import LOGGER
+from inbound.core.models import Bookmark
+from inbound.core.utils import get_target_dir
 
 
 class DatabaseService(Protocol):
@@ -62,3 +68,91 @@ class BookmarkService:
                 LOGGER.error(
                     f"Error registering bookmark {bookmark} in table {self.bookmarks_table} for table {table}. Error {e}"
                 )
+
+
+class BookmarkStore(Protocol):
+    """State store for bookmarks (high-water marks) of incremental jobs"""
+
+    def get_bookmark(self, table):
+        ...
+
+    def set_bookmark(self, table, bookmark):
+        ...
+
+
+class DuckDBBookmarkService:
+    """Bookmarks stored in a local DuckDB database"""
+
+    def __init__(self, database: str = None, table: str = "bookmarks"):
+        self.database = database or str(get_target_dir() / "bookmarks.duckdb")
+        self.bookmarks_table = table
+        self.lock = threading.Lock()
+        with self.lock, duckdb.connect(self.database) as db:
+            db.execute(
+                f"create table if not exists {self.bookmarks_table}(name varchar, bookmark varchar, created timestamp)"
+            )
+
+    def get_bookmark(self, table):
+        with self.lock, duckdb.connect(self.database) as db:
+            bookmark = db.execute(
+                f"select bookmark from {self.bookmarks_table} where name = ? order by created desc limit 1",
+                [table],
+            ).fetchone()
+            LOGGER.info(f"Bookmark {bookmark} for table {table}")
+            if isinstance(bookmark, tuple):
+                return bookmark[0]
+            return bookmark
+
+    def set_bookmark(self, table, bookmark):
+        with self.lock, duckdb.connect(self.database) as db:
+            db.execute(
+                f"insert into {self.bookmarks_table} values (?, ?, ?)",
+                [table, bookmark, datetime.datetime.now()],
+            )
+            LOGGER.info(f"Bookmark {bookmark} set for table {table}")
+
+
+bookmark_store: BookmarkStore = None
+
+
+def set_bookmark_store(store: BookmarkStore) -> None:
+    """Use another bookmark store, e.g. BookmarkService on Snowflake"""
+    global bookmark_store
+    bookmark_store = store
+
+
+def get_bookmark_store(database: str = None) -> BookmarkStore:
+    """Bookmark store set with set_bookmark_store or a local DuckDB store"""
+    if bookmark_store is not None:
+        return bookmark_store
+    return DuckDBBookmarkService(database)
+
+
+def get_bookmark(store: BookmarkStore, name: str) -> Optional[Bookmark]:
+    bookmark = store.get_bookmark(name)
+    if bookmark is None:
+        return None
+    bookmark = Bookmark.parse_raw(bookmark)
+    if bookmark.type == "datetime":
+        bookmark.last_value = datetime.datetime.fromisoformat(bookmark.last_value)
+    elif bookmark.type == "date":
+        bookmark.last_value = datetime.date.fromisoformat(bookmark.last_value)
+    return bookmark
+
+
+def set_bookmark(store: BookmarkStore, name: str, bookmark: Bookmark) -> None:
+    value = bookmark.last_value
+    if hasattr(value, "to_pydatetime"):
+        value = value.to_pydatetime()
+    elif hasattr(value, "item"):
+        value = value.item()
+    if isinstance(value, datetime.datetime):
+        value_type = "datetime"
+    elif isinstance(value, datetime.date):
+        value_type = "date"
+    else:
+        value_type = None
+    store.set_bookmark(
+        name,
+        Bookmark(column=bookmark.column, last_value=value, type=value_type).json(),
+    )
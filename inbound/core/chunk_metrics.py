@@ -0,0 +1,106 @@
+"""Compact per-chunk metrics and dataframe size estimates."""
+
+import datetime
+import os
+from typing import Any, Dict
+
+import pandas
+
+# number of chunk records kept per job result
+MAX_CHUNKS = 100
+# rows used to estimate the size of object columns in "sampled" mode
+SAMPLE_ROWS = 1000
+
+
+def max_chunks() -> int:
+    try:
+        return int(os.getenv("INBOUND_MAX_CHUNKS", MAX_CHUNKS))
+    except ValueError:
+        return MAX_CHUNKS
+
+
+def frame_size(df: pandas.DataFrame, mode: str = None) -> int:
+    """Memory size of a dataframe in bytes.
+
+    Mode (default INBOUND_SIZE_MODE or "sampled"):
+        deep: exact size including python objects, slow for wide string frames
+        sampled: exact size of numeric columns, object columns estimated from
+            up to SAMPLE_ROWS evenly spaced rows
+        shallow: size of the arrays only, objects counted as pointers
+    """
+    mode = mode or os.getenv("INBOUND_SIZE_MODE", "sampled")
+    if mode == "deep" or len(df) <= SAMPLE_ROWS:
+        return int(df.memory_usage(deep=True).sum())
+
+    size = int(df.memory_usage(deep=False).sum())
+    if mode == "shallow":
+        return size
+
+    objects = df.select_dtypes(include="object")
+    if objects.shape[1] == 0:
+        return size
+
+    sample = objects.iloc[:: len(df) // SAMPLE_ROWS]
+    sample_size = sample.memory_usage(deep=True, index=False).sum()
+    sample_shallow = sample.memory_usage(deep=False, index=False).sum()
+    return size + int((sample_size - sample_shallow) * len(df) / len(sample))
+
+
+class ChunkMetrics:
+    """Metrics for one chunk, without the overhead of a pydantic model"""
+
+    __slots__ = (
+        "task_name",
+        "chunk_number",
+        "result",
+        "rows",
+        "size",
+        "start_date_time",
+        "duration_seconds",
+        "memory_peak",
+    )
+
+    def __init__(
+        self,
+        task_name: str,
+        chunk_number: int,
+        result: str,
+        rows: int,
+        size: int,
+        start_date_time: datetime.datetime,
+        duration_seconds: float,
+        memory_peak: float,
+    ):
+        self.task_name = task_name
+        self.chunk_number = chunk_number
+        self.result = result
+        self.rows = rows
+        self.size = size
+        self.start_date_time = start_date_time
+        self.duration_seconds = duration_seconds
+        self.memory_peak = memory_peak
+
+    @classmethod
+    def from_result(cls, res: Any) -> "ChunkMetrics":
+        return cls(
+            res.task_name,
+            res.chunk_number,
+            res.result,
+            res.rows,
+            res.size,
+            res.start_date_time,
+            res.duration_seconds,
+            res.memory_peak,
+        )
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "task": self.task_name,
+            "chunk": self.chunk_number,
+            "result": self.result,
+            "rows": self.rows,
+            "size": self.size,
+            "start": self.start_date_time,
+            "duration": round(self.duration_seconds, 4),
+            "memory peak": self.memory_peak,
+        }
@@ -1,14 +1,24 @@
+import collections
+import contextlib
 import datetime
-import os
-import tracemalloc
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 
+import pandas
+import pyarrow
+import pyarrow.compute
+
 import inbound.core.profiler as profiler
+from inbound.core.bookmark_service import get_bookmark, get_bookmark_store, set_bookmark
 from inbound.core.job_result import JobResult
 from inbound.core.logging import LOGGER
-from inbound.core.metadata import enriched_with_metadata
-from inbound.core.models import JobModel
-from inbound.core.transformer import transform
+from inbound.core.metadata import METADATA_FORMATS, enriched_with_metadata
+from inbound.core.metrics import get_metrics
+from inbound.core.models import Bookmark, JobModel
+from inbound.core.transformer import from_ipc, to_ipc, transform, transform_ipc
 from inbound.plugins.connections.connection import Connection
 
 
@@ -29,44 +39,27 @@ class Job:
             task_name="Job",
         )
 
-        tracemalloc.start()
+        self.job_result = job_result
+        self.profiling = profiler.get_session(f"{job_name or 'job'}-{job_id}")
 
         try:
-            with self.source as source:
-                with self.sink as sink:
-                    iterator = source.to_pandas(job_id)
-                    for index, (df, read_res) in enumerate(iterator):
-                        # log result of data loading
-                        read_res.log()
-
-                        # transform dataframe if specified
-                        if source.profile.spec.transformer is not None:
-                            df, transform_job_result = transform(
-                                source.profile.spec, df, job_id
-                            )
-                            # log result of data transformation
-                            transform_job_result.log()
-
-                        # add metadata if specified
-                        if source.profile.spec.format is not None:
-                            df, metadata_job_result = enriched_with_metadata(
-                                source.profile.spec, df, job_id
-                            )
-                            # log result of data enrichments
-                            metadata_job_result.log()
-
-                        # write to sink
-                        _, batch_job_result = sink.from_pandas(
-                            df,
-                            chunk_number=index,
-                            mode=sink.profile.spec.mode,
-                            job_id=job_id,
-                        )
-
-                        if os.getenv("INBOUND_PROFILING") is not None:
-                            profiler.snapshot()
-                        # log result persisting data
-                        batch_job_result.log()
+            with self._profile(), self.source as source:
+                with self.sink as sink, self._transform_pool(source) as pool:
+                    self._set_bookmark(source, sink)
+                    if self._use_files(source, sink):
+                        self._run_files(source, sink, job_id)
+                    elif self.config.pipelined:
+                        self._run_pipelined(source, sink, job_id, pool)
+                    else:
+                        iterator = self._read(source, sink, job_id, pool)
+                        for index, (df, read_res) in enumerate(iterator):
+                            self._read_result(source, read_res)
+                            df = self._process(source, df, job_id, pool is None)
+                            self._write(sink, df, index, job_id)
+
+                    self._finish(sink, job_result, job_id)
+                    # only after all chunks and buffered writes are loaded
+                    self._save_bookmark(source, sink)
 
             job_result.result = "DONE"
         except Exception as e:
@@ -74,16 +67,425 @@ class Job:
             job_result.result = "FAILED"
 
         finally:
-            if os.getenv("INBOUND_PROFILING") is not None:
-                profiler.display_stats()
-                profiler.compare()
-                profiler.print_trace()
             job_result.end_date_time = datetime.datetime.now()
-            job_result.memory = tracemalloc.get_traced_memory()
-            tracemalloc.stop()
+            job_result.memory = profiler.memory_usage()
             job_result.log()
+            self._observe_job(job_result)
             return job_result
 
+    @contextlib.contextmanager
+    def _profile(self):
+        """Profile the job. Profiler errors are logged and do not change the job result"""
+        session = self.profiling
+        try:
+            session.__enter__()
+        except Exception as e:
+            LOGGER.error(f"Error starting profiling of job {self.config.name}. {e}")
+            self.profiling = profiler.NULL_SESSION
+        try:
+            yield
+        finally:
+            try:
+                session.__exit__(None, None, None)
+            except Exception as e:
+                LOGGER.error(f"Error stopping profiling of job {self.config.name}. {e}")
+
+    def _observe(self, stage: str, res: JobResult):
+        """Record chunk latency, rows and bytes of a stage"""
+        metrics = get_metrics()
+        job = self.config.name or ""
+        metrics.observe(
+            "inbound_stage_seconds", res.duration_seconds, stage=stage, job=job
+        )
+        metrics.inc("inbound_chunks_total", stage=stage, job=job)
+        if res.rows > 0:
+            metrics.inc("inbound_rows_total", res.rows, stage=stage, job=job)
+        if res.size > 0:
+            metrics.inc("inbound_bytes_total", res.size, stage=stage, job=job)
+
+    def _read_result(self, source: Connection, read_res: JobResult):
+        # log result of data loading
+        read_res.log()
+        self._observe("read", read_res)
+        if not read_res.success:
+            raise RuntimeError(
+                f"Error reading chunk {read_res.chunk_number} from {source}"
+            )
+
+    def _transform_result(self, transform_res: JobResult):
+        # log result of data transformation
+        transform_res.log()
+        self._observe("transform", transform_res)
+        # transformers load once per process, the job reports the total
+        if transform_res.load_seconds > 0:
+            self.job_result.load_seconds += transform_res.load_seconds
+            get_metrics().inc(
+                "inbound_transformer_load_seconds_total",
+                transform_res.load_seconds,
+                job=self.config.name or "",
+            )
+
+    def _observe_job(self, job_result: JobResult):
+        metrics = get_metrics()
+        job = self.config.name or ""
+        seconds = job_result.duration_seconds
+        metrics.inc("inbound_jobs_total", job=job, result=job_result.result)
+        metrics.observe("inbound_job_seconds", seconds, job=job)
+        metrics.set("inbound_job_peak_memory_bytes", job_result.memory_peak, job=job)
+        if seconds > 0:
+            rows_per_second = max(0, job_result.rows) / seconds
+            bytes_per_second = max(0, job_result.size) / seconds
+            metrics.set("inbound_job_rows_per_second", rows_per_second, job=job)
+            metrics.set("inbound_job_bytes_per_second", bytes_per_second, job=job)
+
+    def _use_arrow(self, source: Connection, sink: Connection) -> bool:
+        """Use Arrow batches if both ends support it and no processing is needed"""
+        spec = source.profile.spec
+        return (
+            self.config.arrow
+            and spec.transformer is None
+            and spec.format not in METADATA_FORMATS
+            and _supports(source, "supports_to_arrow")
+            and _supports(sink, "supports_from_arrow")
+        )
+
+    def _use_files(self, source: Connection, sink: Connection) -> bool:
+        """Let the sink read the source files itself, e.g. with DuckDB read_csv_auto"""
+        return (
+            self.config.direct
+            and getattr(source, "bookmark", None) is None
+            and _supports(source, "supports_to_files")
+            and _supports(sink, "supports_from_files")
+        )
+
+    def _run_files(self, source: Connection, sink: Connection, job_id: str):
+        """Load source files in the sink.
+
+        Without transformer and metadata the sink loads each file in one
+        statement. Otherwise the sink scans the files in chunks, which are
+        processed as usual and written back to the sink.
+        """
+        spec = source.profile.spec
+        LOGGER.info(f"Loading files from {source} directly in {sink}")
+        index = 0
+        iterator = self.profiling.iterate("read", source.to_files(job_id))
+        for path, options, read_res in iterator:
+            self._read_result(source, read_res)
+            if spec.transformer is None and spec.format is None:
+                with self.profiling.stage("write"):
+                    _, write_res = sink.from_file(
+                        path,
+                        options,
+                        job_id=job_id,
+                        chunk_number=index,
+                        mode=sink.profile.spec.mode,
+                    )
+                write_res.log()
+                self._observe("write", write_res)
+                self.job_result.append(write_res)
+                if not write_res.success:
+                    raise RuntimeError(f"Error loading {path} in {sink}")
+                index += 1
+                continue
+
+            chunks = sink.scan_file(path, options, spec.chunksize, job_id)
+            for batch, scan_res in self.profiling.iterate("read", chunks):
+                self._read_result(source, scan_res)
+                df = self._process(source, batch.to_pandas(), job_id)
+                self._write(sink, df, index, job_id)
+                index += 1
+
+    def _read(
+        self,
+        source: Connection,
+        sink: Connection,
+        job_id: str,
+        pool: ProcessPoolExecutor = None,
+    ):
+        if self._use_arrow(source, sink):
+            LOGGER.info(f"Using arrow record batches from {source} to {sink}")
+            iterator = source.to_arrow(job_id)
+        else:
+            iterator = source.to_pandas(job_id)
+
+        if getattr(source, "bookmark", None) is not None:
+            iterator = self._track_watermark(iterator, source.bookmark.column)
+        iterator = self.profiling.iterate("read", iterator)
+        if pool is not None:
+            iterator = self._transform_in_pool(pool, source, iterator, job_id)
+        return iterator
+
+    def _transform_pool(self, source: Connection):
+        """Process pool for transforms if enabled with transform_processes"""
+        processes = self.config.transform_processes
+        if not processes or source.profile.spec.transformer is None:
+            return contextlib.nullcontext()
+
+        LOGGER.info(f"Transforming chunks in {processes} processes")
+        # spawn, forking with the reader and writer threads running can deadlock
+        return ProcessPoolExecutor(
+            max_workers=processes, mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def _transform_in_pool(
+        self, pool: ProcessPoolExecutor, source: Connection, iterator, job_id: str
+    ):
+        """Transform chunks in the pool and yield them in read order"""
+        path = source.profile.spec.transformer
+        # keep a few chunks per process in flight
+        window = 2 * self.config.transform_processes
+        pending = collections.deque()
+
+        def result():
+            future, read_res = pending.popleft()
+            with self.profiling.stage("transform"):
+                payload, transform_job_result = future.result()
+            self._transform_result(transform_job_result)
+            return from_ipc(payload), read_res
+
+        try:
+            for df, read_res in iterator:
+                future = pool.submit(transform_ipc, path, to_ipc(df), job_id)
+                pending.append((future, read_res))
+                if len(pending) >= window:
+                    yield result()
+            while pending:
+                yield result()
+        finally:
+            for future, _ in pending:
+                future.cancel()
+
+    def _bookmark_name(self, source: Connection, sink: Connection) -> str:
+        return self.config.name or f"{source.name}-{sink.profile.spec.table}"
+
+    def _set_bookmark(self, source: Connection, sink: Connection):
+        """Read rows after the last high-water mark in incremental mode"""
+        self.watermark = None
+        column = source.profile.spec.watermark_column
+        if column is None:
+            return
+
+        last_value = self._target_watermark(source, sink)
+        if last_value is None:
+            store = get_bookmark_store(source.profile.spec.bookmark_store)
+            bookmark = get_bookmark(store, self._bookmark_name(source, sink))
+            if bookmark is not None:
+                last_value = bookmark.last_value
+
+        source.bookmark = Bookmark(column=column, last_value=last_value)
+        LOGGER.info(f"Reading rows from {source} with {column} > {last_value}")
+
+    def _target_watermark(self, source: Connection, sink: Connection):
+        query = (
+            sink.profile.spec.target_watermark_query
+            or source.profile.spec.target_watermark_query
+        )
+        if query is None:
+            return None
+
+        try:
+            row = sink.execute(query).fetchone()
+            return row[0] if row else None
+        except Exception as e:
+            LOGGER.info(f"Could not get watermark from {sink} with {query}. {e}")
+            return None
+
+    def _track_watermark(self, iterator, column: str):
+        for chunk, read_res in iterator:
+            value = _max_value(chunk, column)
+            if value is not None and (self.watermark is None or value > self.watermark):
+                self.watermark = value
+            yield chunk, read_res
+
+    def _save_bookmark(self, source: Connection, sink: Connection):
+        # persist new high-water mark after a successful load
+        if getattr(source, "bookmark", None) is None or self.watermark is None:
+            return
+
+        store = get_bookmark_store(source.profile.spec.bookmark_store)
+        set_bookmark(
+            store,
+            self._bookmark_name(source, sink),
+            Bookmark(column=source.bookmark.column, last_value=self.watermark),
+        )
+
+    def _process(
+        self,
+        source: Connection,
+        df: pandas.DataFrame,
+        job_id: str,
+        transform_chunk: bool = True,
+    ):
+        if isinstance(df, pyarrow.RecordBatch):
+            return df
+
+        # transform dataframe if specified
+        if transform_chunk and source.profile.spec.transformer is not None:
+            with self.profiling.stage("transform"):
+                df, transform_job_result = transform(source.profile.spec, df, job_id)
+            self._transform_result(transform_job_result)
+
+        # add metadata if specified
+        if source.profile.spec.format is not None:
+            with self.profiling.stage("metadata"):
+                df, metadata_job_result = enriched_with_metadata(
+                    source.profile.spec, df, job_id
+                )
+            # log result of data enrichments
+            metadata_job_result.log()
+            self._observe("metadata", metadata_job_result)
+
+        return df
+
+    def _write(self, sink: Connection, df: pandas.DataFrame, index: int, job_id: str):
+        # write to sink
+        from_chunk = (
+            sink.from_arrow if isinstance(df, pyarrow.RecordBatch) else sink.from_pandas
+        )
+        with self.profiling.stage("write"):
+            _, batch_job_result = from_chunk(
+                df,
+                chunk_number=index,
+                mode=sink.profile.spec.mode,
+                job_id=job_id,
+            )
+
+        # log result persisting data
+        batch_job_result.log()
+        self._observe("write", batch_job_result)
+        self.job_result.append(batch_job_result)
+        if not batch_job_result.success:
+            raise RuntimeError(f"Error writing chunk {index} to {sink}")
+
+    def _finish(self, sink: Connection, job_result: JobResult, job_id: str):
+        # complete writes buffered by the sink
+        finish = getattr(sink, "finish", None)
+        if finish is None:
+            return
+
+        with self.profiling.stage("finish"):
+            finish_job_result = finish(job_id)
+        if finish_job_result is None:
+            return
+
+        finish_job_result.log()
+        job_result.batches.append(finish_job_result)
+        if not finish_job_result.success:
+            raise RuntimeError(f"Error completing writes to {sink}")
+
+    def _run_pipelined(
+        self,
+        source: Connection,
+        sink: Connection,
+        job_id: str,
+        pool: ProcessPoolExecutor = None,
+    ):
+        """Read, process and write chunks concurrently.
+
+        The reader and the transform/metadata stage run in threads and hand chunks
+        over through bounded queues, so at most `queue_depth` chunks wait between
+        two stages. Chunks are written in the calling thread in read order.
+        """
+        depth = max(1, self.config.queue_depth or 1)
+        read_queue = queue.Queue(maxsize=depth)
+        write_queue = queue.Queue(maxsize=depth)
+        stop = threading.Event()
+        errors = []
+
+        def read():
+            try:
+                iterator = self._read(source, sink, job_id, pool)
+                for index, (df, read_res) in enumerate(iterator):
+                    self._read_result(source, read_res)
+                    if not _put(read_queue, (index, df), stop):
+                        return
+            except Exception as e:
+                errors.append(e)
+            finally:
+                _put(read_queue, _END_OF_STREAM, stop)
+
+        def process():
+            try:
+                while True:
+                    item = _get(read_queue, stop)
+                    if item is _END_OF_STREAM:
+                        return
+                    index, df = item
+                    df = self._process(source, df, job_id, pool is None)
+                    if not _put(write_queue, (index, df), stop):
+                        return
+            except Exception as e:
+                errors.append(e)
+            finally:
+                _put(write_queue, _END_OF_STREAM, stop)
+
+        stages = [
+            threading.Thread(target=read, name=f"inbound-read-{job_id}"),
+            threading.Thread(target=process, name=f"inbound-process-{job_id}"),
+        ]
+        for stage in stages:
+            stage.start()
+
+        try:
+            while True:
+                item = _get(write_queue, stop)
+                if item is _END_OF_STREAM:
+                    break
+                index, df = item
+                self._write(sink, df, index, job_id)
+        finally:
+            stop.set()
+            for stage in stages:
+                stage.join()
+
+        if errors:
+            raise errors[0]
+
+
+_END_OF_STREAM = object()
+
+
+def _max_value(chunk, column: str):
+    """Max value of column in a DataFrame or RecordBatch chunk"""
+    if isinstance(chunk, pyarrow.RecordBatch):
+        names = chunk.schema.names
+    else:
+        names = list(chunk.columns)
+    matches = [name for name in names if name.lower() == column.lower()]
+    if not matches or len(chunk) == 0:
+        return None
+
+    if isinstance(chunk, pyarrow.RecordBatch):
+        return pyarrow.compute.max(chunk.column(matches[0])).as_py()
+    value = chunk[matches[0]].max()
+    return None if pandas.isna(value) else value
+
+
+def _supports(connection: Connection, capability: str) -> bool:
+    """Connections not derived from BaseConnection may lack arrow support"""
+    return getattr(connection, capability, lambda: False)()
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """Put item on queue. Give up if the pipeline is stopped"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q: queue.Queue, stop: threading.Event):
+    """Get item from queue. End of stream if the pipeline is stopped"""
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _END_OF_STREAM
+
 
 @dataclass
 class JobFactory:
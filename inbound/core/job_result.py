@@ -1,13 +1,14 @@
 import datetime
-import json
+from collections import deque
 from dataclasses import dataclass, field
-from pathlib import Path
-from typing import ForwardRef, List, Optional, Tuple
+from typing import Deque, ForwardRef, List, Optional, Tuple
 
-from pydantic import BaseModel, validator
+from pydantic import BaseModel, PrivateAttr, validator
 
+from inbound.core.chunk_metrics import ChunkMetrics, max_chunks
 from inbound.core.logging import LOGGER
-from inbound.core.utils import generate_id, get_target_dir
+from inbound.core.result_sink import RESULT_SINK
+from inbound.core.utils import generate_id
 
 LOCAL_TIMEZONE = datetime.datetime.now().astimezone().tzinfo
 
@@ -29,6 +30,11 @@ class JobResult(BaseModel):
     batches: Optional[List[JobResult]] = []
     memory: Optional[Tuple[float, float]] = 0, 0
     exception: Optional[str] = ""
+    load_seconds: Optional[float] = 0.0
+    chunk_count: Optional[int] = 0
+    _chunks: Deque[ChunkMetrics] = PrivateAttr(
+        default_factory=lambda: deque(maxlen=max_chunks())
+    )
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -59,18 +65,28 @@ class JobResult(BaseModel):
     def timezone(self):
         return LOCAL_TIMEZONE
 
+    @property
+    def chunks(self) -> List[ChunkMetrics]:
+        """Metrics of the last chunks added with append (INBOUND_MAX_CHUNKS)"""
+        return list(self._chunks)
+
     def append(self, res: JobResult):
+        """Add a chunk result to the totals and keep a compact record of it"""
         self.result = res.result
-        self.rows += res.rows
-        self.size += res.size
-        self.duration_seconds += res.duration_seconds
+        self.rows = max(0, self.rows) + max(0, res.rows)
+        self.size = max(0, self.size) + max(0, res.size)
         self.memory = tuple(
             [
                 max(0, self.memory[0], res.memory[0]),
                 max(0, self.memory[1], res.memory[1]),
             ]
         )
+        self.chunk_count += 1
+        self._chunks.append(ChunkMetrics.from_result(res))
+        # full results of the same last chunks for callers of batches
         self.batches.append(res)
+        if len(self.batches) > self._chunks.maxlen:
+            del self.batches[0]
 
     def to_json(self):
         batches = []
@@ -85,10 +101,13 @@ class JobResult(BaseModel):
             "size": str(self.size),
             "start": self.start_date_time,
             "duration": str(self.duration_rounded),
+            "load duration": str(round(self.load_seconds, 4)),
             "memory size": str(self.memory_size),
             "memory peak": str(self.memory_peak),
             "batchcount": str(len(self.batches)),
             "batches": batches,
+            "chunkcount": str(self.chunk_count),
+            "chunks": [chunk.to_json() for chunk in self._chunks],
         }
 
     def __str__(self):
@@ -98,9 +117,7 @@ class JobResult(BaseModel):
     def log(self):
         LOGGER.info(str(self))
 
-        json_str = json.dumps(self.to_json(), default=str)
-        with open(str(Path(get_target_dir() / "job_result.json")), "a+") as log_file:
-            log_file.write(json_str)
+        RESULT_SINK.write("job_result.json", self.to_json())
 
 
 JobResult.update_forward_refs()
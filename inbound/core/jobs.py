@@ -2,7 +2,6 @@ import datetime
 import json
 import os
 import tempfile
-import tracemalloc
 from pathlib import Path
 from typing import Union
 
@@ -12,31 +11,40 @@ from jinja2 import Template
 from inbound.core import connection_factory, connection_loader
 from inbound.core.environment import get_env
 from inbound.core.job_factory import JobFactory
+from inbound.core.job_result import JobResult
 from inbound.core.jobs_result import JobsResult
 from inbound.core.logging import LOGGER
+from inbound.core.metrics import get_metrics
 from inbound.core.models import *
+from inbound.core.profiler import memory_usage
+from inbound.core.scheduler import JobScheduler
 from inbound.core.utils import generate_id
 
 
-def run_job(source: Union[str, dict], profiles_dir: Path = None) -> JobsResult:
+def run_job(
+    source: Union[str, dict],
+    profiles_dir: Path = None,
+    workers: int = None,
+    concurrency: Dict[str, int] = None,
+) -> JobsResult:
 
-    jobs_spec = _get_json_config(source)
-
-    # Replace 'env_var's in template
-    temp = Template(json.dumps(jobs_spec)).render(env_var=get_env)
-    jobs_config = json.loads(temp, strict=False)
-
-    # Get list of jobs to run
-    try:
-        jobs = JobsModel(**jobs_config).jobs
-    except Exception as e:
-        LOGGER.info(f"Invalid jobs configuration: {str(e)}")
+    jobs_model = _get_jobs_model(source)
+    if jobs_model is None:
         return JobsResult()
 
-    return _run_jobs_in_list(jobs=jobs)
+    return _run_jobs_in_list(
+        jobs=jobs_model.jobs,
+        workers=workers or jobs_model.workers,
+        concurrency=concurrency or jobs_model.concurrency,
+    )
 
 
-def run_jobs(path: str = "./jobs", profiles_dir: Path = None):
+def run_jobs(
+    path: str = "./jobs",
+    profiles_dir: Path = None,
+    workers: int = None,
+    concurrency: Dict[str, int] = None,
+) -> JobsResult:
 
     try:
         job_definition_files = [
@@ -49,16 +57,45 @@ def run_jobs(path: str = "./jobs", profiles_dir: Path = None):
         LOGGER.info(f"Error in searching for job .yml files i path: {path}. {str(e)}")
         return JobsResult()
 
+    # Collect jobs from all files and schedule them together
+    jobs = []
+    file_workers = None
+    file_concurrency = {}
+    for job_definition_file in job_definition_files:
+        jobs_model = _get_jobs_model(job_definition_file)
+        if jobs_model is None:
+            LOGGER.info(f"Error reading jobs from file: {job_definition_file}")
+            continue
+        jobs += jobs_model.jobs
+        # the most workers and the strictest concurrency limits of the files
+        if jobs_model.workers is not None:
+            file_workers = max(file_workers or 0, jobs_model.workers)
+        for connection_type, limit in (jobs_model.concurrency or {}).items():
+            file_concurrency[connection_type] = min(
+                limit, file_concurrency.get(connection_type, limit)
+            )
+
+    # arguments take precedence over the settings in the files
+    return _run_jobs_in_list(
+        jobs=jobs,
+        workers=workers or file_workers,
+        concurrency={**file_concurrency, **(concurrency or {})} or None,
+    )
+
+
+def _get_jobs_model(source: Union[str, dict]) -> Optional[JobsModel]:
+
+    jobs_spec = _get_json_config(source)
+
+    # Replace 'env_var's in template
+    temp = Template(json.dumps(jobs_spec)).render(env_var=get_env)
+    jobs_config = json.loads(temp, strict=False)
+
     try:
-        for job_definition_file in job_definition_files:
-            res = run_job(job_definition_file)
-            if res.result != "DONE":
-                LOGGER.info(
-                    f"Error running job: {job_definition_file}. Result: {str(res)}"
-                )
-        return JobsResult(result="DONE")
-    except:
-        return JobsResult()
+        return JobsModel(**jobs_config)
+    except Exception as e:
+        LOGGER.info(f"Invalid jobs configuration: {str(e)}")
+        return None
 
 
 def _get_json_config(source: Union[str, dict]):
@@ -95,7 +132,9 @@ def _get_json_config(source: Union[str, dict]):
         LOGGER.info(f"Error loading jobs configuration from {source}. {e}")
 
 
-def _run_jobs_in_list(jobs: List) -> JobsResult:
+def _run_jobs_in_list(
+    jobs: List, workers: int = None, concurrency: Dict[str, int] = None
+) -> JobsResult:
 
     # Load plugins for source og target
     source_types = [job.source.type for job in jobs]
@@ -106,29 +145,38 @@ def _run_jobs_in_list(jobs: List) -> JobsResult:
     # Run E(T)L jobs
     jobs_result = JobsResult(start_date_time=datetime.datetime.now())
     jobs_result.job_name = "Run jobs"
-    for job in jobs:
-        tracemalloc.start()
-        LOGGER.info(
-            f"Starting job: {job.name} ({job.job_id}). Source: {job.source.name or job.source.type}. Target: {job.target.name or job.target.type}"
-        )
-        source_connector = connection_factory.create(job.source)
-        sink_connector = connection_factory.create(job.target)
-        job_instance = JobFactory(source_connector, sink_connector, job)()
-        try:
-            res = job_instance.run()
+    scheduler = JobScheduler(workers=workers, concurrency=concurrency or {})
+
+    try:
+        for job, res in scheduler.run(jobs, _run_single_job):
             jobs_result.end_date_time = datetime.datetime.now()
-            jobs_result.memory = tracemalloc.get_traced_memory()
+            jobs_result.memory = memory_usage()
             jobs_result.append(res)
-            jobs_result.result = "DONE"
-            jobs_result.log()
-        except Exception as e:
-            jobs_result.end_date_time = datetime.datetime.now()
-            jobs_result.memory = tracemalloc.get_traced_memory()
-            jobs_result.result = "FAILED"
-            jobs_result.log()
-        finally:
-            tracemalloc.stop()
-            LOGGER.info(
-                f"Finished job: {job.name} ({job.job_id}). Source: {job.source.name or job.source.type}. Target: {job.target.name or job.target.type}"
+            jobs_result.result = (
+                "FAILED"
+                if jobs_result.result == "FAILED" or not res.success
+                else "DONE"
             )
+            jobs_result.log()
+    finally:
+        get_metrics().dump()
     return jobs_result
+
+
+def _run_single_job(job: JobModel) -> JobResult:
+
+    LOGGER.info(
+        f"Starting job: {job.name} ({job.job_id}). Source: {job.source.name or job.source.type}. Target: {job.target.name or job.target.type}"
+    )
+    try:
+        source_connector = connection_factory.create(job.source)
+        sink_connector = connection_factory.create(job.target)
+        job_instance = JobFactory(source_connector, sink_connector, job)()
+        return job_instance.run()
+    except Exception as e:
+        LOGGER.error(f"Error running job: {job.name} ({job.job_id}). {e}")
+        return JobResult(result="FAILED", job_id=job.job_id, job_name=job.name)
+    finally:
+        LOGGER.info(
+            f"Finished job: {job.name} ({job.job_id}). Source: {job.source.name or job.source.type}. Target: {job.target.name or job.target.type}"
+        )
@@ -1,14 +1,13 @@
 import datetime
-import json
 from dataclasses import dataclass, field
-from pathlib import Path
 from typing import ForwardRef, List, Optional, Tuple
 
 from pydantic import BaseModel, validator
 
 from inbound.core.job_result import JobResult
 from inbound.core.logging import LOGGER
-from inbound.core.utils import generate_id, get_target_dir
+from inbound.core.result_sink import RESULT_SINK
+from inbound.core.utils import generate_id
 
 
 class JobsResult(BaseModel):
@@ -78,9 +77,9 @@ class JobsResult(BaseModel):
     def log(self):
         LOGGER.info(str(self))
 
-        json_str = json.dumps(self.to_json(), default=str)
-        with open(str(Path(get_target_dir() / "job_results.json")), "a+") as log_file:
-            log_file.write(json_str)
+        RESULT_SINK.write("job_results.json", self.to_json())
+        # results are complete on disk when a job is done
+        RESULT_SINK.flush()
 
 
 JobsResult.update_forward_refs()
@@ -4,8 +4,9 @@ import json
 import time
 import tracemalloc
 from collections import defaultdict
-from typing import Tuple
+from typing import List, Optional, Sequence, Tuple, Union
 
+import numpy
 import pandas
 
 from inbound.core.job_result import JobResult
@@ -13,6 +14,105 @@ from inbound.core.logging import LOGGER
 from inbound.core.models import Spec
 from inbound.core.package import get_pacage_name, get_package_version
 
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+METADATA_FORMATS = ["meta+json", "meta", "log"]
+HASH_FUNCTIONS = ["md5", "sha1", "sha256", "hash64", "xxh64", "xxh3_64"]
+RAW_BLOCK_ROWS = 10000
+
+
+def raw_json(df: pandas.DataFrame, block_rows: int = RAW_BLOCK_ROWS) -> List[str]:
+    """Each row as a JSON string.
+
+    Rows are serialized with DataFrame.to_json in blocks of `block_rows`, so the
+    output is the same as for the whole frame without holding the JSON for all
+    rows in one string.
+    """
+    raw: List[str] = []
+    for start in range(0, len(df), block_rows):
+        block = df.iloc[start : start + block_rows].to_json(
+            orient="records", lines=True, force_ascii=False, date_format="iso"
+        )
+        # split on newline only, JSON escapes newlines in values but not U+2028
+        raw.extend(block.rstrip("\n").split("\n"))
+    return raw
+
+
+def row_ids(
+    df: pandas.DataFrame, row_id: Optional[Union[str, List]]
+) -> Optional[pandas.Series]:
+    """ROW_ID column: a key column or key columns joined with underscore"""
+    if row_id:
+        if type(row_id) is str:
+            return df[row_id]
+        if all(isinstance(s, str) for s in row_id):
+            columns = [x for x in df.columns if x in row_id]
+            if not columns:
+                return None
+            frame = df[columns]
+            # values in the dtype common to the key columns, as a row of the frame
+            values = frame.values
+            if values.dtype.kind in "mM":
+                # datetimes are formatted per row
+                ids = frame.apply(lambda x: "_".join(x.astype(str)), axis=1)
+            else:
+                strings = [
+                    pandas.Series(
+                        values[:, index], index=df.index, dtype=values.dtype
+                    ).astype(str)
+                    for index in range(len(columns))
+                ]
+                ids = strings[0]
+                if len(strings) > 1:
+                    ids = ids.str.cat(strings[1:], sep="_")
+            return ids.replace(" ", "_")
+        return None
+
+    for id_col in ["id", "ID"]:
+        if id_col in df.columns:
+            return df[id_col]
+    return None
+
+
+def row_hashes(
+    values: Sequence[str], hash_function: str = "md5", df: pandas.DataFrame = None
+) -> List[str]:
+    """Hex digest of each value.
+
+    md5, sha1 and sha256 use hashlib and xxh64/xxh3_64 need the xxhash package.
+    hash64 is the vectorized 64 bit hash from pandas of the row values in `df`
+    (or of `values` if not given). The non-cryptographic hashes are much faster
+    and fine for change detection.
+    """
+    if hash_function == "hash64":
+        try:
+            hashes = pandas.util.hash_pandas_object(df, index=False).values
+        except (TypeError, ValueError):
+            # columns with unhashable values like dicts and lists
+            hashes = pandas.util.hash_array(numpy.asarray(values, dtype=object))
+        hex_digests = hashes.astype(">u8").tobytes().hex().encode("ascii")
+        return numpy.frombuffer(hex_digests, dtype="S16").astype(str).tolist()
+
+    if hash_function in ["xxh64", "xxh3_64"]:
+        if xxhash is None:
+            raise ImportError(
+                f"Hash function {hash_function} needs the xxhash package. Install it with pip install inbound-core[xxhash]"
+            )
+        digest = getattr(xxhash, f"{hash_function}_hexdigest")
+        return [digest(value.encode("utf-8")) for value in values]
+
+    if hash_function not in hashlib.algorithms_available:
+        raise ValueError(
+            f"Unknown hash function {hash_function}. Use one of {HASH_FUNCTIONS}"
+        )
+    new = getattr(hashlib, hash_function, None) or (
+        lambda data: hashlib.new(hash_function, data)
+    )
+    return [new(value.encode("utf-8")).hexdigest() for value in values]
+
 
 def enriched_with_metadata(
     spec: Spec, df: pandas.DataFrame, job_id: str = None
@@ -53,31 +153,17 @@ def enriched_with_metadata(
         try:
             df_out = pandas.DataFrame()
 
-            if spec.row_id:
-                if type(spec.row_id) is str:
-                    df_out["ROW_ID"] = df[spec.row_id]
-                elif all(isinstance(s, str) for s in spec.row_id):
-                    df_out["ROW_ID"] = (
-                        df[[x for x in df.columns if x in spec.row_id]]
-                        .apply(lambda x: "_".join(x.astype(str)), axis=1)
-                        .replace(" ", "_")
-                    )
-            else:
-                for id_col in ["id", "ID"]:
-                    if id_col in df.columns:
-                        df_out["ROW_ID"] = df[id_col]
-            df_out["RAW"] = df.to_json(
-                orient="records", lines=True, force_ascii=False, date_format="iso"
-            ).splitlines()
+            ids = row_ids(df, spec.row_id)
+            if ids is not None:
+                df_out["ROW_ID"] = ids
+            df_out["RAW"] = raw_json(df)
 
             df_out["SOURCE"] = spec.source
             df_out["INTERFACE"] = spec.interface
             df_out["LOADER"] = get_pacage_name() + "-" + get_package_version()
             df_out["JOB_ID"] = job_id
             df_out["LOAD_TIME"] = datetime.datetime.now().timestamp()
-            df_out["HASH"] = [
-                hashlib.md5(data.encode("utf-8")).hexdigest() for data in df_out["RAW"]
-            ]
+            df_out["HASH"] = row_hashes(df_out["RAW"], spec.hash_function or "md5", df)
 
             job_res.task_name = "Process: log"
             job_res.end_date_time = datetime.datetime.now()
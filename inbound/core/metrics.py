@@ -0,0 +1,220 @@
+"""Metrics for jobs and chunks with pluggable backends.
+
+The backend is chosen with INBOUND_METRICS:
+    prometheus: keep metrics in memory, exposition() returns the Prometheus text
+        format and serve(port) exposes it over http
+    file: as prometheus, and dump() writes the text format to INBOUND_METRICS_FILE
+        (default target/metrics.prom), e.g. for the node exporter textfile collector
+Without INBOUND_METRICS metrics are not recorded.
+"""
+
+import bisect
+import http.server
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Protocol, Tuple
+
+from inbound.core.logging import LOGGER
+
+# latency buckets in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+DESCRIPTIONS = {
+    "inbound_rows_total": "Rows processed by stage",
+    "inbound_bytes_total": "Bytes processed by stage",
+    "inbound_chunks_total": "Chunks processed by stage",
+    "inbound_stage_seconds": "Chunk latency by stage",
+    "inbound_retries_total": "Retries by retry_with_backoff",
+    "inbound_jobs_total": "Jobs run by result",
+    "inbound_job_seconds": "Job duration",
+    "inbound_job_rows_per_second": "Rows written per second in the last job run",
+    "inbound_job_bytes_per_second": "Bytes written per second in the last job run",
+    "inbound_job_peak_memory_bytes": "Peak traced memory in the last job run",
+    "inbound_transformer_load_seconds_total": "Time spent loading transformer modules",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class MetricsBackend(Protocol):
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        ...
+
+    def set(self, name: str, value: float, **labels) -> None:
+        ...
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        ...
+
+    def dump(self) -> None:
+        ...
+
+
+class NullMetrics:
+    """Backend that records nothing"""
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        pass
+
+    def set(self, name: str, value: float, **labels) -> None:
+        pass
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        pass
+
+    def dump(self) -> None:
+        pass
+
+
+class PrometheusMetrics:
+    """Counters, gauges and histograms in Prometheus text exposition format"""
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+        self.gauges: Dict[str, Dict[Labels, float]] = {}
+        # bucket counts, sum and count per label set
+        self.histograms: Dict[str, Dict[Labels, Tuple[List[int], float, int]]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = _labels(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        with self.lock:
+            self.gauges.setdefault(name, {})[_labels(labels)] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _labels(labels)
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            counts, total, count = series.get(key, ([0] * len(self.buckets), 0, 0))
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(counts):
+                counts[index] += 1
+            series[key] = (counts, total + value, count + 1)
+
+    def exposition(self) -> str:
+        lines = []
+        with self.lock:
+            for kind, metrics in [("counter", self.counters), ("gauge", self.gauges)]:
+                for name, series in sorted(metrics.items()):
+                    lines += _header(name, kind)
+                    for key, value in series.items():
+                        lines.append(f"{name}{_format(key)} {_number(value)}")
+
+            for name, series in sorted(self.histograms.items()):
+                lines += _header(name, "histogram")
+                for key, (counts, total, count) in series.items():
+                    cumulative = 0
+                    for bound, bucket_count in zip(self.buckets, counts):
+                        cumulative += bucket_count
+                        le = key + (("le", _number(bound)),)
+                        lines.append(f"{name}_bucket{_format(le)} {cumulative}")
+                    lines.append(
+                        f"{name}_bucket{_format(key + (('le', '+Inf'),))} {count}"
+                    )
+                    lines.append(f"{name}_sum{_format(key)} {_number(total)}")
+                    lines.append(f"{name}_count{_format(key)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int) -> http.server.HTTPServer:
+        """Expose metrics over http on /metrics in a background thread"""
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.exposition().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(("", port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        LOGGER.info(f"Serving metrics on port {server.server_port}")
+        return server
+
+    def dump(self) -> None:
+        pass
+
+
+class FileMetrics(PrometheusMetrics):
+    """Prometheus metrics written to a file on dump()"""
+
+    def __init__(self, path: str = None, buckets: Tuple[float, ...] = BUCKETS):
+        super().__init__(buckets)
+        self.path = path
+
+    def dump(self) -> None:
+        path = Path(self.path or Path.cwd() / "target" / "metrics.prom")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(path.name + ".tmp")
+            tmp_path.write_text(self.exposition())
+            # replace atomically so collectors never read a partial file
+            os.replace(tmp_path, path)
+        except Exception as e:
+            LOGGER.error(f"Error writing metrics to {path}. {e}")
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (key, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _header(name: str, kind: str) -> List[str]:
+    return [f"# HELP {name} {DESCRIPTIONS.get(name, name)}", f"# TYPE {name} {kind}"]
+
+
+metrics_backend: Optional[MetricsBackend] = None
+# job threads of run_jobs may make the first call at the same time
+_METRICS_LOCK = threading.Lock()
+
+
+def set_metrics(backend: MetricsBackend) -> None:
+    global metrics_backend
+    with _METRICS_LOCK:
+        metrics_backend = backend
+
+
+def get_metrics() -> MetricsBackend:
+    """Metrics backend set with set_metrics or configured with INBOUND_METRICS"""
+    global metrics_backend
+    if metrics_backend is not None:
+        return metrics_backend
+    with _METRICS_LOCK:
+        if metrics_backend is None:
+            backend = os.getenv("INBOUND_METRICS", "").lower()
+            if backend == "prometheus":
+                metrics = PrometheusMetrics()
+                if os.getenv("INBOUND_METRICS_PORT"):
+                    metrics.serve(int(os.getenv("INBOUND_METRICS_PORT")))
+            elif backend == "file":
+                metrics = FileMetrics(os.getenv("INBOUND_METRICS_FILE"))
+            else:
+                metrics = NullMetrics()
+            metrics_backend = metrics
+        return metrics_backend
@@ -19,6 +19,8 @@ class SyncMode(Enum):
 class Bookmark(BaseModel):
     column: str
     last_value: Any
+    # set for datetime and date values, which are stored as ISO strings
+    type: Optional[str] = None
 
 
 class OracleSpec(BaseModel):
@@ -32,6 +34,10 @@ class BaseSpec(BaseModel):
     project_id: Optional[str] = None
     keyfile: Optional[str] = None
     chunksize: Optional[int] = 10000
+    stream_results: Optional[bool] = True
+    arraysize: Optional[int] = None
+    partition_column: Optional[str] = None
+    partitions: Optional[int] = None
     client_email: Optional[str] = None
     private_key: Optional[str] = None
     table_schema: Optional[List[Dict[str, str]]]
@@ -43,10 +49,19 @@ class BaseSpec(BaseModel):
     source: Optional[str] = None
     interface: Optional[str] = None
     row_id: Optional[Union[str, List]] = None
+    hash_function: Optional[str] = "md5"
     profile: Optional[str] = None
     target: Optional[str] = None
     profiles_dir: Optional[str] = None
     target_watermark_query: Optional[str] = None
+    watermark_column: Optional[str] = None
+    bookmark_store: Optional[str] = None
+    # COPY based loads. None is the connector default: on for postgres, off for snowflake
+    bulk: Optional[bool] = None
+    accumulate_chunks: Optional[int] = None
+    stage: Optional[str] = None
+    compression: Optional[str] = None
+    parallel: Optional[int] = 4
 
 
 class SnowflakeSpec(BaseSpec):
@@ -79,9 +94,20 @@ class BucketSpec(BaseSpec):
     blob: Optional[str] = None
     prefix: Optional[str] = None
     format: Optional[str] = "parquet"
+    prefetch: Optional[int] = 4
+    stream_blobs: Optional[bool] = False
+    file_size: Optional[int] = None
+    row_group_size: Optional[int] = None
+    upload_chunk_size: Optional[int] = None
+
+
+class BigQuerySpec(BaseSpec):
+    storage_api: Optional[bool] = True
 
 
-class Spec(SQLAlchemySpec, SnowflakeSpec, FileSpec, BucketSpec, OracleSpec):
+class Spec(
+    SQLAlchemySpec, SnowflakeSpec, FileSpec, BucketSpec, BigQuerySpec, OracleSpec
+):
     mode: Optional[str] = "append"
     pass
 
@@ -127,10 +153,18 @@ class JobModel(BaseModel):
     meta: Optional[Dict] = None
     source: Profile
     target: Profile
+    pipelined: Optional[bool] = False
+    queue_depth: Optional[int] = 2
+    transform_processes: Optional[int] = None
+    # opt-in paths that bypass pandas chunks
+    arrow: Optional[bool] = False
+    direct: Optional[bool] = False
 
 
 class JobsModel(BaseModel):
     jobs: List[JobModel]
+    workers: Optional[int] = None
+    concurrency: Optional[Dict[str, int]] = None
 
 
 class SodaSpec(BaseModel):
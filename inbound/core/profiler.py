@@ -1,43 +1,361 @@
-# https://www.red-gate.com/simple-talk/development/python/memory-profiling-in-python-with-tracemalloc/
+"""Stage level profiling of jobs, enabled with INBOUND_PROFILING."""
+
+import collections
+import contextlib
+import json
+import os
+import re
+import sys
+import threading
+import time
 import tracemalloc
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Protocol, Tuple
+
+from inbound.core.logging import LOGGER
+
+PROFILERS = ["timer", "cpu", "memory"]
+SAMPLE_INTERVAL = 0.01
+
+# tracemalloc is process wide and shared by the memory profilers of concurrent jobs
+_TRACING_LOCK = threading.Lock()
+_tracing_sessions = 0
+_tracing_started = False
+
+
+class Profiler(Protocol):
+    name: str
+
+    def start(self) -> None:
+        ...
+
+    def stop(self) -> None:
+        ...
+
+    def enter(self, stage: str) -> Any:
+        ...
+
+    def exit(self, stage: str, state: Any) -> None:
+        ...
+
+    def report(self) -> Dict[str, Any]:
+        ...
+
+
+class TimerProfiler:
+    """Wall-clock seconds per stage"""
+
+    name = "timer"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages: Dict[str, List[float]] = {}
+
+    def start(self) -> None:
+        pass
 
-# list to store memory snapshots
-snaps = []
+    def stop(self) -> None:
+        pass
 
+    def enter(self, stage: str) -> float:
+        return time.perf_counter()
 
-def snapshot():
-    snaps.append(tracemalloc.take_snapshot())
+    def exit(self, stage: str, state: float) -> None:
+        seconds = time.perf_counter() - state
+        with self.lock:
+            count, total, maximum = self.stages.get(stage, [0, 0.0, 0.0])
+            self.stages[stage] = [count + 1, total + seconds, max(maximum, seconds)]
 
+    def report(self) -> Dict[str, Any]:
+        return {
+            stage: {
+                "count": count,
+                "seconds": round(total, 6),
+                "max": round(maximum, 6),
+            }
+            for stage, (count, total, maximum) in self.stages.items()
+        }
 
-def display_stats():
-    stats = snaps[0].statistics("filename")
-    print("\n*** top 5 stats grouped by filename ***")
-    for s in stats[:5]:
-        print(s)
 
+class SamplingProfiler:
+    """Samples the stacks of all threads in a background thread"""
 
-def compare():
-    first = snaps[0]
-    for snapshot in snaps[1:]:
-        stats = snapshot.compare_to(first, "lineno")
-        print("\n*** top 10 stats ***")
-        for s in stats[:10]:
-            print(s)
+    name = "cpu"
 
+    def __init__(self, session: "ProfilingSession", interval: float = SAMPLE_INTERVAL):
+        self.session = session
+        self.interval = interval
+        self.stacks: Dict[str, int] = collections.Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
 
-def print_trace():
-    # pick the last saved snapshot, filter noise
-    snapshot = snaps[-1].filter_traces(
-        (
-            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
-            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
-            tracemalloc.Filter(False, "<unknown>"),
+    def start(self) -> None:
+        self.thread = threading.Thread(
+            target=self._sample, name="inbound-profiler", daemon=True
         )
-    )
-    largest = snapshot.statistics("traceback")[0]
-
-    print(
-        f"\n*** Trace for largest memory block - ({largest.count} blocks, {largest.size/1024} Kb) ***"
-    )
-    for l in largest.traceback.format():
-        print(l)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def enter(self, stage: str) -> None:
+        pass
+
+    def exit(self, stage: str, state: None) -> None:
+        pass
+
+    def _sample(self) -> None:
+        own_thread = threading.get_ident()
+        while not self.stopped.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread:
+                    continue
+                stage = self.session.current_stage(thread_id)
+                if stage is None:
+                    continue
+                self.stacks[";".join([stage] + _stack(frame))] += 1
+                self.samples += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.items())
+
+    def report(self) -> Dict[str, Any]:
+        stages: Dict[str, int] = collections.Counter()
+        functions: Dict[str, int] = collections.Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            stages[frames[0]] += count
+            functions[frames[-1]] += count
+        return {
+            "interval": self.interval,
+            "samples": self.samples,
+            "stages": dict(stages),
+            "top": dict(functions.most_common(20)),
+        }
+
+
+class MemoryProfiler:
+    """Allocations per stage with tracemalloc"""
+
+    name = "memory"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stages: Dict[str, List[int]] = {}
+        self.top: List[str] = []
+        self.tracing = False
+
+    def start(self) -> None:
+        global _tracing_sessions, _tracing_started
+        with _TRACING_LOCK:
+            if _tracing_sessions == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                _tracing_started = True
+            _tracing_sessions += 1
+            self.tracing = True
+
+    def stop(self) -> None:
+        global _tracing_sessions, _tracing_started
+        if not self.tracing:
+            return
+        try:
+            if tracemalloc.is_tracing():
+                snapshot = tracemalloc.take_snapshot().filter_traces(
+                    (
+                        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+                        tracemalloc.Filter(
+                            False, "<frozen importlib._bootstrap_external>"
+                        ),
+                        tracemalloc.Filter(False, "<unknown>"),
+                        tracemalloc.Filter(False, tracemalloc.__file__),
+                    )
+                )
+                self.top = [str(stat) for stat in snapshot.statistics("lineno")[:10]]
+        finally:
+            # stop tracing with the last profiler, unless it was started elsewhere
+            with _TRACING_LOCK:
+                self.tracing = False
+                _tracing_sessions -= 1
+                if _tracing_sessions == 0 and _tracing_started:
+                    tracemalloc.stop()
+                    _tracing_started = False
+
+    def enter(self, stage: str) -> int:
+        # peak per stage, approximate when stages run concurrently
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+
+    def exit(self, stage: str, state: int) -> None:
+        current, peak = tracemalloc.get_traced_memory()
+        with self.lock:
+            count, allocated, maximum = self.stages.get(stage, [0, 0, 0])
+            self.stages[stage] = [
+                count + 1,
+                allocated + current - state,
+                max(maximum, peak),
+            ]
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "stages": {
+                stage: {"count": count, "net_bytes": allocated, "peak_bytes": peak}
+                for stage, (count, allocated, peak) in self.stages.items()
+            },
+            "top": self.top,
+        }
+
+
+class ProfilingSession:
+    """Profilers for one job run. Use stage() around each unit of work."""
+
+    enabled = True
+
+    def __init__(self, name: str, profilers: List[str]):
+        self.name = name
+        self.lock = threading.Lock()
+        # stack of stage names per thread
+        self.threads: Dict[int, List[str]] = {}
+        self.profilers: List[Profiler] = []
+        for profiler in profilers:
+            if profiler == "timer":
+                self.profilers.append(TimerProfiler())
+            elif profiler == "cpu":
+                self.profilers.append(SamplingProfiler(self))
+            elif profiler == "memory":
+                self.profilers.append(MemoryProfiler())
+
+    def __enter__(self) -> "ProfilingSession":
+        for profiler in self.profilers:
+            profiler.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        for profiler in self.profilers:
+            profiler.stop()
+        self.write()
+
+    def current_stage(self, thread_id: int) -> Optional[str]:
+        stages = self.threads.get(thread_id)
+        return stages[-1] if stages else None
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        thread_id = threading.get_ident()
+        with self.lock:
+            self.threads.setdefault(thread_id, []).append(name)
+        states = [profiler.enter(name) for profiler in self.profilers]
+        try:
+            yield
+        finally:
+            for profiler, state in zip(self.profilers, states):
+                profiler.exit(name, state)
+            with self.lock:
+                self.threads[thread_id].pop()
+
+    def iterate(self, stage: str, iterator) -> Iterator:
+        """Profile the time spent in next() of an iterator as a stage"""
+        while True:
+            with self.stage(stage):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            **{profiler.name: profiler.report() for profiler in self.profilers},
+        }
+
+    def write(self, target_dir: Path = None) -> Optional[Path]:
+        target_dir = target_dir or Path.cwd() / "target" / "profile"
+        try:
+            target_dir.mkdir(parents=True, exist_ok=True)
+            path = target_dir / f"{_file_name(self.name)}.json"
+            path.write_text(json.dumps(self.report(), indent=2, default=str))
+            for profiler in self.profilers:
+                if isinstance(profiler, SamplingProfiler):
+                    path.with_suffix(".folded").write_text(profiler.folded())
+            LOGGER.info(f"Profile of {self.name} written to {path}")
+            return path
+        except Exception as e:
+            LOGGER.error(f"Error writing profile of {self.name}. {e}")
+            return None
+
+
+class NullSession:
+    """Disabled profiling. Stages cost a shared no-op context manager."""
+
+    enabled = False
+    _stage = contextlib.nullcontext()
+
+    def __enter__(self) -> "NullSession":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        pass
+
+    def stage(self, name: str) -> contextlib.nullcontext:
+        return self._stage
+
+    def iterate(self, stage: str, iterator) -> Iterator:
+        return iterator
+
+
+NULL_SESSION = NullSession()
+
+
+def get_profilers(profiling: str = None) -> List[str]:
+    """Profilers enabled with INBOUND_PROFILING"""
+    profiling = profiling if profiling is not None else os.getenv("INBOUND_PROFILING")
+    if not profiling:
+        return []
+    profilers = [name.strip().lower() for name in profiling.split(",")]
+    if not set(profilers) & set(PROFILERS):
+        return PROFILERS
+    return [name for name in profilers if name in PROFILERS]
+
+
+def get_session(name: str, profiling: str = None):
+    profilers = get_profilers(profiling)
+    if not profilers:
+        return NULL_SESSION
+    return ProfilingSession(name, profilers)
+
+
+def memory_usage() -> Tuple[int, int]:
+    """Current and peak memory: traced by tracemalloc if running, else RSS"""
+    if tracemalloc.is_tracing():
+        return tracemalloc.get_traced_memory()
+
+    current = peak = 0
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    current = int(line.split()[1]) * 1024
+                elif line.startswith("VmHWM:"):
+                    peak = int(line.split()[1]) * 1024
+    except OSError:
+        import resource
+
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return current, peak
+
+
+def _stack(frame) -> List[str]:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+        frame = frame.f_back
+    return stack[::-1]
+
+
+def _file_name(name: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
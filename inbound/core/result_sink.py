@@ -0,0 +1,113 @@
+"""Background writer for job results in target/*.json as JSON Lines."""
+
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+from typing import IO, Dict, List, Tuple
+
+from inbound.core.logging import LOGGER
+
+FLUSH_INTERVAL = 1.0
+BATCH_SIZE = 1000
+
+
+class ResultSink:
+    """Write result records from a background thread.
+
+    Records are queued by `write` and written in batches to long-lived file
+    handles, one JSON document per line. Files are flushed every
+    `flush_interval` seconds, after `batch_size` records and on `flush`. A
+    single writer thread per process keeps lines from concurrent jobs whole.
+    """
+
+    def __init__(
+        self, flush_interval: float = FLUSH_INTERVAL, batch_size: int = BATCH_SIZE
+    ):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def _start(self) -> None:
+        # (re)start in each process, threads are not inherited by forks
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.queue: queue.Queue = queue.Queue()
+            self.files: Dict[Path, IO] = {}
+            self.thread = threading.Thread(
+                target=self._run, name="inbound-result-sink", daemon=True
+            )
+            self.pid = os.getpid()
+            self.thread.start()
+
+    def write(self, file_name: str, record: dict) -> None:
+        """Queue record for target/<file_name> in the current directory"""
+        if self.pid != os.getpid():
+            self._start()
+        self.queue.put((Path.cwd() / "target" / file_name, record))
+
+    def flush(self) -> None:
+        """Wait until all queued records are written to disk"""
+        if self.pid != os.getpid():
+            return
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait()
+
+    def close(self) -> None:
+        self.flush()
+        if self.pid == os.getpid():
+            self.queue.put(None)
+            self.thread.join()
+            self.pid = None
+
+    def _run(self) -> None:
+        batch: List[Tuple[Path, dict]] = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = _TICK
+
+            if isinstance(item, tuple):
+                batch.append(item)
+                if len(batch) < self.batch_size and time.monotonic() < deadline:
+                    continue
+
+            # write after batch_size records, flush_interval, flush or close
+            self._write_batch(batch)
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+
+            for log_file in self.files.values():
+                log_file.flush()
+            if isinstance(item, threading.Event):
+                item.set()
+            if item is None:
+                for log_file in self.files.values():
+                    log_file.close()
+                self.files = {}
+                return
+
+    def _write_batch(self, batch: List[Tuple[Path, dict]]) -> None:
+        for path, record in batch:
+            try:
+                log_file = self.files.get(path)
+                if log_file is None:
+                    path.parent.mkdir(parents=False, exist_ok=True)
+                    log_file = self.files[path] = open(path, "a", encoding="utf-8")
+                log_file.write(json.dumps(record, default=str) + "\n")
+            except Exception as e:
+                LOGGER.error(f"Error writing result to {path}. {e}")
+
+
+_TICK = object()
+
+RESULT_SINK = ResultSink()
+atexit.register(RESULT_SINK.close)
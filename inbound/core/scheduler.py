@@ -0,0 +1,163 @@
+"""Concurrent scheduling of independent jobs."""
+
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from inbound.core.job_result import JobResult
+from inbound.core.logging import LOGGER
+from inbound.core.models import JobModel, Profile
+
+DEFAULT_WORKERS = 1
+
+
+def get_workers(workers: int = None) -> int:
+    """Number of jobs to run at the same time. Defaults to INBOUND_WORKERS or 1."""
+    if workers is None:
+        try:
+            workers = int(os.getenv("INBOUND_WORKERS", DEFAULT_WORKERS))
+        except ValueError:
+            LOGGER.info(f"Invalid INBOUND_WORKERS {os.getenv('INBOUND_WORKERS')}")
+            workers = DEFAULT_WORKERS
+    return max(1, workers)
+
+
+def get_concurrency(concurrency: Dict[str, int] = None) -> Dict[str, int]:
+    """Max number of running jobs per connection type.
+
+    Read from INBOUND_CONCURRENCY (e.g. "snowflake=4,oracle=2") if not given.
+    """
+    if concurrency is not None:
+        return concurrency
+
+    limits = {}
+    for item in os.getenv("INBOUND_CONCURRENCY", "").split(","):
+        if "=" not in item:
+            continue
+        connection_type, limit = item.split("=", 1)
+        try:
+            limits[connection_type.strip()] = int(limit)
+        except ValueError:
+            LOGGER.info(f"Invalid concurrency limit {item} in INBOUND_CONCURRENCY")
+    return limits
+
+
+def resource_key(profile: Profile) -> Optional[str]:
+    """Identify the database, file or bucket a profile reads from or writes to"""
+    spec = profile.spec
+    if spec is None:
+        return None
+
+    location = (
+        spec.connection_string or spec.database or spec.path or spec.url or spec.bucket
+    )
+    if location is None:
+        return None
+
+    return f"{profile.type}:{str(location)}"
+
+
+def _conflicts(first: JobModel, second: JobModel) -> bool:
+    """Jobs conflict if one of them writes to a resource the other one uses"""
+    first_target = resource_key(first.target)
+    second_target = resource_key(second.target)
+    if first_target is not None and first_target in [
+        resource_key(second.source),
+        second_target,
+    ]:
+        return True
+    return second_target is not None and second_target == resource_key(first.source)
+
+
+def dependencies(jobs: List[JobModel]) -> List[Set[int]]:
+    """For each job the indices of the earlier jobs it must wait for"""
+    return [
+        {index for index in range(position) if _conflicts(jobs[index], job)}
+        for position, job in enumerate(jobs)
+    ]
+
+
+@dataclass
+class JobScheduler:
+    """Run jobs concurrently in a thread pool.
+
+    Jobs that share a resource run in list order. The number of running jobs per
+    connection type is capped by `concurrency`.
+    """
+
+    workers: int = None
+    concurrency: Dict[str, int] = field(default_factory=dict)
+
+    def __post_init__(self):
+        self.workers = get_workers(self.workers)
+        self.concurrency = {
+            connection_type: max(1, limit)
+            for connection_type, limit in get_concurrency(
+                self.concurrency or None
+            ).items()
+        }
+
+    def _types(self, job: JobModel) -> Set[str]:
+        return {job.source.type, job.target.type} & set(self.concurrency.keys())
+
+    def _is_allowed(self, job: JobModel, running: Dict[str, int]) -> bool:
+        return all(
+            running.get(connection_type, 0) < self.concurrency[connection_type]
+            for connection_type in self._types(job)
+        )
+
+    def _run(
+        self, job: JobModel, run_job: Callable[[JobModel], JobResult]
+    ) -> JobResult:
+        try:
+            return run_job(job)
+        except Exception as e:
+            LOGGER.error(f"Error running job {job.name}. {e}")
+            return JobResult(result="FAILED", job_id=job.job_id, job_name=job.name)
+
+    def run(
+        self, jobs: List[JobModel], run_job: Callable[[JobModel], JobResult]
+    ) -> Iterator[Tuple[JobModel, JobResult]]:
+        """Run jobs and yield results in order of completion"""
+
+        if self.workers == 1:
+            for job in jobs:
+                yield job, self._run(job, run_job)
+            return
+
+        waits_for = dependencies(jobs)
+        pending = list(range(len(jobs)))
+        completed: Set[int] = set()
+        running: Dict[Future, int] = {}
+        running_types: Dict[str, int] = {}
+
+        LOGGER.info(f"Running {len(jobs)} jobs with {self.workers} workers")
+
+        with ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="inbound-job"
+        ) as executor:
+            while pending or running:
+                for index in list(pending):
+                    if len(running) >= self.workers:
+                        break
+                    job = jobs[index]
+                    if not waits_for[index] <= completed:
+                        continue
+                    if not self._is_allowed(job, running_types):
+                        continue
+                    for connection_type in self._types(job):
+                        running_types[connection_type] = (
+                            running_types.get(connection_type, 0) + 1
+                        )
+                    pending.remove(index)
+                    running[executor.submit(self._run, job, run_job)] = index
+
+                done, _ = wait(running.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    job = jobs[index]
+                    for connection_type in self._types(job):
+                        running_types[connection_type] -= 1
+                    completed.add(index)
+                    yield job, future.result()
@@ -1,13 +1,24 @@
 import datetime
 import importlib
-from typing import Tuple
+import os
+import threading
+import time
+from types import ModuleType
+from typing import Dict, Optional, Tuple, Union
 
 import pandas
+import pyarrow
+import pyarrow.ipc
 
+from inbound.core.chunk_metrics import frame_size
 from inbound.core.job_result import JobResult
 from inbound.core.logging import LOGGER
 from inbound.core.models import Spec
 
+# transformer modules loaded in this process by path: (mtime, module)
+_transformers: Dict[str, Tuple[float, ModuleType]] = {}
+_lock = threading.Lock()
+
 
 def transform(
     spec: Spec, df: pandas.DataFrame, job_id: str = None
@@ -16,7 +27,7 @@ def transform(
     job_result = JobResult(
         job_id=job_id,
         start_date_time=datetime.datetime.now(),
-        size=df.memory_usage(deep=True).sum(),
+        size=frame_size(df),
         rows=len(df),
         chunk_number=1,
     )
@@ -28,26 +39,92 @@ def transform(
         return df, job_result
     else:
         try:
-            transformer = _get_transformer(spec.transformer)
+            transformer, job_result.load_seconds = _load_transformer(spec.transformer)
+            # transform duration excludes loading the module
+            job_result.start_date_time = datetime.datetime.now()
             df_transformed = transformer.transform(df)
             job_result.end_date_time = datetime.datetime.now()
             job_result.result = "DONE"
             return df_transformed, job_result
         except Exception as e:
+            LOGGER.error(f"Error transforming dataframe with {spec.transformer}. {e}")
             job_result.end_date_time = datetime.datetime.now()
             job_result.result = "FAILED"
+            job_result.exception = str(e)
             return df, job_result
 
 
-def _get_transformer(path: str):
+def to_ipc(df: pandas.DataFrame) -> Union[pyarrow.Buffer, pandas.DataFrame]:
+    """Dataframe as an Arrow IPC stream for passing to another process.
 
-    module_name = "transformer"
-    spec = importlib.util.spec_from_file_location(module_name, path)
+    Dataframes Arrow cannot represent (e.g. mixed type or non-string column
+    names) are returned as is and pickled.
+    """
+    if not all(isinstance(column, str) for column in df.columns):
+        return df
+    try:
+        table = pyarrow.Table.from_pandas(df)
+    except (
+        pyarrow.ArrowInvalid,
+        pyarrow.ArrowTypeError,
+        pyarrow.ArrowNotImplementedError,
+    ):
+        return df
+
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def from_ipc(payload: Union[pyarrow.Buffer, pandas.DataFrame]) -> pandas.DataFrame:
+    if isinstance(payload, pandas.DataFrame):
+        return payload
+    return pyarrow.ipc.open_stream(payload).read_all().to_pandas()
+
+
+def transform_ipc(
+    path: str, payload: Union[pyarrow.Buffer, pandas.DataFrame], job_id: str = None
+) -> Tuple[Union[pyarrow.Buffer, pandas.DataFrame], JobResult]:
+    """Transform a chunk passed as Arrow IPC in a worker process"""
+    df, job_result = transform(Spec(transformer=path), from_ipc(payload), job_id)
+    return to_ipc(df), job_result
+
+
+def _get_transformer(path: str) -> Optional[ModuleType]:
+    module, _ = _load_transformer(path)
+    return module
+
+
+def _load_transformer(path: str) -> Tuple[Optional[ModuleType], float]:
+    """Transformer module for path and the seconds spent loading it.
+
+    Modules are loaded once per process and reloaded if the file changes. An
+    optional setup() function in the module is called once after loading.
+    """
+    path = os.path.abspath(path)
+    mtime = os.path.getmtime(path)
+
+    with _lock:
+        cached = _transformers.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1], 0.0
+
+        start = time.perf_counter()
+        module_name = "transformer"
+        spec = importlib.util.spec_from_file_location(module_name, path)
+
+        if spec is None:
+            LOGGER.info(f"Could not find module {module_name} in path {path}")
+            return None, 0.0
 
-    if spec is None:
-        LOGGER.info(f"Could not find module {module_name} in path {path}")
-    else:
         module = importlib.util.module_from_spec(spec)
         spec.loader.exec_module(module)
+        if callable(getattr(module, "setup", None)):
+            module.setup()
+
+        _transformers[path] = (mtime, module)
+        load_seconds = time.perf_counter() - start
+        LOGGER.info(f"Loaded transformer {path} in {round(load_seconds, 4)} seconds")
 
-        return module
+        return module, load_seconds
@@ -9,6 +9,7 @@ from typing import Tuple
 
 from inbound.core import JobResult
 from inbound.core.logging import LOGGER
+from inbound.core.metrics import get_metrics
 
 
 def retry_with_backoff(retries=5, backoff_in_ms=1000):
@@ -24,6 +25,9 @@ def retry_with_backoff(retries=5, backoff_in_ms=1000):
                     if x == retries:
                         raise
                     else:
+                        get_metrics().inc(
+                            "inbound_retries_total", function=f.__qualname__
+                        )
                         sleep_ms = backoff_in_ms * 2**x + random.uniform(0, 1)
                         time.sleep(sleep_ms / 1000)
                         x += 1
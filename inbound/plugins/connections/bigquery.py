@@ -1,20 +1,40 @@
 import base64
+import collections
 import json
 import os
+import queue
 import re
+import shutil
+import tempfile
+import threading
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Any, Iterator, Tuple
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Iterator, Optional, Tuple, Union
 
 import pandas
+import pyarrow
+import pyarrow.parquet
 import sqlalchemy
 from google.cloud import bigquery
 from google.oauth2 import service_account
 
 from inbound.core import JobResult, Profile, Spec, connection_factory, logging
+from inbound.core.chunk_metrics import frame_size
 from inbound.plugins.connections.connection import BaseConnection
 
+try:
+    from google.cloud import bigquery_storage
+except ImportError:
+    bigquery_storage = None
+
 LOGGER = logging.LOGGER
 
+# target size of the Parquet payload of a load job in bytes
+FILE_SIZE = 256 * 2**20
+
 
 class BigQueryConnection(BaseConnection):
     def __init__(self, profile: Profile):
@@ -24,6 +44,13 @@ class BigQueryConnection(BaseConnection):
         self.connection = None
         self.query = None
         self.client = None
+        self.credentials = None
+        # rolling Parquet payload and load jobs in flight, see from_pandas
+        self.executor = None
+        self.temp_dir = None
+        self.writer = None
+        self.loads = collections.deque()
+        self._reset()
 
     def __enter__(self):
         self.chunksize = self.spec.chunksize
@@ -33,40 +60,158 @@ class BigQueryConnection(BaseConnection):
         self.engine = _create_engine(self.spec)
         self.connection = self.engine.connect()
 
-        self.client = _bigquery_get_client(self.spec)
+        # shared by the BigQuery client and the Storage read client
+        self.credentials = _bigquery_get_credentials(self.spec)
+        self.client = _bigquery_get_client(self.spec, self.credentials)
 
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
+        # load chunks written outside of Job.run
+        if exc_type is None:
+            self.finish()
+        self._reset()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
         if self.connection:
             self.connection.close()
 
         if self.engine:
             self.engine.dispose()
 
-    # TODO: use bigquery storage directly?
+    def supports_to_arrow(self) -> bool:
+        return True
+
+    def to_arrow(
+        self, job_id: str = None
+    ) -> Iterator[Tuple[pyarrow.RecordBatch, JobResult]]:
+        """Record batches of at most chunksize rows from the query or table"""
+        chunk_start_date_time = datetime.now()
+        for chunk_number, batch in enumerate(self._read_batches()):
+            result = JobResult(
+                result="DONE",
+                job_id=job_id,
+                task_name=f"bigquery to arrow",
+                start_date_time=chunk_start_date_time,
+                end_date_time=datetime.now(),
+                memory=tracemalloc.get_traced_memory(),
+                chunk_number=chunk_number,
+                rows=batch.num_rows,
+                size=batch.nbytes,
+            )
+            chunk_start_date_time = datetime.now()
+            yield batch, result
+
     def to_pandas(
         self, job_id: str = None
     ) -> Iterator[Tuple[pandas.DataFrame, JobResult]]:
-        """Get iterator for BigQuery results
-
-        Args:
-            query (str): SQL string
-
-        Returns:
-            Iterator
-        """
+        """Chunks of at most chunksize rows from the query or table"""
+        for batch, job_res in self.to_arrow(job_id):
+            df = batch.to_pandas()
+            job_res.task_name = f"bigquery to pandas"
+            job_res.end_date_time = datetime.now()
+            job_res.size = frame_size(df)
+            yield df, job_res
+
+    def get_read_client(self) -> Any:
+        """BigQuery Storage read client, None if the Storage API is not used"""
+        if bigquery_storage is None or not self.spec.storage_api:
+            return None
+        return bigquery_storage.BigQueryReadClient(credentials=self.credentials)
+
+    def _source_table(self) -> Any:
+        """Table with the query result or the table in the spec"""
+        if self.query:
+            LOGGER.info(
+                f"Execute query {self.query} in BigQuery {self.spec.project_id}"
+            )
+            job = self.client.query(self.query)
+            job.result()
+            return job.destination
+        return self.client.get_table(self.spec.table)
+
+    def _read_batches(self) -> Iterator[pyarrow.RecordBatch]:
+        table = self._source_table()
+        read_client = self.get_read_client()
+        if read_client is None:
+            LOGGER.info(
+                f"Reading {table.table_id} from BigQuery in pages without the Storage API"
+            )
+            batches = self.client.list_rows(
+                table, page_size=self.chunksize
+            ).to_arrow_iterable()
+        else:
+            batches = self._read_streams(read_client, table)
+
+        for batch in batches:
+            for offset in range(0, batch.num_rows, self.chunksize):
+                yield batch.slice(offset, self.chunksize)
+
+    def _read_streams(
+        self, read_client: Any, table: Any
+    ) -> Iterator[pyarrow.RecordBatch]:
+        """Read the streams of a Storage API read session concurrently"""
+        session = read_client.create_read_session(
+            parent=f"projects/{self.client.project}",
+            read_session=bigquery_storage.types.ReadSession(
+                table=f"projects/{table.project}/datasets/{table.dataset_id}/tables/{table.table_id}",
+                data_format=bigquery_storage.types.DataFormat.ARROW,
+            ),
+            max_stream_count=self.spec.parallel or 1,
+        )
+        streams = list(session.streams)
+        if not streams:
+            return
 
-        LOGGER.info(f"Execute query {self.query} in BigQuery {self.spec.project_id}")
+        LOGGER.info(
+            f"Reading {table.table_id} from BigQuery in {len(streams)} Storage API streams"
+        )
 
-        try:
-            iterator = pandas.read_sql(
-                self.query, self.engine, chunksize=self.chunksize
-            )
-            return iterator
-        except Exception as e:
-            LOGGER.info(f"Error reading from BigQuery. {str(e)}")
-            return [], JobResult(result="DONE")
+        batches = queue.Queue(maxsize=2 * len(streams))
+        stop = threading.Event()
+
+        def read(stream: Any) -> None:
+            for page in read_client.read_rows(stream.name).rows(session).pages:
+                batch = page.to_arrow()
+                while not stop.is_set():
+                    try:
+                        batches.put(batch, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+
+        with ThreadPoolExecutor(
+            max_workers=len(streams), thread_name_prefix="inbound-bigquery"
+        ) as executor:
+            futures = [executor.submit(read, stream) for stream in streams]
+            try:
+                while True:
+                    try:
+                        yield batches.get(timeout=0.1)
+                        continue
+                    except queue.Empty:
+                        pass
+                    for future in futures:
+                        if future.done() and future.exception() is not None:
+                            LOGGER.error(
+                                f"Could not read stream of {table.table_id} from BigQuery"
+                            )
+                            raise future.exception()
+                    if all(future.done() for future in futures) and batches.empty():
+                        break
+            finally:
+                stop.set()
+
+    @property
+    def temp_table(self) -> str:
+        return self.spec.table + "_NEW"
+
+    def supports_from_arrow(self) -> bool:
+        return True
 
     def from_pandas(
         self,
@@ -75,37 +220,231 @@ class BigQueryConnection(BaseConnection):
         chunk_number: int = 0,
         mode: str = "append",
     ) -> Tuple[Any, JobResult]:
-        temp_table = self.spec.table + "_NEW"
+        job_res = JobResult(
+            result="NO RUN",
+            job_id=job_id,
+            task_name=f"pandas to bigquery",
+            start_date_time=datetime.now(),
+            chunk_number=chunk_number,
+            rows=len(df),
+            size=frame_size(df),
+        )
+        return self._write(df, chunk_number, mode, job_res)
 
-        LOGGER.info(f"Write to table {temp_table} in BigQuery")
+    def from_arrow(
+        self,
+        batch: pyarrow.RecordBatch,
+        job_id: str = None,
+        chunk_number: int = 0,
+        mode: str = "append",
+    ) -> Tuple[Any, JobResult]:
+        job_res = JobResult(
+            result="NO RUN",
+            job_id=job_id,
+            task_name=f"arrow to bigquery",
+            start_date_time=datetime.now(),
+            chunk_number=chunk_number,
+            rows=batch.num_rows,
+            size=batch.nbytes,
+        )
+        return self._write(
+            pyarrow.Table.from_batches([batch]), chunk_number, mode, job_res
+        )
 
+    def _write(
+        self,
+        data: Union[pandas.DataFrame, pyarrow.Table],
+        chunk_number: int,
+        mode: str,
+        job_res: JobResult,
+    ) -> Tuple[Any, JobResult]:
+        """Add chunk to the Parquet payload. Full payloads are loaded into the
+        temp table in the background and swapped into place by finish"""
         if not self.client:
             LOGGER.info(f"Bigquery client not available")
-            return "FAILED", JobResult()
-
-        job_config = bigquery.LoadJobConfig(
-            schema=self.spec.table_schema,
-            write_disposition="WRITE_TRUNCATE"
-            if (chunk_number == 0 and mode == "replace")
-            else "WRITE_APPEND",
-        )
+            job_res.result = "FAILED"
+            return None, job_res
 
         try:
-            job = self.client.load_table_from_dataframe(
-                df, temp_table, job_config=job_config
+            if not self.started:
+                # loads run concurrently, so all of them append to an empty temp table
+                LOGGER.info(f"Write to table {self.temp_table} in BigQuery")
+                self.client.delete_table(self.temp_table, not_found_ok=True)
+                self.started = True
+            if chunk_number == 0 and mode == "replace":
+                self.replace = True
+
+            table = (
+                pyarrow.Table.from_pandas(data, preserve_index=False)
+                if isinstance(data, pandas.DataFrame)
+                else data
             )
-            LOGGER.debug(
-                f"Writing dataframe {df.size} rows in chunk {chunk_number} to {temp_table} in BigQuery."
+            if self.writer is None:
+                self.writer = pyarrow.parquet.ParquetWriter(
+                    self._open_file(),
+                    table.schema,
+                    compression=self.spec.compression or "snappy",
+                )
+            self.writer.write_table(table.cast(self.writer.schema))
+            self.file_rows += job_res.rows
+
+            if os.stat(self.file_name).st_size >= (self.spec.file_size or FILE_SIZE):
+                self._roll()
+
+            job_res.memory = tracemalloc.get_traced_memory()
+            job_res.end_date_time = datetime.now()
+            job_res.result = "DONE"
+            return self.file_name, job_res
+        except Exception as e:
+            LOGGER.error(
+                f"Error writing chunk {chunk_number} for loading to {self.temp_table} in BigQuery. {e}"
             )
-            return "DONE", JobResult(
-                job.result().state, len(df), df.memory_usage(index=True).sum()
+            job_res.memory = tracemalloc.get_traced_memory()
+            job_res.end_date_time = datetime.now()
+            job_res.result = "FAILED"
+            return None, job_res
+
+    def _open_file(self) -> str:
+        if self.temp_dir is None:
+            self.temp_dir = tempfile.mkdtemp(prefix="inbound_bigquery_")
+        self.file_name = str(Path(self.temp_dir) / f"part_{self.part:05d}.parquet")
+        self.file_rows = 0
+        return self.file_name
+
+    def _roll(self) -> None:
+        """Close the current payload and start its load job, waiting if parallel loads are running"""
+        if self.writer is None:
+            return
+        self.writer.close()
+        self.writer = None
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.spec.parallel or 4,
+                thread_name_prefix="inbound-bigquery-load",
             )
-
+        while len(self.loads) >= (self.spec.parallel or 4):
+            self._collect()
+
+        file_name, rows = self.file_name, self.file_rows
+        future = self.executor.submit(self.load_from_filename, file_name, rows)
+        self.loads.append((file_name, future))
+        self.part += 1
+        self.file_name = None
+
+    def load_from_filename(self, file_name: str, rows: int = None) -> JobResult:
+        """Load a Parquet file into the temp table and wait for the load job"""
+        job_res = JobResult(
+            result="NO RUN",
+            task_name=f"load {self.temp_table}",
+            start_date_time=datetime.now(),
+            rows=rows,
+            size=os.stat(file_name).st_size,
+        )
+        job_config = bigquery.LoadJobConfig(
+            schema=self.spec.table_schema,
+            source_format=bigquery.SourceFormat.PARQUET,
+            write_disposition="WRITE_APPEND",
+        )
+        try:
+            with open(file_name, "rb") as source:
+                job = self.client.load_table_from_file(
+                    source, self.temp_table, job_config=job_config
+                )
+            job.result()
+            job_res.result = "DONE"
         except Exception as e:
-            LOGGER.debug(
-                f"Error writing dataframe chunk {chunk_number} to {temp_table} in BigQuery. {str(e)}"
+            LOGGER.error(f"Error loading {file_name} to {self.temp_table}. {e}")
+            job_res.result = "FAILED"
+        job_res.end_date_time = datetime.now()
+        return job_res
+
+    def _collect(self) -> JobResult:
+        """Wait for the oldest load job and remove its file"""
+        file_name, future = self.loads.popleft()
+        try:
+            load_res = future.result()
+        finally:
+            os.remove(file_name)
+        load_res.log()
+        self.load_results.append(load_res)
+        return load_res
+
+    def finish(self, job_id: str = None) -> Optional[JobResult]:
+        """Load the last payload, wait for all load jobs and swap the temp table into place"""
+        if not self.started:
+            return None
+
+        job_res = JobResult(
+            result="NO RUN",
+            job_id=job_id,
+            task_name=f"load to bigquery",
+            start_date_time=datetime.now(),
+        )
+        try:
+            self._roll()
+            while self.loads:
+                self._collect()
+
+            job_res.batches = self.load_results
+            job_res.rows = sum(res.rows for res in self.load_results)
+            job_res.size = sum(max(0, res.size) for res in self.load_results)
+            if self.load_results:
+                job_res.start_date_time = min(
+                    res.start_date_time for res in self.load_results
+                )
+            if all(res.success for res in self.load_results):
+                self._swap()
+                job_res.result = "DONE"
+            else:
+                LOGGER.error(
+                    f"Load jobs failed, {self.spec.table} is unchanged and {self.temp_table} is kept"
+                )
+                job_res.result = "FAILED"
+        except Exception as e:
+            LOGGER.error(f"Error loading to {self.spec.table} in BigQuery. {e}")
+            job_res.result = "FAILED"
+        finally:
+            job_res.end_date_time = datetime.now()
+            job_res.memory = tracemalloc.get_traced_memory()
+            self._reset()
+
+        seconds = max(job_res.duration_seconds, 1e-9)
+        LOGGER.info(
+            f"Loaded {len(job_res.batches)} files, {job_res.size} bytes in {round(seconds, 2)} seconds ({round(job_res.size / seconds / 2**20, 2)} MB/s)"
+        )
+        return job_res
+
+    def _swap(self) -> None:
+        """Replace or append to the table with the temp table in one copy job"""
+        job_config = bigquery.CopyJobConfig(
+            write_disposition="WRITE_TRUNCATE" if self.replace else "WRITE_APPEND"
+        )
+        if self.load_results:
+            LOGGER.info(
+                f"Copy {self.temp_table} to {self.spec.table} with {job_config.write_disposition}"
             )
-            return "DONE", JobResult("FAILED")
+            self.client.copy_table(
+                self.temp_table, self.spec.table, job_config=job_config
+            ).result()
+        self.client.delete_table(self.temp_table, not_found_ok=True)
+
+    def _reset(self) -> None:
+        for file_name, future in self.loads:
+            future.cancel()
+        if self.writer is not None:
+            self.writer.close()
+        if self.temp_dir is not None:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+        self.writer = None
+        self.file_name = None
+        self.file_rows = 0
+        self.temp_dir = None
+        self.loads = collections.deque()
+        self.load_results = []
+        self.part = 0
+        self.started = False
+        self.replace = False
 
     def drop(self, table: str) -> JobResult:
         """Drop table in database
@@ -198,7 +537,8 @@ def _create_engine(config: Spec):  # noqa: C901
     LOGGER.info(f"Error creating bigquery sqlalchemy engine")
 
 
-def _bigquery_get_client(config: Spec):
+def _bigquery_get_credentials(config: Spec) -> Any:
+    """Service account credentials from the keyfile or the client email and private key"""
     keyfile = config.keyfile
     project_id = config.project_id
     client_email = config.client_email
@@ -207,7 +547,7 @@ def _bigquery_get_client(config: Spec):
     if os.path.exists(keyfile):
         try:
             credentials = service_account.Credentials.from_service_account_file(keyfile)
-            return bigquery.Client(credentials=credentials, project=project_id)
+            return credentials
         except Exception as e:
             LOGGER.debug(
                 f"Error creating bigquery client from credentials file {str(keyfile)}. {str(e)}"
@@ -222,7 +562,7 @@ def _bigquery_get_client(config: Spec):
                 credentials = service_account.Credentials.from_service_account_info(
                     account_info
                 )
-                return bigquery.Client(credentials=credentials, project=project_id)
+                return credentials
         except:
             pass
 
@@ -232,7 +572,7 @@ def _bigquery_get_client(config: Spec):
             credentials = service_account.Credentials.from_service_account_info(
                 account_info
             )
-            return bigquery.Client(credentials=credentials, project=project_id)
+            return credentials
         except Exception as e:
             LOGGER.info(f"Error creating BigQuery client from credentials. {str(e)}")
             pass
@@ -248,8 +588,14 @@ def _bigquery_get_client(config: Spec):
             credentials = service_account.Credentials.from_service_account_info(
                 account_info
             )
-            return bigquery.Client(credentials=credentials, project=project_id)
+            return credentials
         except Exception as e:
             LOGGER.info(
                 f"Error creating BigQuery client from client email and private key. {str(e)}"
             )
+
+
+def _bigquery_get_client(config: Spec, credentials: Any) -> Optional[bigquery.Client]:
+    if credentials is None:
+        return None
+    return bigquery.Client(credentials=credentials, project=config.project_id)
@@ -2,14 +2,15 @@ import os
 import tempfile
 from abc import ABC, abstractmethod
 from pathlib import Path
-from typing import Any, Iterator, Protocol, Tuple, runtime_checkable
+from typing import Any, Iterator, Optional, Protocol, Tuple, runtime_checkable
 
 import pandas
+import pyarrow
 from google.cloud.bigquery.table import Any
 
 from inbound.core.job_result import JobResult
 from inbound.core.logging import LOGGER
-from inbound.core.models import Profile, Spec
+from inbound.core.models import Bookmark, Profile, Spec
 
 
 class BaseConnection(ABC):
@@ -25,6 +26,9 @@ class BaseConnection(ABC):
             else:
                 self.profile.name = name
 
+        # set by the job in incremental mode
+        self.bookmark: Optional[Bookmark] = None
+
         # set transformer if specified
         if self.profile.spec.transformer is not None:
             self.profile.spec.transformer = self._get_full_path(
@@ -49,6 +53,58 @@ class BaseConnection(ABC):
     def drop(self) -> JobResult:
         pass
 
+    def finish(self, job_id: str = None) -> Optional[JobResult]:
+        """Complete writes buffered by from_pandas/from_arrow at the end of a job"""
+        return None
+
+    def supports_to_arrow(self) -> bool:
+        """True if the connection can read Arrow record batches with to_arrow"""
+        return False
+
+    def supports_from_arrow(self) -> bool:
+        """True if the connection can write Arrow record batches with from_arrow"""
+        return False
+
+    def to_arrow(
+        self, job_id: str = None
+    ) -> Iterator[Tuple[pyarrow.RecordBatch, JobResult]]:
+        raise NotImplementedError
+
+    def from_arrow(
+        self,
+        batch: pyarrow.RecordBatch,
+        job_id: str = None,
+        chunk_number: int = 0,
+        mode: str = "append",
+    ) -> Tuple[Any, JobResult]:
+        raise NotImplementedError
+
+    def supports_to_files(self) -> bool:
+        """True if the connection can hand over its data as local files with to_files"""
+        return False
+
+    def supports_from_files(self) -> bool:
+        """True if the connection can load local files itself with from_file"""
+        return False
+
+    def to_files(self, job_id: str = None) -> Iterator[Tuple[str, dict, JobResult]]:
+        """Local files with the data as (path, options, JobResult).
+
+        Options hold the "format" (csv or parquet) and, for csv, "sep" and
+        "header". Files may be deleted once the next file is requested.
+        """
+        raise NotImplementedError
+
+    def from_file(
+        self,
+        path: str,
+        options: dict,
+        job_id: str = None,
+        chunk_number: int = 0,
+        mode: str = "append",
+    ) -> Tuple[Any, JobResult]:
+        raise NotImplementedError
+
     def to_temp_file(self, format: str = "csv") -> Tuple[str, JobResult]:
         for df in self.to_pandas:
             temp_file_name = tempfile.mktemp()
@@ -58,6 +114,10 @@ class BaseConnection(ABC):
                 df.to_parquet(temp_file_name)
             yield temp_file_name, JobResult(result="DONE", rows=len(df))
 
+    @property
+    def spec(self) -> Spec:
+        return self.profile.spec
+
     @property
     def name(self) -> Spec:
         return self.profile.name or self.profile.type
@@ -69,6 +129,17 @@ class BaseConnection(ABC):
     def __str__(self) -> str:
         return self.profile.name or self.profile.type
 
+    def _bookmark_query(self, query: str, placeholder: str) -> str:
+        """Restrict query to rows after the bookmark in incremental mode"""
+        if self._bookmark_params() is None:
+            return query
+        return f"SELECT * FROM ({query}) bookmark_query WHERE {self.bookmark.column} > {placeholder}"
+
+    def _bookmark_params(self) -> Optional[dict]:
+        if self.bookmark is None or self.bookmark.last_value is None:
+            return None
+        return {"last_value": self.bookmark.last_value}
+
     def _get_full_path(self, path: str) -> str:
         if path is not None:
             if Path(path).is_absolute():
@@ -5,12 +5,14 @@ import tempfile
 import time
 import tracemalloc
 from pathlib import Path
-from typing import Any, Iterator, Tuple
+from typing import Any, Iterator, Optional, Tuple, Union
 
 import duckdb
 import pandas
+import pyarrow
 
 from inbound.core import JobResult, Profile, connection_factory, logging
+from inbound.core.chunk_metrics import frame_size
 from inbound.core.models import SyncMode
 from inbound.plugins.common import retry_with_backoff
 from inbound.plugins.connections.connection import BaseConnection
@@ -26,12 +28,18 @@ class DuckDBConnection(BaseConnection):
         self.database = profile.spec.database or ":memory:"
         self.connection = None
         self.bucket_name = profile.spec.bucket
+        # chunks waiting to be inserted, see accumulate_chunks
+        self.buffer = []
+        self.replace = False
 
     def __enter__(self):
         self.connection = self.get_connection()
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
+        # insert chunks buffered outside of Job.run
+        if self.buffer and exc_type is None:
+            self.finish()
         if self.connection:
             self.connection.close()
 
@@ -56,47 +64,60 @@ class DuckDBConnection(BaseConnection):
         except Exception:
             raise
 
-    def to_pandas(
+    def supports_to_arrow(self) -> bool:
+        return True
+
+    def supports_from_arrow(self) -> bool:
+        return True
+
+    def to_arrow(
         self, job_id: str = None
-    ) -> Iterator[Tuple[pandas.DataFrame, JobResult]]:
+    ) -> Iterator[Tuple[pyarrow.RecordBatch, JobResult]]:
         query = self.profile.spec.query or f"SELECT * FROM {self.profile.spec.table}"
         chunk_size = self.profile.spec.chunksize
-        df = pandas.DataFrame()
 
         job_res = JobResult(
-            result="NOT RUN", job_id=job_id, task_name=f"duckbd to pandas"
+            result="NOT RUN", job_id=job_id, task_name=f"duckbd to arrow"
         )
 
         if not query:
             raise ValueError("Please provide an SQL query string or table name.")
 
         chunk_number = 0
-        total_rows = 0
         try:
-            batch_reader = self.connection.execute(query).fetch_record_batch(
-                chunk_size=chunk_size
-            )
+            params = self._bookmark_params()
+            query = self._bookmark_query(query, "?")
+            parameters = list(params.values()) if params else []
+            batch_reader = self.connection.execute(
+                query, parameters
+            ).fetch_record_batch(chunk_size=chunk_size)
             while True:
                 job_res.start_date_time = datetime.datetime.now()
                 try:
-                    df = batch_reader.read_next_batch().to_pandas()
-                    row_count = len(df)
+                    batch = batch_reader.read_next_batch()
                     job_res.result = "DONE"
                     job_res.end_date_time = datetime.datetime.now()
                     job_res.memory = tracemalloc.get_traced_memory()
-                    job_res.size = df.memory_usage(deep=True).sum()
-                    job_res.rows = len(df)
+                    job_res.size = batch.nbytes
+                    job_res.rows = batch.num_rows
                     job_res.chunk_number = chunk_number
                     chunk_number += 1
-                    total_rows += row_count
-                    yield df, job_res
+                    yield batch, job_res
                 except StopIteration:
                     break
         except Exception as e:
-            job_res.result = "FAILED"
+            LOGGER.error(f"Error reading from duckdb. {e}")
+            raise
+
+    def to_pandas(
+        self, job_id: str = None
+    ) -> Iterator[Tuple[pandas.DataFrame, JobResult]]:
+        for batch, job_res in self.to_arrow(job_id):
+            df = batch.to_pandas()
+            job_res.task_name = "duckbd to pandas"
             job_res.end_date_time = datetime.datetime.now()
-            job_res.memory = tracemalloc.get_traced_memory()
-            return None, job_res
+            job_res.size = frame_size(df)
+            yield df, job_res
 
     def to_dir(self, format: str = "csv") -> Tuple[str, JobResult]:
         query = self.profile.spec.query or f"SELECT * FROM {self.profile.spec.table}"
@@ -134,62 +155,231 @@ class DuckDBConnection(BaseConnection):
         chunk_number: int = 0,
         mode: str = "append",
     ) -> Tuple[Any, JobResult]:
-        mode = (
-            SyncMode.REPLACE
-            if (chunk_number == 0 and mode == "replace")
-            else SyncMode.APPEND
-        )
-
-        table = self.profile.spec.table
-
         job_res = JobResult(
             result="NOT RUN",
             job_id=job_id,
             task_name=f"pandas to duckbd",
-            size=df.memory_usage(deep=True).sum(),
+            size=frame_size(df),
             rows=len(df),
             start_date_time=datetime.datetime.now(),
             chunk_number=chunk_number,
         )
+        return self._write(df, chunk_number, mode, job_res)
+
+    def from_arrow(
+        self,
+        batch: pyarrow.RecordBatch,
+        job_id: str = None,
+        chunk_number: int = 0,
+        mode: str = "append",
+    ) -> Tuple[Any, JobResult]:
+        job_res = JobResult(
+            result="NOT RUN",
+            job_id=job_id,
+            task_name=f"arrow to duckbd",
+            size=batch.nbytes,
+            rows=batch.num_rows,
+            start_date_time=datetime.datetime.now(),
+            chunk_number=chunk_number,
+        )
+        return self._write(
+            pyarrow.Table.from_batches([batch]), chunk_number, mode, job_res
+        )
+
+    def _write(
+        self,
+        data: Union[pandas.DataFrame, pyarrow.Table],
+        chunk_number: int,
+        mode: str,
+        job_res: JobResult,
+    ) -> Tuple[Any, JobResult]:
+        """Insert chunk, or buffer it until accumulate_chunks chunks are collected"""
+        table = self.profile.spec.table
+
+        try:
+            if chunk_number == 0 and mode == "replace":
+                self._insert()
+                self.replace = True
+            self.buffer.append(data)
+            if len(self.buffer) >= (self.profile.spec.accumulate_chunks or 1):
+                self._insert()
+
+            job_res.memory = tracemalloc.get_traced_memory()
+            job_res.end_date_time = datetime.datetime.now()
+            job_res.result = "DONE"
+            return self.name, job_res
+        except Exception as e:
+            LOGGER.error(
+                f"Error writing chunk {chunk_number} to duckdb table {table}. {e}"
+            )
+            job_res.exception = str(e)
+            job_res.memory = tracemalloc.get_traced_memory()
+            job_res.end_date_time = datetime.datetime.now()
+            job_res.result = "FAILED"
+            return self.name, job_res
+
+    def _insert(self) -> int:
+        """Insert buffered chunks with INSERT INTO ... SELECT in one transaction.
+
+        Chunks are registered as a view, so DuckDB scans the dataframe or Arrow
+        table directly without copying rows through Python.
+        """
+        if not self.buffer:
+            return 0
+
+        chunks, self.buffer = self.buffer, []
+        replace, self.replace = self.replace, False
+
+        if len(chunks) == 1:
+            data = chunks[0]
+        elif all(isinstance(chunk, pandas.DataFrame) for chunk in chunks):
+            data = pandas.concat(chunks, ignore_index=True)
+        else:
+            data = pyarrow.concat_tables(
+                [
+                    pyarrow.Table.from_pandas(chunk, preserve_index=False)
+                    if isinstance(chunk, pandas.DataFrame)
+                    else chunk
+                    for chunk in chunks
+                ]
+            )
 
+        view = "inbound_chunks"
+        self.connection.register(view, data)
         try:
-            if mode == SyncMode.REPLACE:
-                self.drop(table)
-                self.connection.execute(f"CREATE TABLE {table} AS SELECT * from df")
+            self._insert_from(f"SELECT * FROM {view}", replace)
+        finally:
+            self.connection.unregister(view)
+
+        return len(data)
+
+    def _insert_from(self, select: str, replace: bool = False) -> int:
+        """Insert the rows of a select statement in one transaction"""
+        table = self.profile.spec.table
+        try:
+            self.connection.begin()
+            if replace:
+                self.connection.execute(f"DROP TABLE IF EXISTS {table}")
+                rows = self.connection.execute(
+                    f"CREATE TABLE {table} AS {select}"
+                ).fetchone()[0]
             else:
                 self.connection.execute(
-                    f"CREATE TABLE IF NOT EXISTS {table} AS SELECT * from df"
+                    f"CREATE TABLE IF NOT EXISTS {table} AS {select} LIMIT 0"
                 )
+                rows = self.connection.execute(
+                    f"INSERT INTO {table} {select}"
+                ).fetchone()[0]
+            self.connection.commit()
+            return rows
+        except Exception:
+            self.connection.rollback()
+            raise
+
+    def supports_from_files(self) -> bool:
+        return True
+
+    def from_file(
+        self,
+        path: str,
+        options: dict,
+        job_id: str = None,
+        chunk_number: int = 0,
+        mode: str = "append",
+    ) -> Tuple[Any, JobResult]:
+        """Load a csv or parquet file with DuckDB's own multi-threaded readers"""
+        table = self.profile.spec.table
 
+        job_res = JobResult(
+            result="NOT RUN",
+            job_id=job_id,
+            task_name=f"file to duckbd",
+            size=os.stat(path).st_size,
+            start_date_time=datetime.datetime.now(),
+            chunk_number=chunk_number,
+        )
+
+        try:
+            # insert chunks buffered before the file
+            self._insert()
+            job_res.rows = self._insert_from(
+                f"SELECT * FROM {_scan(path, options)}",
+                replace=chunk_number == 0 and mode == "replace",
+            )
             job_res.memory = tracemalloc.get_traced_memory()
             job_res.end_date_time = datetime.datetime.now()
             job_res.result = "DONE"
             return self.name, job_res
         except Exception as e:
+            LOGGER.error(f"Error loading file {path} to duckdb table {table}. {e}")
             job_res.memory = tracemalloc.get_traced_memory()
             job_res.end_date_time = datetime.datetime.now()
             job_res.result = "FAILED"
             return self.name, job_res
 
-    def from_parquet(self, file_name: str, mode: SyncMode) -> JobResult:
-        table = self.profile.spec.table
+    def scan_file(
+        self, path: str, options: dict, chunk_size: int = None, job_id: str = None
+    ) -> Iterator[Tuple[pyarrow.RecordBatch, JobResult]]:
+        """Read a csv or parquet file with DuckDB as Arrow record batches.
 
+        Runs on a separate cursor, so chunks can be inserted while reading.
+        """
+        cursor = self.connection.cursor()
         try:
-            if mode == SyncMode.REPLACE:
-                self.drop(table)
-                self.connection.execute(
-                    f"CREATE TABLE {table} AS SELECT * FROM read_parquet({file_name})"
+            batch_reader = cursor.execute(
+                f"SELECT * FROM {_scan(path, options)}"
+            ).fetch_record_batch(chunk_size=chunk_size or 10000)
+            chunk_start_date_time = datetime.datetime.now()
+            for chunk_number, batch in enumerate(batch_reader):
+                job_res = JobResult(
+                    result="DONE",
+                    job_id=job_id,
+                    task_name=f"duckdb scan of {Path(path).name}",
+                    start_date_time=chunk_start_date_time,
+                    end_date_time=datetime.datetime.now(),
+                    memory=tracemalloc.get_traced_memory(),
+                    chunk_number=chunk_number,
+                    size=batch.nbytes,
+                    rows=batch.num_rows,
                 )
-            else:
-                self.connection.execute(
-                    f"INSERT INTO {table} SELECT * FROM read_parquet({file_name})"
-                )
-            return JobResult(result="DONE")
+                chunk_start_date_time = datetime.datetime.now()
+                yield batch, job_res
+        finally:
+            cursor.close()
+
+    def finish(self, job_id: str = None) -> Optional[JobResult]:
+        """Insert chunks still buffered with accumulate_chunks"""
+        if not self.buffer:
+            return None
+
+        job_res = JobResult(
+            result="NOT RUN",
+            job_id=job_id,
+            task_name=f"insert buffered chunks to duckbd",
+            start_date_time=datetime.datetime.now(),
+        )
+        try:
+            job_res.rows = self._insert()
+            job_res.result = "DONE"
         except Exception as e:
-            LOGGER.info(
-                f"Error writing parquet file {file_name} to table {table} in SQL database {self.name}. {str(e)}"
+            LOGGER.error(
+                f"Error inserting buffered chunks to duckdb table {self.profile.spec.table}. {e}"
             )
-            return JobResult()
+            job_res.result = "FAILED"
+        job_res.memory = tracemalloc.get_traced_memory()
+        job_res.end_date_time = datetime.datetime.now()
+        return job_res
+
+    def from_parquet(self, file_name: str, mode: SyncMode) -> JobResult:
+        _, job_res = self.from_file(
+            file_name,
+            {"format": "parquet"},
+            mode="replace" if mode == SyncMode.REPLACE else "append",
+        )
+        return job_res
+
+    def execute(self, sql: str):
+        return self.connection.execute(sql)
 
     def drop(self, table_name: str) -> JobResult():
         try:
@@ -202,6 +392,23 @@ class DuckDBConnection(BaseConnection):
             return JobResult()
 
 
+def _literal(value: str) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _scan(path: str, options: dict) -> str:
+    """DuckDB table function reading a file"""
+    if options.get("format") == "parquet":
+        return f"read_parquet({_literal(path)})"
+
+    arguments = [_literal(path)]
+    if options.get("sep") is not None:
+        arguments.append(f"delim={_literal(options['sep'])}")
+    if options.get("header") is not None:
+        arguments.append(f"header={str(bool(options['header'])).lower()}")
+    return f"read_csv_auto({', '.join(arguments)})"
+
+
 def register() -> None:
     """Register connector"""
     connection_factory.register("duckdb", DuckDBConnection)
@@ -2,28 +2,59 @@ import datetime
 import os
 import tracemalloc
 from pathlib import Path
-from typing import Any, Iterator, Tuple
+from typing import Any, Iterator, List, Optional, Tuple
 
 import openpyxl as xl
 import pandas
+import pyarrow
+import pyarrow.ipc
+import pyarrow.parquet
 
 from inbound.core import JobResult, Profile, connection_factory
+from inbound.core.chunk_metrics import frame_size
 from inbound.core.logging import LOGGER
 from inbound.core.models import SyncMode
 from inbound.plugins.connections.connection import BaseConnection
 
+# file formats by extension, csv if not listed
+FORMATS = {
+    ".parquet": "parquet",
+    ".pq": "parquet",
+    ".arrow": "ipc",
+    ".feather": "ipc",
+    ".ipc": "ipc",
+    ".ndjson": "ndjson",
+    ".jsonl": "ndjson",
+    ".xls": "excel",
+    ".xlsx": "excel",
+    ".csv": "csv",
+}
+EXTENSIONS = {
+    "parquet": ".parquet",
+    "ipc": ".arrow",
+    "ndjson": ".ndjson",
+    "excel": ".xlsx",
+    "csv": ".csv",
+}
+ARROW_FORMATS = ["parquet", "ipc"]
 
-def _isExcel(path: str = None):
+
+def _file_format(path: str = None, default: str = "csv") -> str:
     if not path:
-        return False
-    try:
-        _, file_extension = os.path.splitext(path)
-        return file_extension in [".xls", ".xlsx"]
-    except:
-        return False
+        return default
+    _, file_extension = os.path.splitext(str(path).rstrip("/"))
+    return FORMATS.get(file_extension.lower(), default)
 
 
 class FileConnection(BaseConnection):
+    """Files in csv, Excel, Parquet, Arrow IPC (Feather) or newline delimited JSON.
+
+    The format follows the extension of `path`, or `type` if the extension is
+    unknown. `path` may be a directory (existing or ending with "/"): all files
+    of the format in it are read, and each session writes a new part file, so
+    appends never rewrite existing data.
+    """
+
     def __init__(self, profile: Profile):
         super().__init__(profile, __file__)
 
@@ -33,6 +64,16 @@ class FileConnection(BaseConnection):
         self.sep = self.profile.spec.sep or ";"
         self.sheet_name = self.profile.spec.sheet_name or 0
         self.header = self.profile.spec.header or 0
+        default = (
+            self.profile.spec.type if self.profile.spec.type in EXTENSIONS else "csv"
+        )
+        self.format = _file_format(self.profile.spec.path, default)
+        # open parquet or ipc writer and the file written in this session
+        self.writer = None
+        self.part = None
+        # write-only Excel workbook, saved at the end of the session
+        self.workbook = None
+        self.worksheet = None
 
     def __enter__(self):
         if self.profile.spec.url is not None:
@@ -48,11 +89,50 @@ class FileConnection(BaseConnection):
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        pass
+        if self.workbook is not None and exc_type is None:
+            self._save_excel()
+        self.workbook = None
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        self.part = None
 
     def __str__(self) -> str:
         return self.name
 
+    def _is_dir(self) -> bool:
+        return self.profile.spec.url is None and (
+            Path(self.path).is_dir() or str(self.profile.spec.path).endswith("/")
+        )
+
+    def _files(self) -> List[str]:
+        """Files to read: path, or the files of the format in directory path"""
+        if not self._is_dir():
+            return [self.path]
+        if not Path(self.path).is_dir():
+            return []
+        return sorted(
+            str(path)
+            for path in Path(self.path).iterdir()
+            if path.is_file() and _file_format(path, None) == self.format
+        )
+
+    def _target(self, mode: SyncMode) -> str:
+        """File to write. A directory gets one new part file per session"""
+        if not self._is_dir():
+            return self.path
+
+        if self.part is None:
+            if mode == SyncMode.REPLACE:
+                for file_name in self._files():
+                    os.remove(file_name)
+            Path(self.path).mkdir(parents=True, exist_ok=True)
+            self.part = str(
+                Path(self.path)
+                / f"part-{datetime.datetime.now().strftime('%Y%m%dT%H%M%S')}-{os.urandom(4).hex()}{EXTENSIONS[self.format]}"
+            )
+        return self.part
+
     def to_pandas(
         self, job_id: str = None
     ) -> Iterator[Tuple[pandas.DataFrame, JobResult]]:
@@ -64,47 +144,61 @@ class FileConnection(BaseConnection):
             task_name=f"file to pandas",
         )
         chunk_number = 0
+        chunk_start_date_time = datetime.datetime.now()
 
         try:
-            if _isExcel(self.path):
-                df = pandas.read_excel(
-                    self.path,
-                    sheet_name=self.sheet_name,
-                    header=self.header,
-                )
-                job_res.end_date_time = datetime.datetime.now()
-                job_res.memory = tracemalloc.get_traced_memory()
-                yield df, job_res
-            else:  # default to csv
-                file_reader = pandas.read_csv(
-                    self.path,
-                    sep=self.sep,
-                    chunksize=self.chunk_size,
-                    encoding=self.encoding,
-                    index_col=False,
-                )
-
-                total_length = 0
-                chunk_start_date_time = datetime.datetime.now()
-                for chunk in file_reader:
+            if self.format in ARROW_FORMATS:
+                for batch, job_res in self.to_arrow(job_id):
+                    df = batch.to_pandas()
+                    job_res.task_name = "file to pandas"
+                    job_res.size = frame_size(df)
+                    yield df, job_res
+            elif self.format == "excel":
+                for chunk in self._read_excel():
                     job_res.result = "DONE"
                     job_res.start_date_time = chunk_start_date_time
                     job_res.end_date_time = datetime.datetime.now()
                     job_res.memory = tracemalloc.get_traced_memory()
                     job_res.chunk_number = chunk_number
-                    job_res.size = chunk.memory_usage(deep=True).sum()
+                    job_res.size = frame_size(chunk)
                     job_res.rows = len(chunk)
                     chunk_number += 1
                     chunk_start_date_time = datetime.datetime.now()
                     yield chunk, job_res
+            else:
+                for file_name in self._files():
+                    if self.format == "ndjson":
+                        file_reader = pandas.read_json(
+                            file_name,
+                            lines=True,
+                            chunksize=self.chunk_size,
+                            encoding=self.encoding,
+                        )
+                    else:  # default to csv
+                        file_reader = pandas.read_csv(
+                            file_name,
+                            sep=self.sep,
+                            chunksize=self.chunk_size,
+                            encoding=self.encoding,
+                            index_col=False,
+                        )
+
+                    with file_reader:
+                        for chunk in file_reader:
+                            job_res.result = "DONE"
+                            job_res.start_date_time = chunk_start_date_time
+                            job_res.end_date_time = datetime.datetime.now()
+                            job_res.memory = tracemalloc.get_traced_memory()
+                            job_res.chunk_number = chunk_number
+                            job_res.size = frame_size(chunk)
+                            job_res.rows = len(chunk)
+                            chunk_number += 1
+                            chunk_start_date_time = datetime.datetime.now()
+                            yield chunk, job_res
 
         except Exception as e:
-            job_res.result = "FAILED"
-            job_res.start_date_time = chunk_start_date_time
-            job_res.end_date_time = datetime.datetime.now()
-            job_res.memory = tracemalloc.get_traced_memory()
-            job_res.chunk_number = chunk_number
-            return pandas.DataFrame, job_res
+            LOGGER.error(f"Error reading file {self.path}. {e}")
+            raise
 
     def from_pandas(
         self,
@@ -126,67 +220,351 @@ class FileConnection(BaseConnection):
             start_date_time=datetime.datetime.now(),
             chunk_number=chunk_number,
             task_name=f"Persist chunk number {chunk_number}",
-            size=df.memory_usage(deep=True).sum(),
+            size=frame_size(df),
             rows=len(df),
         )
 
         try:
-            if mode == SyncMode.REPLACE:
-                if _isExcel(self.path):
-                    df.to_excel(self.path, sheet_name=self.sheet_name, index=False)
-                else:
-                    df.to_csv(
-                        self.path,
-                        sep=self.sep,
-                        encoding=self.encoding,
-                        index=False,
-                    )
+            if self.format in ARROW_FORMATS:
+                self._write_arrow(
+                    pyarrow.Table.from_pandas(df, preserve_index=False), mode
+                )
+            elif self.format == "ndjson":
+                self._write_ndjson(df, mode)
+            elif self.format == "excel":
+                self._write_excel(df, mode)
+            elif mode == SyncMode.REPLACE:
+                df.to_csv(
+                    self._target(mode),
+                    sep=self.sep,
+                    encoding=self.encoding,
+                    index=False,
+                )
             else:  # append mode
-                header = True
-                mode = "w"
-                row = 0
-                if Path(self.path).is_file():
-                    header = False
-                    mode = "a"
-
-                if _isExcel(self.path):
-                    with pandas.ExcelWriter(
-                        self.path, mode=mode, if_sheet_exists="overlay"
-                    ) as writer:
-                        df.to_excel(
-                            writer,
-                            index=False,
-                            sheet_name=self.sheet_name,
-                            header=header,
-                        )
-                else:
-                    df.to_csv(
-                        self.path,
-                        sep=self.sep,
-                        encoding=self.encoding,
-                        mode="a",
-                        header=header,
-                        index=False,
-                    )
+                target = self._target(mode)
+                df.to_csv(
+                    target,
+                    sep=self.sep,
+                    encoding=self.encoding,
+                    mode="a",
+                    header=not Path(target).is_file(),
+                    index=False,
+                )
+
+            job_res.result = "DONE"
+            job_res.memory = tracemalloc.get_traced_memory()
+            job_res.end_date_time = datetime.datetime.now()
+            return "DONE", job_res
+        except Exception as e:
+            LOGGER.error(f"Error writing to file {self.path}. {e}")
+            job_res.result = "FAILED"
+            job_res.memory = tracemalloc.get_traced_memory()
+            job_res.end_date_time = datetime.datetime.now()
+            return "FAILED", job_res
+
+    def supports_to_arrow(self) -> bool:
+        return self.format in ARROW_FORMATS
+
+    def supports_from_arrow(self) -> bool:
+        return self.format in ARROW_FORMATS
+
+    def to_arrow(
+        self, job_id: str = None
+    ) -> Iterator[Tuple[pyarrow.RecordBatch, JobResult]]:
+
+        job_res = JobResult(
+            result="NO RUN",
+            job_id=job_id,
+            start_date_time=datetime.datetime.now(),
+            task_name=f"file to arrow",
+        )
+
+        chunk_number = 0
+        chunk_start_date_time = datetime.datetime.now()
+        for file_name in self._files():
+            if self.format == "ipc":
+                batches = _ipc_batches(file_name, self.chunk_size)
+            else:
+                batches = pyarrow.parquet.ParquetFile(file_name).iter_batches(
+                    batch_size=self.chunk_size
+                )
+            for batch in batches:
+                job_res.result = "DONE"
+                job_res.start_date_time = chunk_start_date_time
+                job_res.end_date_time = datetime.datetime.now()
+                job_res.memory = tracemalloc.get_traced_memory()
+                job_res.chunk_number = chunk_number
+                job_res.size = batch.nbytes
+                job_res.rows = batch.num_rows
+                chunk_number += 1
+                chunk_start_date_time = datetime.datetime.now()
+                yield batch, job_res
+
+    def supports_to_files(self) -> bool:
+        return (
+            self.profile.spec.url is None
+            and self.profile.spec.path is not None
+            and self.format in ["csv", "parquet"]
+            and self.encoding.lower().replace("-", "") == "utf8"
+            and (self.format == "parquet" or self.header == 0)
+        )
+
+    def to_files(self, job_id: str = None) -> Iterator[Tuple[str, dict, JobResult]]:
+        if self.format == "parquet":
+            options = {"format": "parquet"}
+        else:
+            options = {"format": "csv", "sep": self.sep, "header": True}
+
+        for file_name in self._files():
+            job_res = JobResult(
+                result="DONE",
+                job_id=job_id,
+                start_date_time=datetime.datetime.now(),
+                end_date_time=datetime.datetime.now(),
+                task_name=f"file to file",
+                size=os.stat(file_name).st_size,
+            )
+            yield file_name, options, job_res
+
+    def from_arrow(
+        self,
+        batch: pyarrow.RecordBatch,
+        job_id: str = None,
+        chunk_number: int = 0,
+        mode: str = "append",
+    ) -> Tuple[Any, JobResult]:
+
+        mode = (
+            SyncMode.REPLACE
+            if (chunk_number == 0 and mode == "replace")
+            else SyncMode.APPEND
+        )
 
+        job_res = JobResult(
+            result="NO RUN",
+            job_id=job_id,
+            start_date_time=datetime.datetime.now(),
+            chunk_number=chunk_number,
+            task_name=f"Persist chunk number {chunk_number}",
+            size=batch.nbytes,
+            rows=batch.num_rows,
+        )
+
+        try:
+            self._write_arrow(pyarrow.Table.from_batches([batch]), mode)
             job_res.result = "DONE"
             job_res.memory = tracemalloc.get_traced_memory()
             job_res.end_date_time = datetime.datetime.now()
             return "DONE", job_res
         except Exception as e:
+            LOGGER.error(f"Error writing arrow batch to file {self.path}. {e}")
             job_res.result = "FAILED"
             job_res.memory = tracemalloc.get_traced_memory()
             job_res.end_date_time = datetime.datetime.now()
             return "FAILED", job_res
 
+    def _write_arrow(self, table: pyarrow.Table, mode: SyncMode) -> None:
+        """Write table as parquet row groups or ipc batches to one file per session"""
+        if mode == SyncMode.REPLACE and self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            self.part = None
+
+        if self.writer is None:
+            target = self._target(mode)
+            # a closed parquet or ipc file can not be extended. Write a new part
+            # to a directory path, or copy the existing file to the new one
+            previous = None
+            if mode == SyncMode.APPEND and Path(target).is_file():
+                previous = f"{target}.previous"
+                os.replace(target, previous)
+                table = table.cast(self._schema(previous))
+
+            self.schema = table.schema
+            if self.format == "ipc":
+                self.writer = pyarrow.ipc.new_file(target, table.schema)
+            else:
+                self.writer = pyarrow.parquet.ParquetWriter(target, table.schema)
+
+            if previous is not None:
+                LOGGER.info(
+                    f"Copying {target} to append to it. Use a directory path to append without copying"
+                )
+                for batch in self._batches(previous):
+                    self.writer.write_table(pyarrow.Table.from_batches([batch]))
+                os.remove(previous)
+
+        self.writer.write_table(table.cast(self.schema))
+
+    def _schema(self, file_name: str) -> pyarrow.Schema:
+        if self.format == "ipc":
+            with pyarrow.memory_map(file_name) as source:
+                return pyarrow.ipc.open_file(source).schema
+        return pyarrow.parquet.read_schema(file_name)
+
+    def _batches(self, file_name: str) -> Iterator[pyarrow.RecordBatch]:
+        if self.format == "ipc":
+            return _ipc_batches(file_name, self.chunk_size)
+        return pyarrow.parquet.ParquetFile(file_name).iter_batches(
+            batch_size=self.chunk_size
+        )
+
+    def _write_ndjson(self, df: pandas.DataFrame, mode: SyncMode) -> None:
+        """Append records to the file, one JSON document per line"""
+        target = self._target(mode)
+        lines = df.to_json(orient="records", lines=True, date_format="iso")
+        with open(
+            target,
+            "w" if mode == SyncMode.REPLACE else "a",
+            encoding=self.encoding,
+        ) as ndjson_file:
+            ndjson_file.write(lines)
+            if lines and not lines.endswith("\n"):
+                ndjson_file.write("\n")
+
+    def _sheet_title(self) -> str:
+        return "Sheet1" if self.sheet_name == 0 else str(self.sheet_name)
+
+    def _excel_sheet(self, workbook: xl.Workbook):
+        """Worksheet by name, or by position if sheet_name is a number"""
+        if self._sheet_title() in workbook.sheetnames:
+            return workbook[self._sheet_title()]
+        if str(self.sheet_name).isdigit():
+            return workbook.worksheets[int(self.sheet_name)]
+        raise ValueError(f"Worksheet {self.sheet_name} not found in {self.path}")
+
+    def _read_excel(self) -> Iterator[pandas.DataFrame]:
+        """Stream rows of the worksheet in chunks with openpyxl in read-only mode"""
+        if self.path.lower().endswith(".xls"):
+            # openpyxl reads xlsx only
+            df = pandas.read_excel(
+                self.path, sheet_name=self.sheet_name, header=self.header
+            )
+            for offset in range(0, len(df), self.chunk_size):
+                yield df.iloc[offset : offset + self.chunk_size]
+            return
+
+        self._save_excel()
+        workbook = xl.load_workbook(self.path, read_only=True, data_only=True)
+        try:
+            rows = self._excel_sheet(workbook).iter_rows(values_only=True)
+            for _ in range(self.header):
+                next(rows, None)
+            header = next(rows, None)
+            if header is None:
+                return
+
+            columns = [
+                f"Unnamed: {index}" if name is None else str(name)
+                for index, name in enumerate(header)
+            ]
+            width = len(columns)
+            chunk = []
+            for row in rows:
+                if all(value is None for value in row):
+                    continue
+                if len(row) != width:
+                    row = tuple(row[:width]) + (None,) * (width - len(row))
+                chunk.append(row)
+                if len(chunk) == self.chunk_size:
+                    yield pandas.DataFrame.from_records(chunk, columns=columns)
+                    chunk = []
+            if chunk:
+                yield pandas.DataFrame.from_records(chunk, columns=columns)
+        finally:
+            workbook.close()
+
+    def _write_excel(self, df: pandas.DataFrame, mode: SyncMode) -> None:
+        """Append rows to a write-only workbook, saved once by finish or on exit.
+
+        In append mode the existing workbook is copied into it once per session,
+        values only.
+        """
+        if mode == SyncMode.REPLACE or self.workbook is None:
+            self.workbook = xl.Workbook(write_only=True)
+            self.worksheet = None
+            if mode == SyncMode.APPEND and Path(self.path).is_file():
+                self._copy_excel()
+            if self.worksheet is None:
+                self.worksheet = self.workbook.create_sheet(self._sheet_title())
+                self.worksheet.append([str(column) for column in df.columns])
+
+        values = df.astype(object).where(df.notna(), None)
+        for row in values.itertuples(index=False, name=None):
+            self.worksheet.append(row)
+
+    def _copy_excel(self) -> None:
+        # without data_only, formulas are copied instead of their cached values
+        source = xl.load_workbook(self.path, read_only=True)
+        try:
+            for sheet in source.worksheets:
+                worksheet = self.workbook.create_sheet(sheet.title)
+                for row in sheet.iter_rows(values_only=True):
+                    worksheet.append(row)
+                if sheet.title == self._sheet_title():
+                    self.worksheet = worksheet
+        finally:
+            source.close()
+
+    def _save_excel(self) -> None:
+        if self.workbook is None:
+            return
+        workbook, self.workbook = self.workbook, None
+        # replace atomically, the workbook is only complete after save
+        temp_path = f"{self.path}.tmp"
+        workbook.save(temp_path)
+        os.replace(temp_path, self.path)
+
+    def finish(self, job_id: str = None) -> Optional[JobResult]:
+        """Save the Excel workbook written by from_pandas"""
+        if self.workbook is None:
+            return None
+
+        job_res = JobResult(
+            result="NO RUN",
+            job_id=job_id,
+            start_date_time=datetime.datetime.now(),
+            task_name=f"save workbook {Path(self.path).name}",
+        )
+        try:
+            self._save_excel()
+            job_res.size = os.stat(self.path).st_size
+            job_res.result = "DONE"
+        except Exception as e:
+            LOGGER.error(f"Error saving workbook {self.path}. {e}")
+            job_res.result = "FAILED"
+        job_res.memory = tracemalloc.get_traced_memory()
+        job_res.end_date_time = datetime.datetime.now()
+        return job_res
+
     def drop(self) -> JobResult():
         try:
+            # close the write-only workbook before removing the file
+            self._save_excel()
             os.remove(self.path)
             return JobResult(result="DONE")
         except OSError:
             return JobResult(result="FAILED")
 
 
+def _ipc_batches(file_name: str, chunk_size: int) -> Iterator[pyarrow.RecordBatch]:
+    """Record batches of an Arrow IPC file, memory-mapped and sliced to chunk_size"""
+    with pyarrow.memory_map(file_name) as source:
+        try:
+            reader = pyarrow.ipc.open_file(source)
+            batches = (
+                reader.get_batch(index) for index in range(reader.num_record_batches)
+            )
+        except pyarrow.ArrowInvalid:
+            # ipc stream format
+            source.seek(0)
+            batches = pyarrow.ipc.open_stream(source)
+
+        for batch in batches:
+            for offset in range(0, max(batch.num_rows, 1), chunk_size):
+                yield batch.slice(offset, chunk_size)
+
+
 def register() -> None:
     """Register connector"""
     connection_factory.register("file", FileConnection)
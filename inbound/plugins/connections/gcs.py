@@ -1,22 +1,31 @@
+import collections
+import gzip
 import os
-import random
+import re
+import shutil
 import tempfile
-import time
+import tracemalloc
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Iterator, Tuple
+from typing import Any, Iterator, List, Optional, Tuple, Union
 
 import pandas
+import pyarrow
+import pyarrow.parquet
 from google.cloud import storage
 
-from inbound.core import JobResult, Profile, connection_factory, logging
+from inbound.core import JobResult, Profile, connection_factory
+from inbound.core.chunk_metrics import frame_size
 from inbound.core.logging import LOGGER
-from inbound.core.models import SyncMode
 from inbound.plugins.common import retry_with_backoff
 from inbound.plugins.connections.connection import BaseConnection
-from inbound.plugins.connections.file import FileConnection
 
-LOGGER = logging.LOGGER
+# target size of uploaded files in bytes
+FILE_SIZE = 128 * 2**20
+# resumable uploads send files in chunks of this size
+UPLOAD_CHUNK_SIZE = 8 * 2**20
+UPLOAD_CHUNK_UNIT = 256 * 2**10
 
 
 class GCSConnection(BaseConnection):
@@ -29,6 +38,12 @@ class GCSConnection(BaseConnection):
         self.blob_name = profile.spec.blob or os.urandom(24).hex()
         self.blob_format = profile.spec.format or "parquet"
         self.chunk_size = profile.spec.chunksize or 100000
+        # rolling file and uploads in flight, see from_pandas
+        self.executor = None
+        self.temp_dir = None
+        self.writer = None
+        self.uploads = collections.deque()
+        self._reset()
 
     def __enter__(self):
         try:
@@ -39,7 +54,13 @@ class GCSConnection(BaseConnection):
             LOGGER.info(f"Error connecting to GCS. {str(e)}")
 
     def __exit__(self, exc_type, exc_value, traceback):
-        pass
+        # upload chunks written outside of Job.run
+        if exc_type is None:
+            self.finish()
+        self._reset()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
 
     def __str__(self) -> str:
         return self.name
@@ -65,48 +86,151 @@ class GCSConnection(BaseConnection):
         except Exception as e:
             LOGGER.info(f"Error downloading blob {blob} to file {file_name}. {str(e)}")
 
+    def _blobs(self) -> List[Any]:
+        """Blobs under prefix, or the single blob if no prefix is set"""
+        if self.prefix is None:
+            return [self.bucket.blob(self.spec.blob)]
+        return list(
+            self.client.list_blobs(
+                self.bucket, prefix=f"{self.prefix}/", delimiter="//"
+            )
+        )
+
+    def _downloads(self, blobs: List[Any]) -> Iterator[Tuple[Any, str]]:
+        """Download blobs to temp files, up to prefetch blobs ahead of the reader.
+
+        Yields (blob, file name) in listing order. A file is deleted when the
+        next one is requested.
+        """
+        prefetch = max(1, self.spec.prefetch or 1)
+        with tempfile.TemporaryDirectory() as temp_dir_name:
+
+            def download(index: int, blob: Any) -> str:
+                # keep the extension, readers detect compression from it
+                file_name = str(
+                    Path(temp_dir_name) / f"blob_{index}.{self.blob_format}"
+                )
+                blob.download_to_filename(file_name)
+                return file_name
+
+            with ThreadPoolExecutor(
+                max_workers=prefetch, thread_name_prefix="inbound-gcs"
+            ) as executor:
+                pending = collections.deque()
+                try:
+                    for index, blob in enumerate(blobs):
+                        pending.append((blob, executor.submit(download, index, blob)))
+                        if len(pending) > prefetch:
+                            yield from _downloaded(*pending.popleft())
+                    while pending:
+                        yield from _downloaded(*pending.popleft())
+                finally:
+                    for _, future in pending:
+                        future.cancel()
+
+    def _sources(self) -> Iterator[Tuple[Any, Any]]:
+        """(blob, source) with a temp file name, or a file object with stream_blobs"""
+        blobs = self._blobs()
+        if self.spec.stream_blobs:
+            for blob in blobs:
+                with blob.open("rb") as source:
+                    yield blob, source
+        else:
+            yield from self._downloads(blobs)
+
+    def _read_chunks(
+        self, format: str = None
+    ) -> Iterator[Tuple[Any, Union[pyarrow.RecordBatch, pandas.DataFrame]]]:
+        """Chunks of chunksize rows: parquet row groups or csv chunks per blob"""
+        format = format or self.blob_format
+        for blob, source in self._sources():
+            if format == "parquet":
+                parquet_file = pyarrow.parquet.ParquetFile(source)
+                for batch in parquet_file.iter_batches(batch_size=self.chunk_size):
+                    yield blob, batch
+            else:
+                with pandas.read_csv(
+                    source,
+                    chunksize=self.chunk_size,
+                    compression="gzip" if format == "csv.gz" else "infer",
+                ) as file_reader:
+                    for chunk in file_reader:
+                        yield blob, chunk
+
     def to_pandas(
-        self, job_id: str = None, format: str = "parquet"
+        self, job_id: str = None, format: str = None
     ) -> Iterator[Tuple[pandas.DataFrame, JobResult]]:
+        chunk_start_date_time = datetime.now()
+        for chunk_number, (blob, chunk) in enumerate(self._read_chunks(format)):
+            df = chunk.to_pandas() if isinstance(chunk, pyarrow.RecordBatch) else chunk
+            job_res = JobResult(
+                result="DONE",
+                job_id=job_id,
+                task_name=f"gcs to pandas",
+                start_date_time=chunk_start_date_time,
+                end_date_time=datetime.now(),
+                memory=tracemalloc.get_traced_memory(),
+                chunk_number=chunk_number,
+                rows=len(df),
+                size=frame_size(df),
+            )
+            chunk_start_date_time = datetime.now()
+            yield df, job_res
 
-        for blob in self.client.list_blobs(
-            self.bucket, prefix=f"{self.prefix}/", delimiter="//"
-        ):
-            with tempfile.NamedTemporaryFile() as tf:
-                file_name = tf.name
-                try:
-                    self.download_to_filename(file_name, blob.name)
+    def supports_to_files(self) -> bool:
+        return self.blob_format in ["parquet", "csv", "csv.gz"]
 
-                    # TODO: use dask to read chunkwise
-                    if format == "csv.gz":
-                        df = pandas.read_csv(file_name, compression="gzip")
-                    else:
-                        df = pandas.read_parquet(file_name)
+    def to_files(self, job_id: str = None) -> Iterator[Tuple[str, dict, JobResult]]:
+        """Download blobs to temp files, prefetching the next blobs"""
+        if self.blob_format == "parquet":
+            options = {"format": "parquet"}
+        else:
+            options = {"format": "csv", "sep": ",", "header": True}
 
-                    result = JobResult(result="DONE", job_id=job_id)
-                    LOGGER.info(result)
-                    yield df, result
-                except Exception as e:
-                    LOGGER.error(f"Error {e}")
-                    yield None, JobResult("FAILED", job_id=job_id)
+        start_date_time = datetime.now()
+        for blob, file_name in self._downloads(self._blobs()):
+            result = JobResult(
+                result="DONE",
+                job_id=job_id,
+                task_name=f"gcs to file",
+                start_date_time=start_date_time,
+                end_date_time=datetime.now(),
+                size=os.stat(file_name).st_size,
+            )
+            start_date_time = datetime.now()
+            yield file_name, options, result
 
     def upload_from_filename(
         self, file_name: str, blob_name: str = None
     ) -> Tuple[Any, JobResult]:
+        """Upload a file. Files larger than upload_chunk_size are uploaded resumably in chunks"""
         if blob_name is None:
             blob_name = f"{self.blob_name}.{self.blob_format}"
         if self.prefix is not None:
             blob_name = f"{self.prefix}/{blob_name}"
 
+        job_res = JobResult(
+            result="NO RUN",
+            task_name=f"upload {blob_name}",
+            start_date_time=datetime.now(),
+        )
         try:
-            blob = self.bucket.blob(blob_name)
+            chunk_size = self.spec.upload_chunk_size or UPLOAD_CHUNK_SIZE
+            # chunk size must be a multiple of 256 KiB
+            chunk_size = max(1, chunk_size // UPLOAD_CHUNK_UNIT) * UPLOAD_CHUNK_UNIT
+            blob = self.bucket.blob(blob_name, chunk_size=chunk_size)
             blob.upload_from_filename(file_name)
-            return "DONE", JobResult(result="DONE", size=os.stat(file_name).st_size)
+            job_res.size = os.stat(file_name).st_size
+            job_res.result = "DONE"
+            return "DONE", job_res
         except Exception as e:
             LOGGER.info(
                 f"Error uploading file {file_name} to blob {blob_name}. {str(e)}"
             )
-            return "FAILED", JobResult("FAILED")
+            job_res.result = "FAILED"
+            return "FAILED", job_res
+        finally:
+            job_res.end_date_time = datetime.now()
 
     def from_pandas(
         self,
@@ -115,39 +239,251 @@ class GCSConnection(BaseConnection):
         chunk_number: int = 0,
         mode: str = "append",
     ) -> Tuple[Any, JobResult]:
-        mode = (
-            SyncMode.REPLACE
-            if (chunk_number == 0 and mode == "replace")
-            else SyncMode.APPEND
+        job_res = JobResult(
+            result="NO RUN",
+            job_id=job_id,
+            task_name=f"pandas to gcs",
+            start_date_time=datetime.now(),
+            chunk_number=chunk_number,
+            rows=len(df),
+            size=frame_size(df),
         )
+        return self._write(df, chunk_number, mode, job_res)
 
-        with tempfile.NamedTemporaryFile(suffix=None) as tf:
-            file_name = tf.name
-            blob_name = self.blob_name
-
-            # write dataframe to tempfile
-            try:
-                if mode == SyncMode.REPLACE:
-                    if self.blob_format == "parquet":
-                        df.to_parquet(file_name, index=False)
-                    else:
-                        df.to_csv(file_name, index=False)
-                else:
-                    blob_name = f"{blob_name}_{datetime.utcnow().strftime('%Y_%m_%dT%H_%M_%S%z')}"
-                    if self.blob_format == "parquet":
-                        df.to_parquet(file_name, index=False)
-                    else:
-                        df.to_csv(file_name, index=False)
-                LOGGER.info(
-                    f"Datafram of size {df.memory_usage(index=True).sum()} written to file {file_name}"
-                )
-                self.upload_from_filename(file_name, f"{blob_name}.{self.blob_format}")
-                return blob_name, JobResult(result="DONE")
-            except Exception as e:
-                LOGGER.info(
-                    f"Error writing of size {df.memory_usage(index=True).sum()} to file {file_name}. {str(e)}"
-                )
-                return None, JobResult(result="DONE")
+    def _write(
+        self,
+        data: Union[pandas.DataFrame, pyarrow.Table],
+        chunk_number: int,
+        mode: str,
+        job_res: JobResult,
+    ) -> Tuple[Any, JobResult]:
+        """Add chunk to the rolling file. Full files are uploaded in the background"""
+        try:
+            if chunk_number == 0 and mode == "replace":
+                self.replace = True
+            if self.blob_format == "parquet":
+                self._write_parquet(data)
+            else:
+                self._write_csv(data)
+            self.file_rows += job_res.rows
+
+            if os.stat(self.file_name).st_size >= (self.spec.file_size or FILE_SIZE):
+                self._roll()
+
+            job_res.memory = tracemalloc.get_traced_memory()
+            job_res.end_date_time = datetime.now()
+            job_res.result = "DONE"
+            return self.file_name, job_res
+        except Exception as e:
+            LOGGER.error(f"Error writing chunk {chunk_number} for upload to GCS. {e}")
+            job_res.memory = tracemalloc.get_traced_memory()
+            job_res.end_date_time = datetime.now()
+            job_res.result = "FAILED"
+            return None, job_res
+
+    def _open_file(self) -> str:
+        if self.temp_dir is None:
+            self.temp_dir = tempfile.mkdtemp(prefix="inbound_gcs_")
+        self.file_name = str(
+            Path(self.temp_dir) / f"part_{self.part:05d}.{self.blob_format}"
+        )
+        self.file_rows = 0
+        return self.file_name
+
+    def _write_parquet(self, data: Union[pandas.DataFrame, pyarrow.Table]) -> None:
+        table = (
+            pyarrow.Table.from_pandas(data, preserve_index=False)
+            if isinstance(data, pandas.DataFrame)
+            else data
+        )
+        if self.writer is None:
+            self.writer = pyarrow.parquet.ParquetWriter(
+                self._open_file(),
+                table.schema,
+                compression=self.spec.compression or "snappy",
+            )
+        self.writer.write_table(
+            table.cast(self.writer.schema), row_group_size=self.spec.row_group_size
+        )
+
+    def _write_csv(self, data: Union[pandas.DataFrame, pyarrow.Table]) -> None:
+        df = data.to_pandas() if isinstance(data, pyarrow.Table) else data
+        header = self.writer is None
+        if self.writer is None:
+            file_name = self._open_file()
+            if self.blob_format == "csv.gz":
+                self.writer = gzip.open(file_name, "wt", encoding="utf-8", newline="")
+            else:
+                self.writer = open(file_name, "w", encoding="utf-8", newline="")
+        df.to_csv(self.writer, header=header, index=False)
+        # flush compressed output, the file size decides when to roll
+        self.writer.flush()
+
+    def _blob_name(self, part: int) -> str:
+        """Blob name of a part. A single part keeps the name of a one-file upload"""
+        if self.session is None:
+            self.session = datetime.utcnow().strftime("%Y_%m_%dT%H_%M_%S%z")
+        blob_name = self.blob_name
+        if not self.replace:
+            blob_name = f"{blob_name}_{self.session}"
+        if part > 0:
+            blob_name = f"{blob_name}_{part:05d}"
+        return f"{blob_name}.{self.blob_format}"
+
+    def _roll(self) -> None:
+        """Close the current file and queue its upload, waiting if parallel uploads are running"""
+        if self.writer is None:
+            return
+        self.writer.close()
+        self.writer = None
+
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.spec.parallel or 4,
+                thread_name_prefix="inbound-gcs-upload",
+            )
+        while len(self.uploads) >= (self.spec.parallel or 4):
+            self._collect()
+
+        file_name, rows = self.file_name, self.file_rows
+        future = self.executor.submit(
+            self.upload_from_filename, file_name, self._blob_name(self.part)
+        )
+        self.uploads.append((file_name, rows, future))
+        self.part += 1
+        self.file_name = None
+
+    def _collect(self) -> JobResult:
+        """Wait for the oldest upload and remove its file"""
+        file_name, rows, future = self.uploads.popleft()
+        try:
+            _, upload_res = future.result()
+        finally:
+            os.remove(file_name)
+        upload_res.rows = rows
+        upload_res.log()
+        self.upload_results.append(upload_res)
+        return upload_res
+
+    def finish(self, job_id: str = None) -> Optional[JobResult]:
+        """Upload the last file and wait for all uploads"""
+        if self.writer is None and not self.uploads:
+            return None
+
+        job_res = JobResult(
+            result="NO RUN",
+            job_id=job_id,
+            task_name=f"upload to gcs",
+            start_date_time=datetime.now(),
+        )
+        try:
+            self._roll()
+            while self.uploads:
+                self._collect()
+
+            job_res.batches = self.upload_results
+            job_res.rows = sum(res.rows for res in self.upload_results)
+            job_res.size = sum(max(0, res.size) for res in self.upload_results)
+            job_res.start_date_time = min(
+                res.start_date_time for res in self.upload_results
+            )
+            if all(res.success for res in self.upload_results):
+                if self.replace:
+                    self._delete_stale()
+                job_res.result = "DONE"
+            else:
+                job_res.result = "FAILED"
+        except Exception as e:
+            LOGGER.error(f"Error uploading to GCS bucket {self.bucket_name}. {e}")
+            job_res.result = "FAILED"
+        finally:
+            job_res.end_date_time = datetime.now()
+            job_res.memory = tracemalloc.get_traced_memory()
+            self._reset()
+
+        seconds = max(job_res.duration_seconds, 1e-9)
+        LOGGER.info(
+            f"Uploaded {len(job_res.batches)} files, {job_res.size} bytes in {round(seconds, 2)} seconds ({round(job_res.size / seconds / 2**20, 2)} MB/s)"
+        )
+        return job_res
+
+    def _delete_stale(self) -> None:
+        """Delete blobs of earlier sessions after a replace"""
+        uploaded = {self._full_name(self._blob_name(part)) for part in range(self.part)}
+        name = self._full_name(self.blob_name)
+        # only names this writer produces: blob[_session][_part].format
+        written = re.compile(
+            rf"{re.escape(name)}(_\d{{4}}_\d{{2}}_\d{{2}}T\d{{2}}_\d{{2}}_\d{{2}})?(_\d{{5}})?{re.escape('.' + self.blob_format)}"
+        )
+        for blob in self.client.list_blobs(self.bucket, prefix=name):
+            if written.fullmatch(blob.name) and blob.name not in uploaded:
+                LOGGER.info(f"Deleting blob {blob.name} replaced by this session")
+                blob.delete()
+
+    def _full_name(self, blob_name: str) -> str:
+        return f"{self.prefix}/{blob_name}" if self.prefix is not None else blob_name
+
+    def _reset(self) -> None:
+        for file_name, _, future in self.uploads:
+            future.cancel()
+        if self.writer is not None:
+            self.writer.close()
+        if self.temp_dir is not None:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+        self.writer = None
+        self.file_name = None
+        self.file_rows = 0
+        self.temp_dir = None
+        self.uploads = collections.deque()
+        self.upload_results = []
+        self.part = 0
+        self.session = None
+        self.replace = False
+
+    def supports_to_arrow(self) -> bool:
+        return self.blob_format == "parquet"
+
+    def supports_from_arrow(self) -> bool:
+        return self.blob_format == "parquet"
+
+    def to_arrow(
+        self, job_id: str = None
+    ) -> Iterator[Tuple[pyarrow.RecordBatch, JobResult]]:
+        chunk_start_date_time = datetime.now()
+        for chunk_number, (blob, batch) in enumerate(self._read_chunks("parquet")):
+            result = JobResult(
+                result="DONE",
+                job_id=job_id,
+                task_name=f"gcs to arrow",
+                start_date_time=chunk_start_date_time,
+                end_date_time=datetime.now(),
+                memory=tracemalloc.get_traced_memory(),
+                chunk_number=chunk_number,
+                rows=batch.num_rows,
+                size=batch.nbytes,
+            )
+            chunk_start_date_time = datetime.now()
+            yield batch, result
+
+    def from_arrow(
+        self,
+        batch: pyarrow.RecordBatch,
+        job_id: str = None,
+        chunk_number: int = 0,
+        mode: str = "append",
+    ) -> Tuple[Any, JobResult]:
+        job_res = JobResult(
+            result="NO RUN",
+            job_id=job_id,
+            task_name=f"arrow to gcs",
+            start_date_time=datetime.now(),
+            chunk_number=chunk_number,
+            rows=batch.num_rows,
+            size=batch.nbytes,
+        )
+        return self._write(
+            pyarrow.Table.from_batches([batch]), chunk_number, mode, job_res
+        )
 
     def drop(self) -> JobResult():
         try:
@@ -157,6 +493,19 @@ class GCSConnection(BaseConnection):
             return JobResult(result="FAILED")
 
 
+def _downloaded(blob: Any, future: Future) -> Iterator[Tuple[Any, str]]:
+    """Wait for a download. The file is deleted when the reader moves on"""
+    try:
+        file_name = future.result()
+    except Exception as e:
+        LOGGER.error(f"Error downloading blob {blob.name}. {e}")
+        raise
+    try:
+        yield blob, file_name
+    finally:
+        os.remove(file_name)
+
+
 def register() -> None:
     """Register connector"""
     connection_factory.register("gcs", GCSConnection)
@@ -1,40 +1,236 @@
-import os
-import tempfile
-from typing import TextIO, Tuple
+import datetime
+import io
+import queue
+import threading
+import tracemalloc
+from typing import Any, Dict, Iterator, List, TextIO, Tuple
+
+import pandas
+from psycopg2 import sql
 
 from inbound.core import JobResult, Profile, connection_factory, logging
+from inbound.core.chunk_metrics import frame_size
 from inbound.plugins.connections.sqlalchemy import SQLAlchemyConnection
 
 LOGGER = logging.LOGGER
 
+# Postgres type oids used to restore column types when reading csv from COPY
+BOOL_TYPES = [16]
+TEXT_TYPES = [18, 25, 1042, 1043]
+DATE_TYPES = [1082, 1114, 1184]
+# NULL marker in COPY csv, so that empty strings and "NA" stay text values
+COPY_NULL = "\\N"
+
+
+class CopyStream(io.TextIOBase):
+    """In-memory pipe between a COPY ... TO STDOUT writer and a reader.
+
+    The driver writes to the stream in one thread while pandas reads it in
+    another. At most `maxsize` pieces of data are buffered.
+    """
+
+    def __init__(self, maxsize: int = 64):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.pending = ""
+        self.eof = False
+        self.aborted = False
+
+    def readable(self) -> bool:
+        return True
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        if self.aborted:
+            raise IOError("Reader closed the COPY stream")
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data).decode("utf-8")
+        self.queue.put(data)
+        return len(data)
+
+    def close_writer(self) -> None:
+        self.queue.put(None)
+
+    def read(self, size: int = -1) -> str:
+        while not self.eof and (size is None or size < 0 or len(self.pending) < size):
+            data = self.queue.get()
+            if data is None:
+                self.eof = True
+            else:
+                self.pending += data
+
+        if size is None or size < 0:
+            size = len(self.pending)
+        data, self.pending = self.pending[:size], self.pending[size:]
+        return data
+
+    def abort(self) -> None:
+        """Stop the writer and drop buffered data"""
+        self.aborted = True
+        while not self.eof:
+            try:
+                if self.queue.get(timeout=0.1) is None:
+                    self.eof = True
+            except queue.Empty:
+                continue
+
 
 class PostgresConnection(SQLAlchemyConnection):
     def __init__(self, profile: Profile):
         super().__init__(profile)
 
-    def copy_from(self, table) -> Tuple[TextIO, JobResult]:
+    def to_pandas(
+        self, job_id: str = None
+    ) -> Iterator[Tuple[pandas.DataFrame, JobResult]]:
+        """Stream query results through COPY ... TO STDOUT in chunks"""
+        if self.profile.spec.bulk is False or self._partitions() > 1:
+            yield from super().to_pandas(job_id)
+            return
+
+        query = self.profile.spec.query or f"SELECT * FROM {self.profile.spec.table}"
+        chunk_size = self.profile.spec.chunksize or 100000
+
+        LOGGER.info(
+            f"Copying query {query} from database {self.type}:{self.name} with chunksize: {chunk_size}"
+        )
+
+        raw_connection = self.engine.raw_connection()
+        stream = CopyStream()
+        errors = []
 
-        # Tip: These operations are not as efficient as the SQL COPY command with a file or program data source or destination,
-        # because all data must pass through the client/server connection. For large amounts of data the SQL command might be preferable.
+        def copy():
+            try:
+                with raw_connection.cursor() as cursor:
+                    cursor.copy_expert(
+                        f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER, NULL '{COPY_NULL}')",
+                        stream,
+                    )
+            except Exception as e:
+                errors.append(e)
+            finally:
+                stream.close_writer()
 
-        # TODO: check alternative approach
-        # https://github.com/scottpersinger/pgwarehouse/blob/main/pgwarehouse/pgwarehouse.py line 264
-        # Copy to stdout -> csv -> stage -> import
+        writer = threading.Thread(target=copy, daemon=True)
+        try:
+            params = self._bookmark_params()
+            if params is not None:
+                with raw_connection.cursor() as cursor:
+                    query = cursor.mogrify(
+                        self._bookmark_query(query, "%(last_value)s"), params
+                    ).decode("utf-8")
+
+            read_options = _read_options(raw_connection, query)
+            writer.start()
+            reader = pandas.read_csv(stream, chunksize=chunk_size, **read_options)
+
+            chunk_start_date_time = datetime.datetime.now()
+            for chunk_number, df in enumerate(reader):
+                job_res = JobResult(
+                    result="DONE",
+                    job_id=job_id,
+                    task_name=f"copy to pandas",
+                    start_date_time=chunk_start_date_time,
+                    end_date_time=datetime.datetime.now(),
+                    memory=tracemalloc.get_traced_memory(),
+                    chunk_number=chunk_number,
+                    size=frame_size(df),
+                    rows=len(df),
+                )
+                chunk_start_date_time = datetime.datetime.now()
+                yield df, job_res
+
+            if errors:
+                raise errors[0]
+        finally:
+            if writer.is_alive():
+                stream.abort()
+                writer.join()
+            raw_connection.close()
+
+    def to_sql(
+        self,
+        df: pandas.DataFrame,
+        table: str,
+    ) -> None:
+        """Write dataframe with COPY ... FROM STDIN from an in-memory csv buffer"""
+        if self.profile.spec.bulk is False:
+            return super().to_sql(df, table)
+
+        # create table with column types from pandas if it does not exist
+        df.head(0).to_sql(table, con=self.connection, index=False, if_exists="append")
+
+        buffer = io.StringIO()
+        df.to_csv(buffer, index=False, header=False, na_rep=COPY_NULL)
+        buffer.seek(0)
 
+        raw_connection = self.connection.connection
+        with raw_connection.cursor() as cursor:
+            statement = sql.SQL(
+                "COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL {})"
+            ).format(
+                sql.Identifier(table),
+                sql.SQL(", ").join(sql.Identifier(column) for column in df.columns),
+                sql.Literal(COPY_NULL),
+            )
+            cursor.copy_expert(statement.as_string(cursor), buffer)
+        raw_connection.commit()
+
+    def copy_from(self, table: str, file: TextIO = None) -> Tuple[TextIO, JobResult]:
+        """Copy table as csv to a file object (in memory by default)"""
+        if file is None:
+            file = io.StringIO()
+
+        raw_connection = self.engine.raw_connection()
         try:
-            with tempfile.NamedTemporaryFile(suffix=".csv") as tf:
-                os.environ["PGPASSWORD"] = "postgres"
-                res = os.system(
-                    f"psql -h 0.0.0.0 -p 5432 -d postgres -U postgres -c '\copy {table} to {tf.name} csv header'"
+            with raw_connection.cursor() as cursor:
+                cursor.copy_expert(
+                    f"COPY {table} TO STDOUT WITH (FORMAT csv, HEADER)", file
                 )
-                LOGGER.info(f"Postgres table {table} copied to {tf.name}")
-                return tf, JobResult(result="DONE")
+            if file.seekable():
+                file.seek(0)
+            LOGGER.info(f"Postgres table {table} copied to {file}")
+            return file, JobResult(result="DONE")
         except Exception as e:
-            LOGGER.error(f"Error copying Postgres table {table} to {tf.name}. {e}")
+            LOGGER.error(f"Error copying Postgres table {table} to {file}. {e}")
+        finally:
+            raw_connection.close()
 
         return None, JobResult()
 
 
+def _read_options(raw_connection: Any, query: str) -> Dict[str, Any]:
+    """Map Postgres column types to read_csv options"""
+    with raw_connection.cursor() as cursor:
+        cursor.execute(f"SELECT * FROM ({query}) AS query LIMIT 0")
+        description = cursor.description
+
+    dtype: Dict[str, Any] = {}
+    parse_dates: List[str] = []
+    converters: Dict[str, Any] = {}
+    for column in description:
+        if column[1] in TEXT_TYPES:
+            dtype[column[0]] = object
+        elif column[1] in DATE_TYPES:
+            parse_dates.append(column[0])
+        elif column[1] in BOOL_TYPES:
+            converters[column[0]] = _to_bool
+
+    return {
+        "dtype": dtype,
+        "parse_dates": parse_dates,
+        "converters": converters,
+        "keep_default_na": False,
+        "na_values": [COPY_NULL],
+    }
+
+
+def _to_bool(value: str):
+    if value in ["", COPY_NULL]:
+        return None
+    return value == "t"
+
+
 def register() -> None:
     """Register connector"""
     connection_factory.register("postgres", PostgresConnection)
@@ -1,9 +1,15 @@
+import datetime
 import os
 import shutil
+import tempfile
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import pandas
+import pyarrow
+import pyarrow.parquet
 from snowflake.connector.pandas_tools import pd_writer
 from snowflake.sqlalchemy import URL
 
@@ -31,6 +37,10 @@ class SnowflakeConnection(SQLAlchemyConnection):
     def __init__(self, profile: Profile):
         super().__init__(profile)
 
+        # local directory with parquet files waiting to be loaded in bulk mode
+        self.stage_dir = None
+        self.replace = False
+
         # use sql alchemy conn string
         if profile.spec.connection_string is not None:
             return
@@ -67,49 +77,309 @@ class SnowflakeConnection(SQLAlchemyConnection):
 
         # TODO: add more auth options
 
-    def from_dir(self, temp_dir_name: str, table: str) -> Tuple[str, JobResult]:
+    def supports_to_arrow(self) -> bool:
+        return True
 
-        spec = Spec()
-        if self.spec.bucket:
-            spec.bucket = self.spec.bucket
+    def to_arrow(
+        self, job_id: str = None
+    ) -> Iterator[Tuple[pyarrow.RecordBatch, JobResult]]:
+        """Stream query results as Arrow record batches"""
+        query = self.profile.spec.query or f"SELECT * FROM {self.profile.spec.table}"
+        chunk_size = self.profile.spec.chunksize or 100000
 
-        with GCSConnection(Profile(spec=spec)) as gcs:
+        LOGGER.info(
+            f"Excuting query {query} in database {self.type}:{self.name} with chunksize: {chunk_size}"
+        )
 
-            blob_name = f"uploads/{os.urandom(24).hex()}"
+        raw_connection = self.engine.raw_connection()
+        try:
+            cursor = raw_connection.cursor()
+            cursor.execute(
+                self._bookmark_query(query, "%(last_value)s"),
+                self._bookmark_params(),
+            )
+            chunk_number = 0
+            chunk_start_date_time = datetime.datetime.now()
+            for table in cursor.fetch_arrow_batches():
+                for batch in table.to_batches(max_chunksize=chunk_size):
+                    job_res = JobResult(
+                        result="DONE",
+                        job_id=job_id,
+                        task_name=f"snowflake to arrow",
+                        start_date_time=chunk_start_date_time,
+                        end_date_time=datetime.datetime.now(),
+                        memory=tracemalloc.get_traced_memory(),
+                        chunk_number=chunk_number,
+                        size=batch.nbytes,
+                        rows=batch.num_rows,
+                    )
+                    chunk_number += 1
+                    chunk_start_date_time = datetime.datetime.now()
+                    yield batch, job_res
+        finally:
+            raw_connection.close()
 
-            try:
-                file_names = os.listdir(temp_dir_name)
-                for file_name in file_names:
-                    blob_name = f"uploads/{file_name}"
-                    LOGGER.info(f"Uploading file {file_name} to {blob_name}")
-                    file_full_path = str(Path(temp_dir_name) / file_name)
-                    res, job_res = gcs.upload_from_filename(file_full_path, blob_name)
-                    if not job_res.success:
-                        return "FAILED", JobResult()
-                    try:
-                        path = f"{gcs.root}/{file_name}"
-                        sql = f"copy into {table} from '{path}'"
-
-                        self.connection.execute(sql)
-                        return "DONE", JobResult(result="DONE")
-                    except Exception as e:
-                        LOGGER.error(f"Error executing {sql}. {e}")
-            except Exception as e:
-                LOGGER.error(
-                    f"Error copying from dir til snowflake table {table}. Dir {temp_dir_name}. {e}"
+    def __exit__(self, exc_type, exc_value, traceback):
+        # load chunks staged outside of Job.run
+        if self.stage_dir is not None and exc_type is None:
+            self.finish()
+        super().__exit__(exc_type, exc_value, traceback)
+
+    def supports_from_arrow(self) -> bool:
+        return bool(self.profile.spec.bulk)
+
+    def from_pandas(
+        self,
+        df: pandas.DataFrame,
+        chunk_number: int = 0,
+        mode: str = "replace",
+        job_id: str = None,
+    ) -> Tuple[Any, JobResult]:
+        if not self.profile.spec.bulk:
+            return super().from_pandas(df, chunk_number, mode, job_id)
+
+        table = pyarrow.Table.from_pandas(df, preserve_index=False)
+        return self._stage(table, chunk_number, mode, job_id)
+
+    def from_arrow(
+        self,
+        batch: pyarrow.RecordBatch,
+        job_id: str = None,
+        chunk_number: int = 0,
+        mode: str = "append",
+    ) -> Tuple[Any, JobResult]:
+        table = pyarrow.Table.from_batches([batch])
+        return self._stage(table, chunk_number, mode, job_id)
+
+    def _stage(
+        self, table: pyarrow.Table, chunk_number: int, mode: str, job_id: str
+    ) -> Tuple[Any, JobResult]:
+        """Write chunk to a local compressed parquet file. Loaded by finish()"""
+        job_res = JobResult(
+            result="NO RUN",
+            job_id=job_id,
+            task_name=f"stage chunk {chunk_number}",
+            start_date_time=datetime.datetime.now(),
+            chunk_number=chunk_number,
+            rows=table.num_rows,
+        )
+
+        if chunk_number == 0 and mode == "replace":
+            self.replace = True
+
+        try:
+            if self.stage_dir is None:
+                self.stage_dir = tempfile.mkdtemp(prefix="inbound_")
+
+            file_name = str(Path(self.stage_dir) / f"chunk_{chunk_number:06d}.parquet")
+            pyarrow.parquet.write_table(
+                table, file_name, compression=self.profile.spec.compression or "snappy"
+            )
+
+            job_res.size = os.stat(file_name).st_size
+            job_res.memory = tracemalloc.get_traced_memory()
+            job_res.end_date_time = datetime.datetime.now()
+            job_res.result = "DONE"
+            return file_name, job_res
+        except Exception as e:
+            LOGGER.error(f"Error staging chunk {chunk_number} in {self.stage_dir}. {e}")
+            job_res.memory = tracemalloc.get_traced_memory()
+            job_res.end_date_time = datetime.datetime.now()
+            job_res.result = "FAILED"
+            return None, job_res
+
+    def finish(self, job_id: str = None) -> Optional[JobResult]:
+        """Load all staged chunks with one COPY INTO"""
+        if self.stage_dir is None:
+            return None
+
+        try:
+            _, job_res = self.from_dir(
+                self.stage_dir,
+                self.profile.spec.table,
+                replace=self.replace,
+                job_id=job_id,
+            )
+            return job_res
+        finally:
+            self.stage_dir = None
+            self.replace = False
+
+    def from_dir(
+        self,
+        temp_dir_name: str,
+        table: str,
+        replace: bool = False,
+        job_id: str = None,
+    ) -> Tuple[str, JobResult]:
+        """Upload all files in a directory to a stage and load them with one COPY INTO.
+
+        Files are PUT to an internal stage (the configured `stage` or a temporary
+        one). If `bucket` is set, files are uploaded to GCS and `stage` must be an
+        external stage on that bucket. The directory is deleted afterwards.
+        """
+        job_res = JobResult(
+            result="NO RUN",
+            job_id=job_id,
+            task_name=f"copy into {table}",
+            start_date_time=datetime.datetime.now(),
+        )
+
+        prefix = f"uploads/{os.urandom(12).hex()}"
+        parallel = self.profile.spec.parallel or 4
+
+        try:
+            file_names = sorted(os.listdir(temp_dir_name))
+            if not file_names:
+                job_res.result = "DONE"
+                return "DONE", job_res
+
+            file_sizes = {
+                file_name: os.stat(Path(temp_dir_name) / file_name).st_size
+                for file_name in file_names
+            }
+            file_format = _file_format(file_names[0])
+
+            stage = self.profile.spec.stage
+            if self.profile.spec.bucket:
+                if stage is None:
+                    raise ValueError(
+                        f"Please provide an external stage for bucket {self.profile.spec.bucket}"
+                    )
+                self._upload_to_bucket(temp_dir_name, file_names, prefix, parallel)
+            else:
+                if stage is None:
+                    stage = f"inbound_{os.urandom(8).hex()}"
+                    self.connection.execute(f"CREATE TEMPORARY STAGE {stage}")
+                path = Path(temp_dir_name).as_posix()
+                LOGGER.info(f"Uploading {len(file_names)} files to @{stage}/{prefix}")
+                self.connection.execute(
+                    f"PUT 'file://{path}/*' @{stage}/{prefix} PARALLEL = {parallel} AUTO_COMPRESS = FALSE"
+                )
+
+            location = f"@{stage}/{prefix}"
+            self.connection.execute(
+                f"CREATE TEMPORARY FILE FORMAT IF NOT EXISTS inbound_{file_format} {FILE_FORMATS[file_format]}"
+            )
+            # replace loads a new table and swaps it in, the table stays if COPY fails
+            target = f"{table}_NEW" if replace else table
+            if replace:
+                self.connection.execute(f"DROP TABLE IF EXISTS {target}")
+            self.connection.execute(
+                f"""CREATE TABLE IF NOT EXISTS {target} USING TEMPLATE (
+                    SELECT ARRAY_AGG(OBJECT_CONSTRUCT(*)) WITHIN GROUP (ORDER BY ORDER_ID)
+                    FROM TABLE(INFER_SCHEMA(LOCATION => '{location}', FILE_FORMAT => 'inbound_{file_format}'))
+                )"""
+            )
+            rows = self.connection.execute(
+                f"""COPY INTO {target} FROM {location}
+                FILE_FORMAT = (FORMAT_NAME = 'inbound_{file_format}')
+                MATCH_BY_COLUMN_NAME = CASE_INSENSITIVE
+                PURGE = TRUE"""
+            ).fetchall()
+
+            job_res.rows = 0
+            job_res.size = 0
+            for row in rows:
+                file_res = _copy_result(row, file_sizes, job_id)
+                if file_res is None:
+                    continue
+                job_res.rows += file_res.rows
+                job_res.size += file_res.size
+                job_res.batches.append(file_res)
+
+            failed = [file_res for file_res in job_res.batches if not file_res.success]
+            if replace:
+                if not failed:
+                    self.connection.execute(
+                        f"CREATE TABLE IF NOT EXISTS {table} LIKE {target}"
+                    )
+                    self.connection.execute(f"ALTER TABLE {table} SWAP WITH {target}")
+                self.connection.execute(f"DROP TABLE IF EXISTS {target}")
+            self.connection.execute("COMMIT")
+            job_res.result = "FAILED" if failed else "DONE"
+            job_res.memory = tracemalloc.get_traced_memory()
+            job_res.end_date_time = datetime.datetime.now()
+            LOGGER.info(
+                f"Loaded {job_res.rows} rows from {len(job_res.batches)} files into {table}"
+            )
+            return job_res.result, job_res
+        except Exception as e:
+            LOGGER.error(
+                f"Error copying from dir til snowflake table {table}. Dir {temp_dir_name}. {e}"
+            )
+            job_res.memory = tracemalloc.get_traced_memory()
+            job_res.end_date_time = datetime.datetime.now()
+            job_res.result = "FAILED"
+            return "FAILED", job_res
+        finally:
+            shutil.rmtree(temp_dir_name, ignore_errors=True)
+
+    def _upload_to_bucket(
+        self, temp_dir_name: str, file_names: List[str], prefix: str, parallel: int
+    ) -> None:
+        spec = Spec(bucket=self.profile.spec.bucket)
+
+        with GCSConnection(Profile(spec=spec)) as gcs:
+
+            def upload(file_name: str) -> JobResult:
+                LOGGER.info(f"Uploading file {file_name} to {prefix}/{file_name}")
+                file_full_path = str(Path(temp_dir_name) / file_name)
+                _, job_res = gcs.upload_from_filename(
+                    file_full_path, f"{prefix}/{file_name}"
                 )
-                return "FAILED", JobResult()
-            finally:
-                shutil.rmtree(temp_dir_name)
-
-        return JobResult()
-    
-    def to_sql(self, df: pandas.DataFrame, table:str,) -> None: 
-        df.to_sql(table, con=self.connection, index=False, if_exists="append", method=pd_writer)
-        self.connection.execute("COMMIT") 
-        
+                return job_res
+
+            with ThreadPoolExecutor(max_workers=parallel) as executor:
+                results = list(executor.map(upload, file_names))
+
+        if not all(job_res.success for job_res in results):
+            raise IOError(f"Error uploading files to bucket {spec.bucket}")
+
+    def to_sql(
+        self,
+        df: pandas.DataFrame,
+        table: str,
+    ) -> None:
+        df.to_sql(
+            table,
+            con=self.connection,
+            index=False,
+            if_exists="append",
+            method=pd_writer,
+        )
+        self.connection.execute("COMMIT")
+
         # TODO: Dette ser ikke bra ut, burde finnet ut hvorfor vi tryner her
 
+
+FILE_FORMATS = {
+    "parquet": "TYPE = PARQUET",
+    "csv": "TYPE = CSV PARSE_HEADER = TRUE FIELD_OPTIONALLY_ENCLOSED_BY = '\"'",
+}
+
+
+def _file_format(file_name: str) -> str:
+    return "csv" if file_name.endswith(".csv") else "parquet"
+
+
+def _copy_result(row, file_sizes: Dict[str, int], job_id: str) -> Optional[JobResult]:
+    """Load stats for one file from the result of COPY INTO"""
+    # a single status column is returned if no files were loaded
+    if len(row) < 7:
+        return None
+
+    file, status, _, rows_loaded, _, _, first_error = tuple(row)[:7]
+    return JobResult(
+        result="DONE" if status == "LOADED" else "FAILED",
+        job_id=job_id,
+        task_name=f"copy {file}",
+        rows=rows_loaded or 0,
+        size=file_sizes.get(Path(file).name, 0),
+        exception=first_error or "",
+    )
+
+
 def register() -> None:
     """Register connector"""
     connection_factory.register("snowflake", SnowflakeConnection)
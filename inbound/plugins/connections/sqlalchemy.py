@@ -1,17 +1,28 @@
 import datetime
+import numbers
+import queue
+import re
+import threading
 import tracemalloc
-from typing import Any, Iterator, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Tuple
 
 import pandas
 import sqlalchemy
 
 from inbound.core import JobResult, Profile, connection_factory, logging
+from inbound.core.chunk_metrics import frame_size
 from inbound.core.models import SyncMode
 from inbound.plugins.common import retry_with_backoff
 from inbound.plugins.connections.connection import BaseConnection, Connection
 
 LOGGER = logging.LOGGER
 
+# dates and timestamps as ISO strings, partitioned as timestamps
+ISO_TIMESTAMP = re.compile(
+    r"\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?([+-]\d{2}:\d{2})?)?"
+)
+
 
 class SQLAlchemyConnection(BaseConnection):
     def __init__(self, profile: Profile):
@@ -27,7 +38,13 @@ class SQLAlchemyConnection(BaseConnection):
             raise ValueError("Please provide a connection string.")
 
         try:
-            self.engine = sqlalchemy.create_engine(conn_string)
+            self.engine = sqlalchemy.create_engine(
+                conn_string, **self._engine_options(conn_string)
+            )
+            if self.profile.spec.arraysize:
+                sqlalchemy.event.listen(
+                    self.engine, "before_cursor_execute", self._set_arraysize
+                )
             self.connection = self.get_connection()
         except Exception as e:
             LOGGER.error(f"Error connecting to database. {e}")
@@ -55,6 +72,40 @@ class SQLAlchemyConnection(BaseConnection):
             LOGGER.error(f"Error in trying to connect to db")
             raise
 
+    def _engine_options(self, conn_string: str) -> Dict[str, Any]:
+        """Keep a pooled connection for each partition in partitioned reads"""
+        partitions = self._partitions()
+        if partitions <= 1:
+            return {}
+        url = sqlalchemy.engine.make_url(conn_string)
+        pool_class = url.get_dialect().get_pool_class(url)
+        if not issubclass(pool_class, sqlalchemy.pool.QueuePool):
+            return {}
+        return {"pool_size": partitions}
+
+    def _partitions(self) -> int:
+        if self.profile.spec.partition_column is None:
+            return 1
+        return self.profile.spec.partitions or 1
+
+    def _set_arraysize(self, conn, cursor, statement, parameters, context, executemany):
+        """Number of rows the driver fetches from the server per round trip"""
+        arraysize = self.profile.spec.arraysize
+        cursor.arraysize = arraysize
+        if hasattr(cursor, "prefetchrows"):
+            cursor.prefetchrows = arraysize + 1
+        if hasattr(cursor, "itersize"):
+            cursor.itersize = arraysize
+
+    def _read_connection(self, chunk_size: int) -> Any:
+        """Connection for reading results with a server-side cursor if streaming"""
+        connection = self.connection or self.engine
+        if not self.profile.spec.stream_results:
+            return connection
+        return connection.execution_options(
+            stream_results=True, max_row_buffer=chunk_size
+        )
+
     def to_pandas(
         self, job_id: str = None
     ) -> Iterator[Tuple[pandas.DataFrame, JobResult]]:
@@ -64,6 +115,10 @@ class SQLAlchemyConnection(BaseConnection):
         if not query:
             raise ValueError("Please provide an SQL query string or table name.")
 
+        if self._partitions() > 1:
+            yield from self._to_pandas_partitioned(query, chunk_size, job_id)
+            return
+
         LOGGER.info(
             f"Excuting query {query} in database {self.type}:{self.name} with chunksize: {chunk_size}"
         )
@@ -82,19 +137,27 @@ class SQLAlchemyConnection(BaseConnection):
         df = pandas.DataFrame()
 
         try:
-            iterator = pandas.read_sql(query, self.engine, chunksize=chunk_size)
+            params = self._bookmark_params()
+            if params is not None:
+                query = sqlalchemy.text(self._bookmark_query(query, ":last_value"))
+            iterator = pandas.read_sql(
+                query,
+                self._read_connection(chunk_size),
+                params=params,
+                chunksize=chunk_size,
+            )
             while True:
                 try:
                     df = next(iterator)
                     LOGGER.info(
                         f"Returning batch number {chunk_number} of length {len(df)}"
                     )
-                    job_res.result = ("DONE",)
+                    job_res.result = "DONE"
                     job_res.start_date_time = chunk_start_date_time
                     job_res.end_date_time = datetime.datetime.now()
                     job_res.memory = tracemalloc.get_traced_memory()
                     job_res.chunk_number = chunk_number
-                    job_res.size = df.memory_usage(deep=True).sum()
+                    job_res.size = frame_size(df)
                     job_res.rows = len(df)
                     chunk_number += 1
                     chunk_start_date_time = datetime.datetime.now()
@@ -106,14 +169,96 @@ class SQLAlchemyConnection(BaseConnection):
                     break
 
         except Exception as e:
-            LOGGER.error(f"Could not read from {query}")
-            job_res.result = ("FAILED",)
-            job_res.start_date_time = chunk_start_date_time
-            job_res.end_date_time = datetime.datetime.now()
-            job_res.memory = tracemalloc.get_traced_memory()
-            job_res.chunk_number = chunk_number
-            job_res.rows = len(df)
-            return [], job_res
+            LOGGER.error(f"Could not read from {query}. {e}")
+            raise
+
+    def _to_pandas_partitioned(
+        self, query: str, chunk_size: int, job_id: str = None
+    ) -> Iterator[Tuple[pandas.DataFrame, JobResult]]:
+        """Read disjoint ranges of the partition column concurrently"""
+        column = self.profile.spec.partition_column
+        params = self._bookmark_params() or {}
+        query = self._bookmark_query(query, ":last_value")
+
+        lower, upper = self.engine.execute(
+            sqlalchemy.text(
+                f"SELECT MIN({column}), MAX({column}) FROM ({query}) partition_bounds"
+            ),
+            params,
+        ).fetchone()
+        try:
+            ranges = partition_ranges(lower, upper, self._partitions())
+        except ValueError as e:
+            raise ValueError(f"Invalid partition_column {column}. {e}") from e
+
+        LOGGER.info(
+            f"Reading query {query} in database {self.type}:{self.name} in {len(ranges)} partitions on {column}"
+        )
+
+        chunks = queue.Queue(maxsize=2 * len(ranges))
+        stop = threading.Event()
+
+        def read(partition: int, where: str, bounds: Dict[str, Any]) -> None:
+            partition_query = sqlalchemy.text(
+                f"SELECT * FROM ({query}) partition_query WHERE {where}"
+            )
+            with self.engine.connect() as connection:
+                if self.profile.spec.stream_results:
+                    connection = connection.execution_options(
+                        stream_results=True, max_row_buffer=chunk_size
+                    )
+                start_date_time = datetime.datetime.now()
+                for df in pandas.read_sql(
+                    partition_query,
+                    connection,
+                    params={**params, **bounds},
+                    chunksize=chunk_size,
+                ):
+                    job_res = JobResult(
+                        result="DONE",
+                        job_id=job_id,
+                        task_name=f"partition {partition} to pandas",
+                        start_date_time=start_date_time,
+                        end_date_time=datetime.datetime.now(),
+                        memory=tracemalloc.get_traced_memory(),
+                        chunk_number=partition,
+                        size=frame_size(df),
+                        rows=len(df),
+                    )
+                    while not stop.is_set():
+                        try:
+                            chunks.put((df, job_res), timeout=0.1)
+                            break
+                        except queue.Full:
+                            continue
+                    if stop.is_set():
+                        return
+                    start_date_time = datetime.datetime.now()
+
+        with ThreadPoolExecutor(
+            max_workers=len(ranges), thread_name_prefix="inbound-partition"
+        ) as executor:
+            futures = [
+                executor.submit(read, partition, where, bounds)
+                for partition, (where, bounds) in enumerate(
+                    partition_filters(column, ranges)
+                )
+            ]
+            try:
+                while True:
+                    try:
+                        yield chunks.get(timeout=0.1)
+                        continue
+                    except queue.Empty:
+                        pass
+                    for future in futures:
+                        if future.done() and future.exception() is not None:
+                            LOGGER.error(f"Could not read partition from {query}")
+                            raise future.exception()
+                    if all(future.done() for future in futures) and chunks.empty():
+                        break
+            finally:
+                stop.set()
 
     def to_sql(
         self,
@@ -144,7 +289,7 @@ class SQLAlchemyConnection(BaseConnection):
             task_name=f"from pandas",
             start_date_time=datetime.datetime.now(),
             chunk_number=chunk_number,
-            size=df.memory_usage(deep=True).sum(),
+            size=frame_size(df),
             rows=len(df),
         )
 
@@ -197,6 +342,76 @@ class SQLAlchemyConnection(BaseConnection):
             return job_res
 
 
+def partition_ranges(lower: Any, upper: Any, partitions: int) -> List[Tuple[Any, Any]]:
+    """Split [lower, upper] in up to `partitions` ranges of equal width.
+
+    Works for numbers, dates and timestamps. Timestamps returned as ISO strings (as
+    in SQLite) are split as timestamps and the bounds returned as strings.
+    Other values raise a ValueError.
+    """
+    if lower is None or upper is None:
+        return [(lower, upper)]
+
+    as_string = isinstance(lower, str) or isinstance(upper, str)
+    if as_string and not (_is_timestamp(lower) and _is_timestamp(upper)):
+        raise ValueError(
+            f"Partition bounds {lower!r} and {upper!r} are strings, but not dates or timestamps"
+        )
+    if not as_string and not all(
+        isinstance(bound, (numbers.Number, datetime.date))
+        and not isinstance(bound, bool)
+        for bound in (lower, upper)
+    ):
+        raise ValueError(
+            f"Partition column must be numeric, a date or a timestamp, got {type(lower).__name__}"
+        )
+
+    if as_string:
+        bounds_as_string = (lower, upper)
+        lower = datetime.datetime.fromisoformat(lower)
+        upper = datetime.datetime.fromisoformat(upper)
+
+    if isinstance(lower, int) and isinstance(upper, int):
+        bounds = [lower + (upper - lower) * i // partitions for i in range(partitions)]
+    else:
+        bounds = [lower + (upper - lower) * i / partitions for i in range(partitions)]
+    bounds = sorted(set(bounds))
+
+    if as_string:
+        # keep the outer bounds as read from the database
+        bounds = [bounds_as_string[0]] + [
+            bound.isoformat(sep=" ") for bound in bounds[1:]
+        ]
+        upper = bounds_as_string[1]
+
+    return list(zip(bounds, bounds[1:] + [upper]))
+
+
+def _is_timestamp(value: Any) -> bool:
+    """ISO date or timestamp string, as temporal values are stored in SQLite"""
+    return isinstance(value, str) and bool(ISO_TIMESTAMP.fullmatch(value))
+
+
+def partition_filters(
+    column: str, ranges: List[Tuple[Any, Any]]
+) -> List[Tuple[str, Dict[str, Any]]]:
+    """Disjoint where clauses and bind parameters for the partition ranges.
+
+    The last range includes its upper bound. Nulls are read with the first range.
+    """
+    filters = []
+    for index, (lower, upper) in enumerate(ranges):
+        if lower is None:
+            filters.append((f"{column} IS NULL", {}))
+            continue
+        last = index == len(ranges) - 1
+        where = f"{column} >= :lower AND {column} {'<=' if last else '<'} :upper"
+        if index == 0:
+            where = f"({where}) OR {column} IS NULL"
+        filters.append((where, {"lower": lower, "upper": upper}))
+    return filters
+
+
 def register() -> None:
     """Register connector"""
     connection_factory.register("sqlalchemy", SQLAlchemyConnection)
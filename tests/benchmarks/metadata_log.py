@@ -0,0 +1,107 @@
+"""RAW, ROW_ID and HASH for the "log" metadata format compared to the old version.
+
+    python tests/benchmarks/metadata_log.py --rows 1000000
+"""
+
+import argparse
+import hashlib
+import json
+import time
+import tracemalloc
+
+import numpy
+import pandas
+
+from inbound.core.metadata import raw_json, row_hashes, row_ids
+
+
+def frame(rows: int) -> pandas.DataFrame:
+    return pandas.DataFrame(
+        {
+            "id": numpy.arange(rows),
+            "code": numpy.random.choice(["a", "b", "c"], rows),
+            "value": numpy.random.random(rows),
+            "updated": pandas.date_range("2023-01-01", periods=rows, freq="s"),
+        }
+    )
+
+
+def row_ids_apply(df: pandas.DataFrame, row_id: list) -> pandas.Series:
+    return (
+        df[[x for x in df.columns if x in row_id]]
+        .apply(lambda x: "_".join(x.astype(str)), axis=1)
+        .replace(" ", "_")
+    )
+
+
+def row_hashes_loop(values) -> list:
+    return [hashlib.md5(data.encode("utf-8")).hexdigest() for data in values]
+
+
+def raw_json_splitlines(df: pandas.DataFrame) -> list:
+    return df.to_json(
+        orient="records", lines=True, force_ascii=False, date_format="iso"
+    ).splitlines()
+
+
+def peak_memory(name: str, rows: int, function, *args) -> dict:
+    tracemalloc.start()
+    function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"name": name, "rows": rows, "peak_memory_mb": round(peak / 2**20, 1)}
+
+
+def timed(name: str, rows: int, function, *args) -> dict:
+    start = time.perf_counter()
+    function(*args)
+    seconds = time.perf_counter() - start
+    return {
+        "name": name,
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args()
+
+    df = frame(args.rows)
+    raw = df.to_json(
+        orient="records", lines=True, force_ascii=False, date_format="iso"
+    ).splitlines()
+    row_id = ["id", "code"]
+
+    results = [
+        timed("raw splitlines", args.rows, raw_json_splitlines, df),
+        timed("raw blocks", args.rows, raw_json, df),
+        peak_memory("raw splitlines", args.rows, raw_json_splitlines, df),
+        peak_memory("raw blocks", args.rows, raw_json, df),
+        timed("row_id apply", args.rows, row_ids_apply, df, row_id),
+        timed("row_id vectorized", args.rows, row_ids, df, row_id),
+        timed("hash md5 loop", args.rows, row_hashes_loop, raw),
+    ]
+    for hash_function in ["md5", "sha1", "hash64", "xxh64", "xxh3_64"]:
+        try:
+            results.append(
+                timed(
+                    f"hash {hash_function}",
+                    args.rows,
+                    row_hashes,
+                    raw,
+                    hash_function,
+                    df,
+                )
+            )
+        except ValueError as e:
+            results.append({"name": f"hash {hash_function}", "error": str(e)})
+
+    for res in results:
+        print(json.dumps(res))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""Throughput benchmarks of connectors and the job engine.
+
+Runs each scenario at each size in its own process and prints one JSON line per
+run with rows/s, MB/s and peak RSS. Results are also appended to --output.
+
+    python tests/benchmarks/run.py --rows 10000,1000000
+    python tests/benchmarks/run.py --scenarios csv_duckdb --rows 10000000
+    python tests/benchmarks/run.py --baseline target/benchmarks/baseline.jsonl
+
+With --baseline the run fails if rows/s of a scenario drops more than
+--tolerance below the baseline result for the same scenario and size.
+
+Scenarios:
+    csv_duckdb: FileConnection csv -> DuckDBConnection
+    csv_duckdb_accumulate: as csv_duckdb through pandas, 10 chunks per insert
+    csv_duckdb_native: read_csv_auto in DuckDB, the reference for csv_duckdb
+    duckdb_sqlite: DuckDBConnection -> SQLAlchemyConnection (sqlite)
+    duckdb_parquet: DuckDBConnection -> FileConnection parquet
+    sqlite_duckdb: SQLAlchemyConnection (sqlite) -> DuckDBConnection
+    log_enrichment: enriched_with_metadata with format "log"
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+import duckdb
+
+SCENARIOS = [
+    "csv_duckdb",
+    "csv_duckdb_accumulate",
+    "csv_duckdb_native",
+    "duckdb_sqlite",
+    "duckdb_parquet",
+    "sqlite_duckdb",
+    "log_enrichment",
+]
+CHUNKSIZE = 100000
+
+
+def peak_rss() -> int:
+    """Peak resident set size of this process in bytes"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def generate(workdir: Path, rows: int) -> None:
+    """Source data for all scenarios"""
+    db = duckdb.connect(str(workdir / "source.duckdb"))
+    db.execute(
+        f"""create table source as
+            select range as id,
+                   'name ' || range as name,
+                   range % 100 as category,
+                   random() * 1000 as amount,
+                   timestamp '2023-01-01' + to_seconds(range) as updated
+            from range({rows})"""
+    )
+    db.execute(f"copy source to '{workdir / 'source.csv'}' (header)")
+
+    with sqlite3.connect(workdir / "source.db") as sqlite:
+        sqlite.execute(
+            "create table source (id integer, name text, category integer, amount real, updated text)"
+        )
+        batches = db.execute("select * from source").fetch_record_batch(CHUNKSIZE)
+        for batch in batches:
+            sqlite.executemany(
+                "insert into source values (?, ?, ?, ?, ?)",
+                zip(*[column.to_pylist() for column in batch.columns]),
+            )
+    db.close()
+
+
+def run_job(source: dict, target: dict, **config) -> Tuple[int, int]:
+    from inbound.core.jobs import _run_jobs_in_list
+    from inbound.core.models import JobModel
+
+    job = JobModel(name="benchmark", source=source, target=target, **config)
+    res = _run_jobs_in_list([job])
+    if not res.success:
+        raise RuntimeError(f"Benchmark job failed: {res}")
+    job_result = res.jobs[0]
+    return job_result.rows, job_result.size
+
+
+def csv_duckdb(
+    workdir: Path, accumulate_chunks: int = None, direct: bool = True
+) -> Tuple[int, int]:
+    return run_job(
+        {
+            "type": "file",
+            "spec": {"path": str(workdir / "source.csv"), "chunksize": CHUNKSIZE},
+        },
+        {
+            "type": "duckdb",
+            "spec": {
+                "database": str(workdir / "output.duckdb"),
+                "table": "target",
+                "accumulate_chunks": accumulate_chunks,
+            },
+        },
+        direct=direct,
+    )
+
+
+def csv_duckdb_accumulate(workdir: Path) -> Tuple[int, int]:
+    return csv_duckdb(workdir, accumulate_chunks=10, direct=False)
+
+
+def csv_duckdb_native(workdir: Path) -> Tuple[int, int]:
+    db = duckdb.connect(str(workdir / "output.duckdb"))
+    db.execute(
+        f"create table target as select * from read_csv_auto('{workdir / 'source.csv'}')"
+    )
+    rows = db.execute("select count(*) from target").fetchone()[0]
+    db.close()
+    return rows, os.stat(workdir / "source.csv").st_size
+
+
+def duckdb_sqlite(workdir: Path) -> Tuple[int, int]:
+    return run_job(
+        {
+            "type": "duckdb",
+            "spec": {
+                "database": str(workdir / "source.duckdb"),
+                "query": "select * from source",
+                "chunksize": CHUNKSIZE,
+            },
+        },
+        {
+            "type": "sqlalchemy",
+            "spec": {
+                "connection_string": f"sqlite:///{workdir / 'output.db'}",
+                "table": "target",
+            },
+        },
+    )
+
+
+def duckdb_parquet(workdir: Path) -> Tuple[int, int]:
+    return run_job(
+        {
+            "type": "duckdb",
+            "spec": {
+                "database": str(workdir / "source.duckdb"),
+                "query": "select * from source",
+                "chunksize": CHUNKSIZE,
+            },
+        },
+        {"type": "file", "spec": {"path": str(workdir / "output.parquet")}},
+        arrow=True,
+    )
+
+
+def sqlite_duckdb(workdir: Path) -> Tuple[int, int]:
+    return run_job(
+        {
+            "type": "sqlalchemy",
+            "spec": {
+                "connection_string": f"sqlite:///{workdir / 'source.db'}",
+                "table": "source",
+                "chunksize": CHUNKSIZE,
+            },
+        },
+        {
+            "type": "duckdb",
+            "spec": {"database": str(workdir / "output.duckdb"), "table": "target"},
+        },
+    )
+
+
+def log_enrichment(workdir: Path) -> Tuple[int, int]:
+    from inbound.core.chunk_metrics import frame_size
+    from inbound.core.metadata import enriched_with_metadata
+    from inbound.core.models import Spec
+
+    spec = Spec(format="log", row_id=["id", "category"], source="benchmark")
+    db = duckdb.connect(str(workdir / "source.duckdb"), read_only=True)
+    rows = size = 0
+    for batch in db.execute("select * from source").fetch_record_batch(CHUNKSIZE):
+        df = batch.to_pandas()
+        df_out, job_res = enriched_with_metadata(spec, df)
+        if not job_res.success:
+            raise RuntimeError("Metadata enrichment failed")
+        rows += len(df_out)
+        size += frame_size(df)
+    db.close()
+    return rows, size
+
+
+def run_scenario(scenario: str, workdir: Path, rows: int) -> Dict:
+    # import outside of the timed run, only the job engine and connectors count
+    import inbound.core.jobs  # noqa: F401
+    import inbound.core.metadata  # noqa: F401
+
+    function: Callable[[Path], Tuple[int, int]] = globals()[scenario]
+    start = time.perf_counter()
+    rows_done, size = function(workdir)
+    seconds = time.perf_counter() - start
+    return {
+        "scenario": scenario,
+        "rows": rows,
+        "rows_done": rows_done,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds),
+        "mb_per_second": round(max(0, size) / 2**20 / seconds, 2),
+        "peak_rss_mb": round(peak_rss() / 2**20, 1),
+    }
+
+
+def regressions(results: List[Dict], baseline: Path, tolerance: float) -> List[str]:
+    expected = {}
+    for line in baseline.read_text().splitlines():
+        res = json.loads(line)
+        expected[(res["scenario"], res["rows"])] = res["rows_per_second"]
+
+    failures = []
+    for res in results:
+        base = expected.get((res["scenario"], res["rows"]))
+        if base and res["rows_per_second"] < base * (1 - tolerance):
+            failures.append(
+                f"{res['scenario']} at {res['rows']} rows: {res['rows_per_second']} rows/s, baseline {base} rows/s"
+            )
+    return failures
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--rows", default="10000,1000000")
+    parser.add_argument("--output", default="target/benchmarks/results.jsonl")
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--run", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run is not None:
+        # single scenario in a child process
+        print(json.dumps(run_scenario(args.run, Path(args.workdir), int(args.rows))))
+        return 0
+
+    results = []
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    for rows in [int(rows) for rows in args.rows.split(",")]:
+        with tempfile.TemporaryDirectory() as tmp:
+            generate(Path(tmp), rows)
+            for scenario in args.scenarios.split(","):
+                for output_file in Path(tmp).glob("output*"):
+                    output_file.unlink()
+                process = subprocess.run(
+                    [
+                        sys.executable,
+                        __file__,
+                        f"--run={scenario}",
+                        f"--rows={rows}",
+                        f"--workdir={tmp}",
+                    ],
+                    capture_output=True,
+                    text=True,
+                    cwd=tmp,
+                    env={**os.environ, "INBOUND_METRICS": ""},
+                )
+                if process.returncode != 0:
+                    print(process.stderr, file=sys.stderr)
+                    res = {"scenario": scenario, "rows": rows, "error": True}
+                else:
+                    res = json.loads(process.stdout.strip().splitlines()[-1])
+                    res["python"] = platform.python_version()
+                    results.append(res)
+                print(json.dumps(res), flush=True)
+                with open(output, "a") as results_file:
+                    results_file.write(json.dumps(res) + "\n")
+
+    if args.baseline:
+        failures = regressions(results, Path(args.baseline), args.tolerance)
+        for failure in failures:
+            print(f"Regression: {failure}", file=sys.stderr)
+        return 1 if failures else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+"""Peak memory of SQLAlchemyConnection.to_pandas with and without streaming.
+
+Generates a table with DuckDB, writes it to SQLite (or the database given with
+--connection-string) and reads it back in chunks. Each read runs in its own
+process so peak RSS includes buffers allocated by the database driver.
+
+    python tests/benchmarks/sqlalchemy_streaming.py --rows 1000000 --chunksize 10000
+"""
+
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import duckdb
+import sqlalchemy
+
+from inbound.core.models import Profile, Spec
+from inbound.plugins.connections.sqlalchemy import SQLAlchemyConnection
+
+
+def create_table(connection_string: str, rows: int) -> None:
+    df = duckdb.query(
+        f"""select range as id,
+                   'name ' || range as name,
+                   random() as value,
+                   timestamp '2023-01-01' + to_seconds(range) as updated
+            from range({rows})"""
+    ).df()
+    engine = sqlalchemy.create_engine(connection_string)
+    df.to_sql("benchmark", engine, index=False, if_exists="replace", chunksize=100000)
+    engine.dispose()
+
+
+def peak_rss() -> int:
+    """Peak resident set size of this process in kB"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def read(connection_string: str, chunksize: int, stream_results: bool) -> dict:
+    spec = Spec(
+        connection_string=connection_string,
+        table="benchmark",
+        chunksize=chunksize,
+        stream_results=stream_results,
+        arraysize=chunksize,
+    )
+    profile = Profile(type="sqlalchemy", spec=spec)
+
+    rows = 0
+    rss_before = peak_rss()
+    start = time.perf_counter()
+    with SQLAlchemyConnection(profile) as db:
+        for df, _ in db.to_pandas():
+            rows += len(df)
+    duration = time.perf_counter() - start
+    rss_after = peak_rss()
+
+    return {
+        "stream_results": stream_results,
+        "chunksize": chunksize,
+        "rows": rows,
+        "seconds": round(duration, 3),
+        "rows_per_second": round(rows / duration),
+        "peak_rss_mb": round(rss_after / 2**10, 1),
+        "read_rss_growth_mb": round((rss_after - rss_before) / 2**10, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--chunksize", type=int, default=10000)
+    parser.add_argument("--connection-string", default=None)
+    parser.add_argument("--read", choices=["stream", "buffer"], default=None)
+    args = parser.parse_args()
+
+    if args.read is not None:
+        res = read(args.connection_string, args.chunksize, args.read == "stream")
+        print(json.dumps(res))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        connection_string = (
+            args.connection_string or f"sqlite:///{Path(tmp) / 'benchmark.db'}"
+        )
+        create_table(connection_string, args.rows)
+        for mode in ["stream", "buffer"]:
+            subprocess.run(
+                [
+                    sys.executable,
+                    __file__,
+                    f"--chunksize={args.chunksize}",
+                    f"--connection-string={connection_string}",
+                    f"--read={mode}",
+                ],
+                check=True,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,3 @@
-import os
-
 import numpy as np
 
 from inbound.core.models import Profile, Spec
@@ -49,6 +47,20 @@ def test_to_csv(table="city"):
     with PostgresConnection(profile=profile) as db:
         file, ret_res = db.copy_from(table)
         assert ret_res.success
+        assert len(file.getvalue()) > 0
+
+
+def test_copy_roundtrip_in_chunks():
+
+    chunks = np.array_split(df, 4)
+    with PostgresConnection(profile=profile) as db:
+        for index in range(len(chunks)):
+            db.from_pandas(chunks[index], chunk_number=index, mode="replace")
+
+        res = [df_res for df_res, _ in db.to_pandas()]
+
+        assert sum(len(df_res) for df_res in res) == len(df)
+        assert list(res[0].columns) == list(df.columns)
 
 
 def test_drop_table():
@@ -60,5 +72,4 @@ def test_drop_table():
 
 
 if __name__ == "__main__":
-    os.environ["PGPASSWORD"] = "postgres"
     test_to_csv()
@@ -0,0 +1,99 @@
+import duckdb
+import pyarrow
+
+from inbound.core.jobs import run_job
+from inbound.core.models import Profile, Spec
+from inbound.plugins.connections.duckdb import DuckDBConnection
+from inbound.plugins.connections.file import FileConnection
+from inbound.plugins.utils import df
+
+profile = Profile(spec=Spec(name="duckdb", database=":memory:", table="test"))
+
+
+def test_duckdb_arrow_roundtrip():
+    batch = pyarrow.RecordBatch.from_pandas(df, preserve_index=False)
+
+    with DuckDBConnection(profile=profile) as db:
+        for index in range(3):
+            _, job_res = db.from_arrow(batch, chunk_number=index, mode="replace")
+            assert job_res.success
+
+        batches = [batch for batch, _ in db.to_arrow()]
+
+    assert sum(batch.num_rows for batch in batches) == 3 * len(df)
+    assert batches[0].schema.names == list(df.columns)
+
+
+def test_file_parquet_arrow_roundtrip(data_path):
+    spec = Spec(path=data_path + "/test_arrow.parquet", chunksize=30)
+    batch = pyarrow.RecordBatch.from_pandas(df, preserve_index=False)
+
+    with FileConnection(profile=Profile(spec=spec)) as file:
+        assert file.supports_to_arrow() and file.supports_from_arrow()
+        file.from_arrow(batch, chunk_number=0, mode="replace")
+        file.from_pandas(df, chunk_number=1, mode="replace")
+
+    with FileConnection(profile=Profile(spec=spec)) as file:
+        rows = [batch.num_rows for batch, _ in file.to_arrow()]
+        df_out = next(file.to_pandas())[0]
+        file.drop()
+
+    assert sum(rows) == 2 * len(df)
+    assert max(rows) == 30
+    assert list(df_out.columns) == list(df.columns)
+
+
+def test_arrow_job(data_path):
+    ret = run_job(data_path + "/csv_duckdb_parquet.yml")
+
+    assert ret.result == "DONE"
+    with duckdb.connect(data_path + "/duckdb") as db:
+        assert db.execute("select count(*) from test_parquet").fetchone()[0] > 0
+
+
+def test_file_ipc_roundtrip(tmp_path):
+    spec = Spec(path=str(tmp_path / "test.feather"), chunksize=30)
+    batch = pyarrow.RecordBatch.from_pandas(df, preserve_index=False)
+
+    with FileConnection(profile=Profile(spec=spec)) as file:
+        assert file.supports_to_arrow() and file.supports_from_arrow()
+        file.from_arrow(batch, chunk_number=0, mode="replace")
+        file.from_pandas(df, chunk_number=1, mode="replace")
+
+    with FileConnection(profile=Profile(spec=spec)) as file:
+        rows = [batch.num_rows for batch, _ in file.to_arrow()]
+
+    assert sum(rows) == 2 * len(df)
+    assert max(rows) == 30
+
+
+def test_file_directory_append(tmp_path):
+    for path in ["events.parquet/", "events.arrow/", "events.jsonl/"]:
+        spec = Spec(path=f"{tmp_path}/{path}", chunksize=30)
+        for session in range(2):
+            with FileConnection(profile=Profile(spec=spec)) as file:
+                for index in range(2):
+                    _, job_res = file.from_pandas(df, chunk_number=index)
+                    assert job_res.success
+
+        with FileConnection(profile=Profile(spec=spec)) as file:
+            rows = sum(len(chunk) for chunk, _ in file.to_pandas())
+
+        # one part file per session, no rewrites
+        assert len(list((tmp_path / path).iterdir())) == 2
+        assert rows == 4 * len(df)
+
+
+def test_file_ndjson_roundtrip(tmp_path):
+    spec = Spec(path=str(tmp_path / "test.ndjson"), chunksize=30)
+
+    with FileConnection(profile=Profile(spec=spec)) as file:
+        file.from_pandas(df, chunk_number=0, mode="replace")
+        file.from_pandas(df, chunk_number=1, mode="replace")
+
+    with FileConnection(profile=Profile(spec=spec)) as file:
+        chunks = [chunk for chunk, _ in file.to_pandas()]
+
+    assert sum(len(chunk) for chunk in chunks) == 2 * len(df)
+    assert max(len(chunk) for chunk in chunks) == 30
+    assert list(chunks[0].columns) == list(df.columns)
@@ -0,0 +1,254 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pandas
+import pyarrow
+import pyarrow.parquet
+import pytest
+import sqlalchemy
+
+from inbound.core.models import Profile, Spec
+from inbound.plugins.connections import bigquery
+from inbound.plugins.connections.bigquery import BigQueryConnection
+
+TABLE = SimpleNamespace(project="project", dataset_id="dataset", table_id="result")
+CREDENTIALS = object()
+
+
+def _batch(start: int, rows: int) -> pyarrow.RecordBatch:
+    return pyarrow.RecordBatch.from_pydict({"id": list(range(start, start + rows))})
+
+
+class FakeRowIterator:
+    def __init__(self, batches):
+        self.batches = batches
+
+    def to_arrow_iterable(self):
+        return iter(self.batches)
+
+
+class FakeClient:
+    project = "billing"
+
+    def __init__(self, batches):
+        self.batches = batches
+        self.queries = []
+        self.tables = {}
+        self.copies = []
+        self.lock = threading.Lock()
+        self.loading = 0
+        self.max_loading = 0
+        self.fail_loads = False
+
+    def query(self, query):
+        self.queries.append(query)
+        return SimpleNamespace(result=lambda: None, destination=TABLE)
+
+    def get_table(self, table):
+        return TABLE
+
+    def list_rows(self, table, page_size=None):
+        return FakeRowIterator(self.batches)
+
+    def delete_table(self, table, not_found_ok=False):
+        self.tables.pop(table, None)
+
+    def load_table_from_file(self, source, table, job_config=None):
+        assert job_config.source_format == "PARQUET"
+        assert job_config.write_disposition == "WRITE_APPEND"
+        data = pyarrow.parquet.read_table(source)
+        if self.fail_loads:
+            raise RuntimeError("load failed")
+        with self.lock:
+            self.loading += 1
+            self.max_loading = max(self.max_loading, self.loading)
+        time.sleep(0.01)
+        with self.lock:
+            self.loading -= 1
+            self.tables.setdefault(table, []).append(data)
+        return SimpleNamespace(result=lambda: None)
+
+    def copy_table(self, source, destination, job_config=None):
+        self.copies.append((source, destination, job_config.write_disposition))
+        if job_config.write_disposition == "WRITE_TRUNCATE":
+            self.tables[destination] = []
+        self.tables.setdefault(destination, []).extend(self.tables[source])
+        return SimpleNamespace(result=lambda: None)
+
+    def rows(self, table):
+        return sorted(
+            id for data in self.tables.get(table, []) for id in data["id"].to_pylist()
+        )
+
+
+class FakeReadClient:
+    def __init__(self, streams, fail=False):
+        self.streams = streams
+        self.fail = fail
+        self.threads = set()
+        self.requests = []
+
+    def create_read_session(self, parent, read_session, max_stream_count):
+        self.requests.append((parent, read_session, max_stream_count))
+        names = list(self.streams)[:max_stream_count]
+        return SimpleNamespace(streams=[SimpleNamespace(name=name) for name in names])
+
+    def read_rows(self, name):
+        self.threads.add(threading.current_thread().name)
+        if self.fail:
+            raise RuntimeError("stream failed")
+        pages = [SimpleNamespace(to_arrow=lambda b=b: b) for b in self.streams[name]]
+        return SimpleNamespace(rows=lambda session: SimpleNamespace(pages=pages))
+
+
+@pytest.fixture
+def connect(monkeypatch):
+    def connect(batches=None, streams=None, **spec):
+        client = FakeClient(batches or [])
+        read_client = FakeReadClient(streams) if streams is not None else None
+        monkeypatch.setattr(
+            bigquery,
+            "_create_engine",
+            lambda spec: sqlalchemy.create_engine("sqlite://"),
+        )
+        monkeypatch.setattr(
+            bigquery, "_bigquery_get_credentials", lambda spec: CREDENTIALS
+        )
+        monkeypatch.setattr(
+            bigquery, "_bigquery_get_client", lambda spec, credentials: client
+        )
+        if read_client is not None:
+            monkeypatch.setattr(
+                BigQueryConnection, "get_read_client", lambda self: read_client
+            )
+        monkeypatch.setattr(
+            bigquery,
+            "bigquery_storage",
+            SimpleNamespace(
+                types=SimpleNamespace(
+                    ReadSession=dict, DataFormat=SimpleNamespace(ARROW="ARROW")
+                ),
+                BigQueryReadClient=lambda credentials: SimpleNamespace(
+                    credentials=credentials
+                ),
+            ),
+        )
+        profile = Profile(spec=Spec(**spec))
+        return BigQueryConnection(profile), client, read_client
+
+    return connect
+
+
+def test_to_pandas_storage_streams(connect):
+    streams = {
+        f"stream_{index}": [_batch(index * 100, 25), _batch(index * 100 + 25, 10)]
+        for index in range(3)
+    }
+    connection, client, read_client = connect(
+        streams=streams, query="select id from t", chunksize=10, parallel=2
+    )
+
+    with connection as bq:
+        results = list(bq.to_pandas(job_id="job"))
+
+    parent, read_session, max_stream_count = read_client.requests[0]
+    assert parent == "projects/billing"
+    assert read_session["table"] == "projects/project/datasets/dataset/tables/result"
+    assert read_session["data_format"] == "ARROW"
+    assert max_stream_count == 2
+    assert client.queries == ["select id from t"]
+    assert all(name.startswith("inbound-bigquery") for name in read_client.threads)
+
+    assert sorted(len(df) for df, _ in results) == [5, 5, 10, 10, 10, 10, 10, 10]
+    ids = sorted(id for df, _ in results for id in df["id"])
+    assert ids == list(range(35)) + list(range(100, 135))
+    assert [res.chunk_number for _, res in results] == list(range(8))
+    assert all(res.success and res.rows == len(df) for df, res in results)
+    assert all(res.job_id == "job" and res.size > 0 for _, res in results)
+
+
+def test_read_client_uses_connection_credentials(connect):
+    connection, _, _ = connect()
+
+    with connection as bq:
+        assert bq.credentials is CREDENTIALS
+        assert bq.get_read_client().credentials is CREDENTIALS
+
+
+def test_to_arrow_without_storage_api(connect):
+    connection, client, _ = connect(
+        batches=[_batch(0, 15), _batch(15, 5)], chunksize=10, storage_api=False
+    )
+
+    with connection as bq:
+        assert bq.supports_to_arrow()
+        results = list(bq.to_arrow())
+
+    assert [batch.num_rows for batch, _ in results] == [10, 5, 5]
+    assert client.queries == []
+    assert all(isinstance(batch, pyarrow.RecordBatch) for batch, _ in results)
+
+
+def test_to_pandas_stream_error(connect):
+    connection, _, read_client = connect(streams={"stream_0": [_batch(0, 1)]})
+    read_client.fail = True
+
+    with pytest.raises(RuntimeError, match="stream failed"):
+        with connection as bq:
+            list(bq.to_pandas())
+
+
+def _chunks(count: int = 6, rows: int = 10):
+    return [
+        pandas.DataFrame({"id": range(index * rows, (index + 1) * rows)})
+        for index in range(count)
+    ]
+
+
+@pytest.mark.parametrize("mode", ["replace", "append"])
+def test_from_pandas_batched_loads(connect, mode):
+    connection, client, _ = connect(table="dataset.target", file_size=1, parallel=2)
+    client.tables["dataset.target"] = [pyarrow.table({"id": [-1]})]
+
+    with connection as bq:
+        for index, df in enumerate(_chunks()):
+            _, res = bq.from_pandas(df, chunk_number=index, mode=mode)
+            assert res.success
+        assert client.rows("dataset.target") == [-1]
+        finish_res = bq.finish(job_id="job")
+
+    assert finish_res.success
+    assert finish_res.rows == 60
+    assert len(finish_res.batches) == 6
+    assert client.max_loading <= 2
+    assert "dataset.target_NEW" not in client.tables
+    expected = [] if mode == "replace" else [-1]
+    assert client.rows("dataset.target") == expected + list(range(60))
+    disposition = "WRITE_TRUNCATE" if mode == "replace" else "WRITE_APPEND"
+    assert client.copies == [("dataset.target_NEW", "dataset.target", disposition)]
+
+
+def test_from_pandas_accumulates_chunks(connect):
+    connection, client, _ = connect(table="dataset.target")
+
+    with connection as bq:
+        for index, df in enumerate(_chunks()):
+            bq.from_pandas(df, chunk_number=index, mode="replace")
+
+    assert len(client.tables["dataset.target"]) == 1
+    assert client.rows("dataset.target") == list(range(60))
+
+
+def test_from_pandas_failed_load_keeps_table(connect):
+    connection, client, _ = connect(table="dataset.target")
+    client.tables["dataset.target"] = [pyarrow.table({"id": [-1]})]
+    client.fail_loads = True
+
+    with connection as bq:
+        bq.from_pandas(_chunks(1)[0], mode="replace")
+        finish_res = bq.finish()
+
+    assert not finish_res.success
+    assert client.copies == []
+    assert client.rows("dataset.target") == [-1]
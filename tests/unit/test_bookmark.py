@@ -0,0 +1,102 @@
+import datetime
+import sqlite3
+
+from inbound.core import JobResult
+from inbound.core.bookmark_service import (
+    DuckDBBookmarkService,
+    get_bookmark,
+    set_bookmark,
+)
+from inbound.core.jobs import _run_jobs_in_list
+from inbound.core.models import Bookmark, JobModel, Profile, Spec
+from inbound.plugins.connections.sqlalchemy import SQLAlchemyConnection
+
+
+def test_bookmark_store_roundtrip(tmp_path):
+    store = DuckDBBookmarkService(str(tmp_path / "bookmarks.duckdb"))
+    updated = datetime.datetime(2023, 1, 2, 3, 4, 5)
+
+    assert get_bookmark(store, "job") is None
+
+    set_bookmark(store, "job", Bookmark(column="id", last_value=1))
+    set_bookmark(store, "job", Bookmark(column="updated", last_value=updated))
+
+    bookmark = get_bookmark(store, "job")
+    assert bookmark.column == "updated"
+    assert bookmark.last_value == updated
+
+
+def test_bookmark_keeps_text_values(tmp_path):
+    store = DuckDBBookmarkService(str(tmp_path / "bookmarks.duckdb"))
+
+    for value in ["20230101", "2023-01-01", datetime.date(2023, 1, 1)]:
+        set_bookmark(store, "job", Bookmark(column="code", last_value=value))
+
+        assert get_bookmark(store, "job").last_value == value
+
+
+def _insert(database: str, ids: list) -> None:
+    with sqlite3.connect(database) as connection:
+        connection.execute("create table if not exists source (id integer, name text)")
+        connection.executemany(
+            "insert into source values (?, ?)", [(id, f"name {id}") for id in ids]
+        )
+
+
+def _incremental_job(tmp_path) -> JobModel:
+    source_db = str(tmp_path / "source.db")
+    target_db = str(tmp_path / "target.db")
+    return JobModel(
+        name="incremental",
+        source=Profile(
+            type="sqlalchemy",
+            spec=Spec(
+                connection_string=f"sqlite:///{source_db}",
+                query="select * from source",
+                watermark_column="id",
+                bookmark_store=str(tmp_path / "bookmarks.duckdb"),
+            ),
+        ),
+        target=Profile(
+            type="sqlalchemy",
+            spec=Spec(connection_string=f"sqlite:///{target_db}", table="target"),
+        ),
+    )
+
+
+def test_incremental_job(tmp_path):
+    source_db = str(tmp_path / "source.db")
+    target_db = str(tmp_path / "target.db")
+    job = _incremental_job(tmp_path)
+
+    _insert(source_db, [1, 2, 3])
+    assert _run_jobs_in_list([job]).result == "DONE"
+
+    _insert(source_db, [4, 5])
+    assert _run_jobs_in_list([job]).result == "DONE"
+
+    with sqlite3.connect(target_db) as connection:
+        ids = connection.execute("select id from target order by id").fetchall()
+    assert [id for id, in ids] == [1, 2, 3, 4, 5]
+
+    store = DuckDBBookmarkService(str(tmp_path / "bookmarks.duckdb"))
+    assert get_bookmark(store, "incremental").last_value == 5
+
+
+def test_failed_load_keeps_bookmark(tmp_path, monkeypatch):
+    source_db = str(tmp_path / "source.db")
+    job = _incremental_job(tmp_path)
+
+    _insert(source_db, [1, 2, 3])
+    assert _run_jobs_in_list([job]).result == "DONE"
+
+    monkeypatch.setattr(
+        SQLAlchemyConnection,
+        "from_pandas",
+        lambda self, df, *args, **kwargs: ("FAILED", JobResult(result="FAILED")),
+    )
+    _insert(source_db, [4, 5])
+    assert _run_jobs_in_list([job]).result == "FAILED"
+
+    store = DuckDBBookmarkService(str(tmp_path / "bookmarks.duckdb"))
+    assert get_bookmark(store, "incremental").last_value == 3
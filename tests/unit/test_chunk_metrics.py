@@ -0,0 +1,34 @@
+import pandas
+
+from inbound.core.chunk_metrics import frame_size
+from inbound.core.job_result import JobResult
+
+
+def test_frame_size():
+    small = pandas.DataFrame({"id": range(10), "name": ["name"] * 10})
+    large = pandas.DataFrame(
+        {"id": range(100000), "name": [f"name {n}" for n in range(100000)]}
+    )
+    deep = large.memory_usage(deep=True).sum()
+
+    assert frame_size(small) == small.memory_usage(deep=True).sum()
+    assert frame_size(large, "deep") == deep
+    assert frame_size(large, "shallow") == large.memory_usage().sum()
+    assert abs(frame_size(large, "sampled") - deep) / deep < 0.05
+
+
+def test_append_keeps_last_chunks(monkeypatch):
+    monkeypatch.setenv("INBOUND_MAX_CHUNKS", "3")
+    job_result = JobResult()
+
+    for chunk_number in range(10):
+        job_result.append(
+            JobResult(result="DONE", rows=10, size=100, chunk_number=chunk_number)
+        )
+
+    assert job_result.rows == 100
+    assert job_result.size == 1000
+    assert job_result.chunk_count == 10
+    assert [chunk.chunk_number for chunk in job_result.chunks] == [7, 8, 9]
+    assert [batch.chunk_number for batch in job_result.batches] == [7, 8, 9]
+    assert len(job_result.to_json()["chunks"]) == 3
@@ -1,11 +1,16 @@
 import os
 
+import duckdb
+import pandas
 import yaml
 from pydantic import ValidationError
 
+from inbound.core.job_factory import Job
 from inbound.core.jobs import run_job
 from inbound.core.logging import LOGGER
-from inbound.core.models import JobsModel
+from inbound.core.models import JobModel, JobsModel, Profile, Spec
+from inbound.plugins.connections.duckdb import DuckDBConnection
+from inbound.plugins.connections.file import FileConnection
 
 
 def test_validate_schema(data_path):
@@ -40,3 +45,74 @@ def test_csv_duckdb_job_with_metadata(data_path):
     ret = run_job(data_path + "/csv_duckdb_metadata.yml")
 
     assert ret.result == "DONE"
+
+
+def test_csv_duckdb_job_pipelined(data_path):
+    ret = run_job(data_path + "/csv_duckdb_pipelined.yml")
+
+    assert ret.result == "DONE"
+
+
+def _csv_duckdb_job(tmp_path, transformer: str = None, direct: bool = True) -> Job:
+    pandas.DataFrame({"id": range(25000), "name": "x"}).to_csv(
+        tmp_path / "source.csv", index=False
+    )
+    source = FileConnection(
+        Profile(
+            type="file",
+            spec=Spec(
+                path=str(tmp_path / "source.csv"), sep=",", transformer=transformer
+            ),
+        )
+    )
+    sink = DuckDBConnection(
+        Profile(
+            type="duckdb",
+            spec=Spec(database=str(tmp_path / "test.duckdb"), table="test"),
+        )
+    )
+    config = JobModel(
+        name="direct", source=source.profile, target=sink.profile, direct=direct
+    )
+    return Job(source, sink, config)
+
+
+def test_csv_duckdb_direct(tmp_path):
+    res = _csv_duckdb_job(tmp_path).run()
+
+    assert res.result == "DONE"
+    assert res.rows == 25000
+    assert [chunk.task_name for chunk in res.chunks] == ["file to duckbd"]
+
+
+def test_csv_duckdb_direct_is_opt_in(tmp_path):
+    job = _csv_duckdb_job(tmp_path, direct=False)
+    assert JobModel(source=job.source.profile, target=job.sink.profile).direct is False
+
+    res = job.run()
+
+    assert res.result == "DONE"
+    assert res.rows == 25000
+    assert "file to duckbd" not in [chunk.task_name for chunk in res.chunks]
+
+
+def test_csv_with_header_offset_is_not_direct(tmp_path):
+    path = tmp_path / "source.csv"
+    path.write_text("exported by system\nid,name\n1,x\n")
+    spec = Spec(path=str(path), header=1)
+
+    assert not FileConnection(Profile(type="file", spec=spec)).supports_to_files()
+    spec = Spec(path=str(path))
+    assert FileConnection(Profile(type="file", spec=spec)).supports_to_files()
+
+
+def test_csv_duckdb_direct_with_transformer(tmp_path):
+    path = tmp_path / "transformer.py"
+    path.write_text("def transform(df):\n    return df[df['id'] % 2 == 0]\n")
+
+    res = _csv_duckdb_job(tmp_path, str(path)).run()
+
+    assert res.result == "DONE"
+    assert res.rows == 12500
+    with duckdb.connect(str(tmp_path / "test.duckdb")) as db:
+        assert db.execute("select count(*) from test").fetchone()[0] == 12500
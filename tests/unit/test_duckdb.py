@@ -1,6 +1,7 @@
 import numpy as np
+import pandas
 
-from inbound.core.models import Profile, Spec
+from inbound.core.models import Profile, Spec, SyncMode
 from inbound.plugins.connections.duckdb import DuckDBConnection
 from inbound.plugins.utils import df
 
@@ -44,3 +45,70 @@ def test_drop_table():
         ret = db.drop(profile.spec.table)
 
         assert ret.result == "DONE"
+
+
+def test_append_all_chunks():
+    profile = Profile(spec=Spec(database=":memory:", table="test"))
+    chunks = np.array_split(df, 4)
+    with DuckDBConnection(profile=profile) as db:
+        for index in range(len(chunks)):
+            db.from_pandas(chunks[index], chunk_number=index, mode="replace")
+        db.from_pandas(df, chunk_number=0, mode="append")
+
+        assert db.execute("select count(*) from test").fetchone()[0] == 2 * len(df)
+
+
+def test_append_type_clash_between_chunks():
+    # per chunk type inference reads Code as int first and as str later
+    profile = Profile(spec=Spec(database=":memory:", table="test"))
+    chunks = [
+        pandas.DataFrame({"Code": [1, 2, 3]}),
+        pandas.DataFrame({"Code": ["TotalStated", "Total"]}),
+    ]
+    with DuckDBConnection(profile=profile) as db:
+        _, job_res = db.from_pandas(chunks[0], chunk_number=0, mode="replace")
+        assert job_res.result == "DONE"
+        _, job_res = db.from_pandas(chunks[1], chunk_number=1, mode="replace")
+
+        assert job_res.result == "FAILED"
+        assert "Could not convert string 'TotalStated'" in job_res.exception
+        assert db.execute("select count(*) from test").fetchone()[0] == 3
+
+
+def test_accumulate_chunks():
+    spec = Spec(database=":memory:", table="test", accumulate_chunks=3)
+    chunks = np.array_split(df, 4)
+    with DuckDBConnection(profile=Profile(spec=spec)) as db:
+        for index in range(len(chunks)):
+            ret, job_res = db.from_pandas(
+                chunks[index], chunk_number=index, mode="replace"
+            )
+        assert db.execute("select count(*) from test").fetchone()[0] == sum(
+            len(chunk) for chunk in chunks[:3]
+        )
+
+        job_res = db.finish()
+        assert job_res.result == "DONE"
+        assert job_res.rows == len(chunks[3])
+        assert db.execute("select count(*) from test").fetchone()[0] == len(df)
+        assert db.finish() is None
+
+
+def test_from_file(tmp_path):
+    path = tmp_path / "it's.csv"
+    df.to_csv(path, sep=";", index=False)
+    df.to_parquet(tmp_path / "test.parquet", index=False)
+
+    profile = Profile(spec=Spec(database=":memory:", table="test"))
+    with DuckDBConnection(profile=profile) as db:
+        options = {"format": "csv", "sep": ";", "header": True}
+        ret, job_res = db.from_file(str(path), options, mode="replace")
+        assert job_res.result == "DONE"
+        assert job_res.rows == len(df)
+
+        job_res = db.from_parquet(str(tmp_path / "test.parquet"), SyncMode.APPEND)
+        assert job_res.result == "DONE"
+        assert db.execute("select count(*) from test").fetchone()[0] == 2 * len(df)
+
+        chunks = list(db.scan_file(str(path), options, chunk_size=1024))
+        assert sum(batch.num_rows for batch, _ in chunks) == len(df)
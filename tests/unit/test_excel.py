@@ -1,6 +1,7 @@
 from pathlib import Path
 
 import numpy as np
+import openpyxl
 import pandas as pd
 import pytest
 
@@ -20,7 +21,6 @@ def profile(data_path):
     return Profile(spec=spec)
 
 
-@pytest.mark.skip(reason="append mode not implemented yet")
 def test_write_pandas_append(profile):
 
     # split in 4 chunks
@@ -31,6 +31,23 @@ def test_write_pandas_append(profile):
         assert job_res.result == "DONE"
 
 
+def test_streaming_read_and_append(tmp_path):
+    spec = Spec(path=str(tmp_path / "test.xlsx"), chunksize=30)
+    for session in range(2):
+        with FileConnection(profile=Profile(spec=spec)) as db:
+            for index, chunk in enumerate(np.array_split(df, 4)):
+                res, job_res = db.from_pandas(chunk, chunk_number=index)
+                assert job_res.result == "DONE"
+            assert db.finish().result == "DONE"
+
+    with FileConnection(profile=Profile(spec=spec)) as db:
+        chunks = [chunk for chunk, _ in db.to_pandas()]
+
+    assert sum(len(chunk) for chunk in chunks) == 2 * len(df)
+    assert max(len(chunk) for chunk in chunks) == 30
+    assert list(chunks[0].columns) == list(df.columns)
+
+
 def test_roundtrip(profile):
     with FileConnection(profile=profile) as db:
         db.from_pandas(df, mode="replace")
@@ -57,3 +74,23 @@ def test_drop(profile):
         ret = db.drop()
 
         assert ret.result == "DONE"
+
+
+def test_append_keeps_formulas(tmp_path):
+    path = tmp_path / "test.xlsx"
+    workbook = openpyxl.Workbook()
+    workbook.active.title = "Summary"
+    workbook.active.append([1])
+    workbook.active.append([2])
+    workbook.active.append(["=SUM(A1:A2)"])
+    workbook.save(path)
+
+    spec = Spec(path=str(path), sheet_name="Data")
+    with FileConnection(profile=Profile(spec=spec)) as db:
+        res, job_res = db.from_pandas(df, mode="append")
+        assert job_res.result == "DONE"
+        assert db.finish().result == "DONE"
+
+    workbook = openpyxl.load_workbook(path)
+    assert workbook["Summary"]["A3"].value == "=SUM(A1:A2)"
+    assert workbook["Data"].max_row == len(df) + 1
@@ -0,0 +1,201 @@
+import io
+import os
+import threading
+import time
+
+import pandas
+import pytest
+
+from inbound.core.models import Profile, Spec
+from inbound.plugins.connections.gcs import GCSConnection
+
+
+class FakeBlob:
+    def __init__(self, bucket, name, chunk_size=None):
+        self.bucket = bucket
+        self.name = name
+        self.chunk_size = chunk_size
+
+    @property
+    def size(self):
+        return len(self.bucket.objects[self.name])
+
+    def download_to_filename(self, file_name):
+        self.bucket.downloads.append(threading.current_thread().name)
+        with open(file_name, "wb") as f:
+            f.write(self.bucket.objects[self.name])
+
+    def open(self, mode="rb"):
+        return io.BytesIO(self.bucket.objects[self.name])
+
+    def upload_from_filename(self, file_name, **kwargs):
+        with self.bucket.lock:
+            self.bucket.uploading += 1
+            self.bucket.max_uploading = max(
+                self.bucket.max_uploading, self.bucket.uploading
+            )
+        time.sleep(0.01)
+        with open(file_name, "rb") as f:
+            self.bucket.objects[self.name] = f.read()
+        with self.bucket.lock:
+            self.bucket.uploading -= 1
+
+    def delete(self):
+        del self.bucket.objects[self.name]
+
+
+class FakeBucket:
+    def __init__(self, name):
+        self.name = name
+        self.objects = {}
+        self.downloads = []
+        self.lock = threading.Lock()
+        self.uploading = 0
+        self.max_uploading = 0
+
+    def blob(self, name, chunk_size=None):
+        return FakeBlob(self, name, chunk_size)
+
+
+class FakeClient:
+    def __init__(self):
+        self.buckets = {}
+
+    def bucket(self, name):
+        return self.buckets.setdefault(name, FakeBucket(name))
+
+    def list_blobs(self, bucket, prefix=None, delimiter=None):
+        names = sorted(name for name in bucket.objects if name.startswith(prefix))
+        return [FakeBlob(bucket, name) for name in names]
+
+
+@pytest.fixture
+def client(monkeypatch):
+    client = FakeClient()
+    monkeypatch.setattr(GCSConnection, "get_client", lambda self: client)
+    return client
+
+
+def _put_blobs(client, format: str, count: int = 3, rows: int = 25):
+    bucket = client.bucket("test")
+    for index in range(count):
+        df = pandas.DataFrame({"id": range(index * rows, (index + 1) * rows)})
+        if format == "parquet":
+            content = df.to_parquet(index=False)
+        else:
+            content = df.to_csv(index=False, compression=None).encode()
+            if format == "csv.gz":
+                buffer = io.BytesIO()
+                df.to_csv(buffer, index=False, compression="gzip")
+                content = buffer.getvalue()
+        bucket.objects[f"data/part_{index}.{format}"] = content
+    return bucket
+
+
+@pytest.mark.parametrize("format", ["parquet", "csv.gz"])
+@pytest.mark.parametrize("stream_blobs", [False, True])
+def test_to_pandas_chunks(client, format, stream_blobs):
+    bucket = _put_blobs(client, format)
+    spec = Spec(
+        bucket="test",
+        prefix="data",
+        format=format,
+        chunksize=10,
+        prefetch=2,
+        stream_blobs=stream_blobs,
+    )
+
+    with GCSConnection(Profile(spec=spec)) as gcs:
+        results = list(gcs.to_pandas())
+
+    assert [len(df) for df, _ in results] == [10, 10, 5] * 3
+    assert list(pandas.concat(df for df, _ in results)["id"]) == list(range(75))
+    assert [res.chunk_number for _, res in results] == list(range(9))
+    assert all(res.success and res.rows == len(df) for df, res in results)
+    if stream_blobs:
+        assert bucket.downloads == []
+    else:
+        assert all(name.startswith("inbound-gcs") for name in bucket.downloads)
+
+
+def test_to_files_removes_downloads(client):
+    _put_blobs(client, "parquet")
+    spec = Spec(bucket="test", prefix="data", format="parquet", prefetch=2)
+
+    file_names = []
+    with GCSConnection(Profile(spec=spec)) as gcs:
+        for file_name, options, res in gcs.to_files():
+            assert os.path.exists(file_name)
+            assert options == {"format": "parquet"}
+            file_names.append(file_name)
+
+    assert len(file_names) == 3
+    assert not any(os.path.exists(file_name) for file_name in file_names)
+
+
+@pytest.mark.parametrize("format", ["parquet", "csv.gz"])
+def test_from_pandas_rolling_uploads(client, format):
+    spec = Spec(
+        bucket="test",
+        prefix="data",
+        blob="test",
+        format=format,
+        file_size=1,
+        parallel=2,
+        compression="zstd",
+    )
+    chunks = [pandas.DataFrame({"id": range(i * 10, (i + 1) * 10)}) for i in range(6)]
+
+    with GCSConnection(Profile(spec=spec)) as gcs:
+        for index, df in enumerate(chunks):
+            _, res = gcs.from_pandas(df, chunk_number=index, mode="replace")
+            assert res.success
+        finish_res = gcs.finish()
+
+    bucket = client.bucket("test")
+    assert finish_res.success
+    assert finish_res.rows == 60
+    assert finish_res.size == sum(len(content) for content in bucket.objects.values())
+    assert len(finish_res.batches) == 6
+    assert bucket.max_uploading <= 2
+    assert sorted(bucket.objects)[:2] == [
+        f"data/test.{format}",
+        f"data/test_00001.{format}",
+    ]
+
+    with GCSConnection(Profile(spec=spec)) as gcs:
+        assert sorted(df["id"].iloc[0] for df, _ in gcs.to_pandas()) == list(
+            range(0, 60, 10)
+        )
+
+
+def test_from_pandas_replace_removes_stale_blobs(client):
+    bucket = client.bucket("test")
+    df = pandas.DataFrame({"id": range(10)})
+    for file_size in [1, None]:
+        spec = Spec(bucket="test", prefix="data", blob="test", file_size=file_size)
+        with GCSConnection(Profile(spec=spec)) as gcs:
+            for index in range(3):
+                gcs.from_pandas(df, chunk_number=index, mode="replace")
+
+    assert list(bucket.objects) == ["data/test.parquet"]
+
+    spec = Spec(bucket="test", prefix="data", blob="test")
+    with GCSConnection(Profile(spec=spec)) as gcs:
+        gcs.from_pandas(df, chunk_number=0, mode="append")
+        assert sum(len(df) for df, _ in gcs.to_pandas()) == 30
+
+    assert len(bucket.objects) == 2
+
+
+def test_from_pandas_replace_keeps_blobs_with_shared_prefix(client):
+    bucket = client.bucket("test")
+    siblings = ["data/test_archive.parquet", "data/tests.parquet", "data/test.csv"]
+    for name in siblings + ["data/test_2023_01_01T00_00_00_00001.parquet"]:
+        bucket.objects[name] = b""
+
+    spec = Spec(bucket="test", prefix="data", blob="test")
+    with GCSConnection(Profile(spec=spec)) as gcs:
+        gcs.from_pandas(pandas.DataFrame({"id": range(10)}), mode="replace")
+
+    assert sorted(bucket.objects) == sorted(siblings + ["data/test.parquet"])
@@ -0,0 +1,111 @@
+import os
+
+import pandas
+
+from inbound.core.job_factory import Job
+from inbound.core.job_result import JobResult
+from inbound.core.models import JobModel, Profile, Spec
+
+
+class ListSource:
+    def __init__(self, chunks, fail_after: int = None):
+        self.profile = Profile(type="list", spec=Spec())
+        self.chunks = chunks
+        self.fail_after = fail_after
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def to_pandas(self, job_id: str = None):
+        for index, df in enumerate(self.chunks):
+            if index == self.fail_after:
+                raise ValueError("read error")
+            yield df, JobResult(result="DONE", rows=len(df))
+
+
+class ListSink(ListSource):
+    def __init__(self):
+        super().__init__([])
+
+    def from_pandas(self, df, chunk_number=0, mode="append", job_id=None):
+        self.chunks.append((chunk_number, df))
+        return None, JobResult(result="DONE", rows=len(df))
+
+
+def _config(pipelined: bool, transform_processes: int = None) -> JobModel:
+    return JobModel(
+        name="pipeline",
+        source=Profile(type="list"),
+        target=Profile(type="list"),
+        pipelined=pipelined,
+        queue_depth=1,
+        transform_processes=transform_processes,
+    )
+
+
+def test_pipelined_keeps_chunk_order():
+    chunks = [pandas.DataFrame({"a": [index]}) for index in range(20)]
+    sink = ListSink()
+
+    res = Job(ListSource(chunks), sink, _config(pipelined=True)).run()
+
+    assert res.result == "DONE"
+    assert [index for index, _ in sink.chunks] == list(range(20))
+    assert [df["a"][0] for _, df in sink.chunks] == list(range(20))
+
+
+def test_pipelined_read_error():
+    chunks = [pandas.DataFrame({"a": [index]}) for index in range(5)]
+
+    res = Job(ListSource(chunks, fail_after=3), ListSink(), _config(True)).run()
+
+    assert res.result == "FAILED"
+
+
+def test_transform_in_process_pool(tmp_path):
+    path = tmp_path / "pool_transformer.py"
+    path.write_text(
+        "import os\n\n"
+        "def transform(df):\n"
+        "    df['pid'] = os.getpid()\n"
+        "    return df\n"
+    )
+    chunks = [pandas.DataFrame({"a": [index], "b": ["x"]}) for index in range(20)]
+    source = ListSource(chunks)
+    source.profile.spec.transformer = str(path)
+
+    for pipelined in [False, True]:
+        sink = ListSink()
+        config = _config(pipelined=pipelined, transform_processes=2)
+
+        res = Job(source, sink, config).run()
+
+        assert res.result == "DONE"
+        assert [df["a"][0] for _, df in sink.chunks] == list(range(20))
+        assert os.getpid() not in {df["pid"][0] for _, df in sink.chunks}
+
+
+def test_transform_pool_spawns_processes(tmp_path):
+    source = ListSource([])
+    source.profile.spec.transformer = str(tmp_path / "transformer.py")
+    job = Job(source, ListSink(), _config(False, transform_processes=2))
+
+    with job._transform_pool(source) as pool:
+        assert pool._mp_context.get_start_method() == "spawn"
+
+
+def test_transformer_load_seconds_in_job_result(tmp_path):
+    path = tmp_path / "load_transformer.py"
+    path.write_text("def transform(df):\n    return df\n")
+    chunks = [pandas.DataFrame({"a": [index]}) for index in range(5)]
+    source = ListSource(chunks)
+    source.profile.spec.transformer = str(path)
+
+    res = Job(source, ListSink(), _config(False)).run()
+
+    assert res.result == "DONE"
+    assert res.load_seconds > 0
+    assert res.to_json()["load duration"] == str(round(res.load_seconds, 4))
@@ -0,0 +1,102 @@
+import hashlib
+
+import pandas
+import pytest
+
+from inbound.core import metadata
+from inbound.core.metadata import enriched_with_metadata, raw_json, row_hashes, row_ids
+from inbound.core.models import Spec
+
+df = pandas.DataFrame(
+    {"id": [1, 2, 3], "code": ["a", "b c", "d"], "name": ["æ", "ø", "å"]}
+)
+
+
+def test_row_ids():
+    assert row_ids(df, "id").tolist() == [1, 2, 3]
+    assert row_ids(df, ["code", "id"]).tolist() == ["1_a", "2_b c", "3_d"]
+    assert row_ids(df, None).tolist() == [1, 2, 3]
+    assert row_ids(df, ["missing"]) is None
+
+
+def test_row_ids_match_row_wise_join():
+    data = pandas.DataFrame(
+        {
+            "id": [1, 2, 3],
+            "price": [1.5, float("nan"), 3.0],
+            "updated": pandas.to_datetime(["2023-01-01", "2023-01-02", None]),
+            "time": pandas.to_datetime(["2023-01-01 10:00", "2023-01-02", None]),
+            "code": ["a", None, "c d"],
+        }
+    )
+    keys = [
+        ["id", "price"],
+        ["id", "updated"],
+        ["updated"],
+        ["updated", "time"],
+        ["price", "code"],
+        ["id", "code", "updated"],
+    ]
+    for key in keys:
+        expected = (
+            data[[x for x in data.columns if x in key]]
+            .apply(lambda x: "_".join(x.astype(str)), axis=1)
+            .replace(" ", "_")
+        )
+        assert row_ids(data, key).tolist() == expected.tolist()
+
+    assert row_ids(data, ["id", "price"]).tolist() == ["1.0_1.5", "2.0_nan", "3.0_3.0"]
+    assert row_ids(data, ["id", "updated"])[0] == "1_2023-01-01 00:00:00"
+
+
+def test_raw_json():
+    data = pandas.DataFrame(
+        {
+            "id": [1, 2, None, 4, 5],
+            "text": ["a\nb", "æøå", None, "line\u2028separator", '"quoted"'],
+            "value": [0.1, 1e20, float("nan"), -3.5, 2 / 3],
+            "updated": pandas.date_range("2023-01-01", periods=5, freq="H"),
+            "nested": [{"a": 1}, [1, 2], None, {}, "x"],
+        }
+    )
+    expected = data.to_json(
+        orient="records", lines=True, force_ascii=False, date_format="iso"
+    ).split("\n")[:-1]
+
+    assert raw_json(data, block_rows=2) == expected
+    assert raw_json(data.head(0)) == []
+
+
+def test_row_hashes():
+    values = ['{"id":1}', '{"id":2}']
+
+    assert row_hashes(values) == [
+        hashlib.md5(value.encode("utf-8")).hexdigest() for value in values
+    ]
+    assert row_hashes(values, "sha256")[0] == hashlib.sha256(b'{"id":1}').hexdigest()
+
+    hash64 = row_hashes(values, "hash64")
+    assert hash64 == row_hashes(values, "hash64")
+    assert len(set(hash64)) == 2
+    assert all(len(value) == 16 for value in hash64)
+
+    hash64 = row_hashes([], "hash64", df)
+    assert hash64 == row_hashes([], "hash64", df.copy())
+    assert len(set(hash64)) == 3
+
+
+def test_xxhash_missing(monkeypatch):
+    monkeypatch.setattr(metadata, "xxhash", None)
+
+    with pytest.raises(ImportError, match=r"inbound-core\[xxhash\]"):
+        row_hashes(["a"], "xxh64")
+
+
+def test_log_format():
+    spec = Spec(format="log", row_id=["id", "code"], hash_function="hash64")
+
+    df_out, job_res = enriched_with_metadata(spec, df)
+
+    assert job_res.result == "DONE"
+    assert df_out["ROW_ID"].tolist() == ["1_a", "2_b c", "3_d"]
+    assert df_out["HASH"].tolist() == row_hashes([], "hash64", df)
@@ -0,0 +1,90 @@
+import threading
+import time
+import urllib.request
+
+from inbound.core.jobs import run_job
+from inbound.core.metrics import (
+    FileMetrics,
+    PrometheusMetrics,
+    get_metrics,
+    set_metrics,
+)
+
+
+def test_exposition():
+    metrics = PrometheusMetrics(buckets=(0.1, 1))
+    metrics.inc("inbound_rows_total", 10, stage="write", job="a")
+    metrics.inc("inbound_rows_total", 5, stage="write", job="a")
+    metrics.set("inbound_job_peak_memory_bytes", 1024, job='say "hi"')
+    metrics.observe("inbound_stage_seconds", 0.05, stage="read")
+    metrics.observe("inbound_stage_seconds", 0.5, stage="read")
+    metrics.observe("inbound_stage_seconds", 5, stage="read")
+
+    lines = metrics.exposition().splitlines()
+
+    assert "# TYPE inbound_rows_total counter" in lines
+    assert 'inbound_rows_total{job="a",stage="write"} 15' in lines
+    assert 'inbound_job_peak_memory_bytes{job="say \\"hi\\""} 1024' in lines
+    assert 'inbound_stage_seconds_bucket{stage="read",le="0.1"} 1' in lines
+    assert 'inbound_stage_seconds_bucket{stage="read",le="1"} 2' in lines
+    assert 'inbound_stage_seconds_bucket{stage="read",le="+Inf"} 3' in lines
+    assert 'inbound_stage_seconds_sum{stage="read"} 5.55' in lines
+    assert 'inbound_stage_seconds_count{stage="read"} 3' in lines
+
+
+def test_serve():
+    metrics = PrometheusMetrics()
+    metrics.inc("inbound_retries_total", function="connect")
+    server = metrics.serve(0)
+    try:
+        url = f"http://localhost:{server.server_port}/metrics"
+        body = urllib.request.urlopen(url).read().decode("utf-8")
+    finally:
+        server.shutdown()
+
+    assert 'inbound_retries_total{function="connect"} 1' in body
+
+
+def test_job_metrics_dump(data_path, tmp_path):
+    path = tmp_path / "metrics.prom"
+    set_metrics(FileMetrics(str(path)))
+    try:
+        ret = run_job(data_path + "/csv_duckdb.yml")
+    finally:
+        set_metrics(None)
+
+    text = path.read_text()
+
+    assert ret.result == "DONE"
+    assert 'inbound_jobs_total{job="CSV to DuckDB",result="DONE"} 1' in text
+    assert 'inbound_rows_total{job="CSV to DuckDB",stage="write"}' in text
+    assert 'inbound_stage_seconds_count{job="CSV to DuckDB",stage="read"}' in text
+    assert "inbound_job_rows_per_second" in text
+
+
+def test_get_metrics_from_threads(monkeypatch):
+    serves = []
+
+    def serve(self, port):
+        time.sleep(0.05)
+        serves.append(port)
+
+    monkeypatch.setenv("INBOUND_METRICS", "prometheus")
+    monkeypatch.setenv("INBOUND_METRICS_PORT", "9100")
+    monkeypatch.setattr(PrometheusMetrics, "serve", serve)
+    set_metrics(None)
+    backends = []
+    threads = [
+        threading.Thread(target=lambda: backends.append(get_metrics()))
+        for _ in range(8)
+    ]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        set_metrics(None)
+
+    assert serves == [9100]
+    assert len({id(backend) for backend in backends}) == 1
@@ -0,0 +1,64 @@
+import contextlib
+import io
+import threading
+from types import SimpleNamespace
+
+import pandas
+
+from inbound.plugins.connections.postgres import CopyStream, _read_options
+
+
+def test_copy_stream_to_pandas_chunks():
+    stream = CopyStream(maxsize=2)
+
+    def copy():
+        stream.write("id,name\n")
+        for index in range(100):
+            stream.write(f"{index},name {index}\n".encode("utf-8"))
+        stream.close_writer()
+
+    writer = threading.Thread(target=copy)
+    writer.start()
+    chunks = list(pandas.read_csv(stream, chunksize=30))
+    writer.join()
+
+    assert [len(chunk) for chunk in chunks] == [30, 30, 30, 10]
+    assert chunks[-1]["name"].iloc[-1] == "name 99"
+
+
+def test_copy_stream_abort():
+    stream = CopyStream(maxsize=1)
+    errors = []
+
+    def copy():
+        try:
+            while True:
+                stream.write("1\n")
+        except IOError as e:
+            errors.append(e)
+        finally:
+            stream.close_writer()
+
+    writer = threading.Thread(target=copy)
+    writer.start()
+    assert stream.read(2) == "1\n"
+    stream.abort()
+    writer.join()
+
+    assert len(errors) == 1
+
+
+def test_read_options_keep_text_values():
+    cursor = SimpleNamespace(
+        execute=lambda query: None,
+        description=[("name", 25), ("flag", 16), ("amount", 701)],
+    )
+    raw_connection = SimpleNamespace(cursor=lambda: contextlib.nullcontext(cursor))
+    copy = 'name,flag,amount\nNA,t,1.5\n"",\\N,\\N\nnull,f,4\nN/A,t,2\n\\N,f,3\n'
+
+    df = pandas.read_csv(io.StringIO(copy), **_read_options(raw_connection, "q"))
+
+    assert list(df["name"])[:4] == ["NA", "", "null", "N/A"]
+    assert pandas.isna(df["name"].iloc[4])
+    assert list(df["flag"]) == [True, None, False, True, False]
+    assert df["amount"].isna().tolist() == [False, True, False, False, False]
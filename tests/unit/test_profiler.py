@@ -0,0 +1,85 @@
+import json
+import time
+import tracemalloc
+
+from inbound.core.jobs import run_job
+from inbound.core.profiler import (
+    NULL_SESSION,
+    MemoryProfiler,
+    get_profilers,
+    get_session,
+)
+
+
+def test_profiling_is_off_by_default(monkeypatch):
+    monkeypatch.delenv("INBOUND_PROFILING", raising=False)
+
+    assert get_session("job") is NULL_SESSION
+    assert list(NULL_SESSION.iterate("read", iter([1, 2]))) == [1, 2]
+
+
+def test_get_profilers():
+    assert get_profilers("timer, cpu") == ["timer", "cpu"]
+    assert get_profilers("1") == ["timer", "cpu", "memory"]
+    assert get_profilers("") == []
+
+
+def test_stage_report(tmp_path):
+    session = get_session("test job", "timer,cpu,memory")
+
+    with session:
+        for _ in session.iterate("read", iter(range(3))):
+            with session.stage("write"):
+                data = [0] * 100000
+                time.sleep(0.05)
+    session.write(tmp_path)
+
+    report = json.loads((tmp_path / "test_job.json").read_text())
+    folded = (tmp_path / "test_job.folded").read_text()
+
+    assert report["timer"]["read"]["count"] == 4
+    assert report["timer"]["write"]["count"] == 3
+    assert report["timer"]["write"]["seconds"] >= 0.15
+    assert report["memory"]["stages"]["write"]["peak_bytes"] >= len(data) * 8
+    assert report["cpu"]["stages"]["write"] > 0
+    assert all(line.startswith("write;") for line in folded.splitlines())
+    assert not tracemalloc.is_tracing()
+
+
+def test_job_profile(data_path, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("INBOUND_PROFILING", "timer")
+
+    ret = run_job(data_path + "/csv_duckdb.yml")
+
+    reports = list((tmp_path / "target" / "profile").glob("*.json"))
+    report = json.loads(reports[0].read_text())
+
+    assert ret.result == "DONE"
+    assert len(reports) == 1
+    assert {"read", "write"} <= set(report["timer"])
+
+
+def test_memory_profilers_share_tracing():
+    first, second = get_session("first", "memory"), get_session("second", "memory")
+
+    first.__enter__()
+    second.__enter__()
+    first.__exit__(None, None, None)
+    assert tracemalloc.is_tracing()
+    second.__exit__(None, None, None)
+
+    assert second.profilers[0].top
+    assert not tracemalloc.is_tracing()
+
+
+def test_profiler_error_does_not_fail_job(data_path, tmp_path, monkeypatch):
+    def start(self):
+        raise RuntimeError("profiler failed")
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("INBOUND_PROFILING", "memory")
+    monkeypatch.setattr(MemoryProfiler, "start", start)
+
+    assert run_job(data_path + "/csv_duckdb.yml").result == "DONE"
+    assert not tracemalloc.is_tracing()
@@ -0,0 +1,41 @@
+import json
+import threading
+
+from inbound.core.job_result import JobResult
+from inbound.core.result_sink import RESULT_SINK, ResultSink
+
+
+def test_concurrent_writes_are_json_lines(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    sink = ResultSink(flush_interval=0.05, batch_size=10)
+
+    def write(thread: int):
+        for index in range(100):
+            sink.write("results.json", {"thread": thread, "index": index})
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    sink.close()
+
+    lines = (tmp_path / "target" / "results.json").read_text().splitlines()
+    records = [json.loads(line) for line in lines]
+
+    assert len(records) == 400
+    for thread in range(4):
+        indices = [r["index"] for r in records if r["thread"] == thread]
+        assert indices == list(range(100))
+
+
+def test_job_result_log(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    JobResult(result="DONE", job_id="first").log()
+    JobResult(result="DONE", job_id="second").log()
+    RESULT_SINK.flush()
+
+    lines = (tmp_path / "target" / "job_result.json").read_text().splitlines()
+
+    assert [json.loads(line)["id"] for line in lines] == ["first", "second"]
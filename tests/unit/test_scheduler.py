@@ -0,0 +1,102 @@
+import threading
+import time
+
+from inbound.core import jobs as jobs_module
+from inbound.core.job_result import JobResult
+from inbound.core.jobs import run_job, run_jobs
+from inbound.core.models import JobModel, Profile, Spec
+from inbound.core.scheduler import JobScheduler, dependencies
+
+
+def _job(name: str, source: Profile, target: Profile) -> JobModel:
+    return JobModel(name=name, source=source, target=target)
+
+
+def _file(path: str) -> Profile:
+    return Profile(type="file", spec=Spec(path=path))
+
+
+def _duckdb(database: str) -> Profile:
+    return Profile(type="duckdb", spec=Spec(database=database, table="test"))
+
+
+def test_dependencies():
+    jobs = [
+        _job("a", _file("a.csv"), _duckdb("db1")),
+        _job("b", _duckdb("db1"), _file("b.csv")),
+        _job("c", _file("c.csv"), _duckdb("db2")),
+        _job("d", _file("a.csv"), _file("d.csv")),
+    ]
+
+    assert dependencies(jobs) == [set(), {0}, set(), set()]
+
+
+def test_concurrency_limit():
+    jobs = [
+        _job(str(index), _file(f"{index}.csv"), _duckdb(f"db{index}"))
+        for index in range(6)
+    ]
+    lock = threading.Lock()
+    running = []
+    max_running = []
+
+    def run(job: JobModel) -> JobResult:
+        with lock:
+            running.append(job.name)
+            max_running.append(len(running))
+        time.sleep(0.05)
+        with lock:
+            running.remove(job.name)
+        return JobResult(result="DONE", job_name=job.name)
+
+    scheduler = JobScheduler(workers=4, concurrency={"duckdb": 2})
+    results = list(scheduler.run(jobs, run))
+
+    assert len(results) == len(jobs)
+    assert all(res.success for _, res in results)
+    assert max(max_running) == 2
+
+
+def test_failing_job_is_reported():
+    jobs = [_job("fails", _file("a.csv"), _duckdb("db1"))]
+
+    def run(job: JobModel) -> JobResult:
+        raise ValueError("error")
+
+    results = list(JobScheduler(workers=2).run(jobs, run))
+
+    assert results[0][1].result == "FAILED"
+
+
+def test_run_job_with_workers(data_path):
+    ret = run_job(data_path + "/csv_duckdb_sqlite.yml", workers=2)
+
+    assert ret.result == "DONE"
+    assert len(ret.jobs) == 2
+
+
+def test_run_jobs_uses_file_settings(tmp_path, monkeypatch):
+    job = """
+    - name: job
+      source: {type: file, spec: {path: a.csv}}
+      target: {type: duckdb, spec: {table: test}}
+    """
+    (tmp_path / "a.yml").write_text(
+        f"workers: 2\nconcurrency: {{duckdb: 2, file: 3}}\njobs:{job}"
+    )
+    (tmp_path / "b.yml").write_text(
+        f"workers: 4\nconcurrency: {{duckdb: 1}}\njobs:{job}"
+    )
+    calls = []
+    monkeypatch.setattr(
+        jobs_module, "_run_jobs_in_list", lambda **kwargs: calls.append(kwargs)
+    )
+
+    run_jobs(str(tmp_path))
+    run_jobs(str(tmp_path), workers=8, concurrency={"file": 1})
+
+    assert calls[0]["workers"] == 4
+    assert calls[0]["concurrency"] == {"duckdb": 1, "file": 3}
+    assert len(calls[0]["jobs"]) == 2
+    assert calls[1]["workers"] == 8
+    assert calls[1]["concurrency"] == {"duckdb": 1, "file": 1}
@@ -1,7 +1,14 @@
+import datetime
+
 import numpy as np
+import pandas
+import pytest
 
 from inbound.core.models import Profile, Spec
-from inbound.plugins.connections.sqlalchemy import SQLAlchemyConnection
+from inbound.plugins.connections.sqlalchemy import (
+    SQLAlchemyConnection,
+    partition_ranges,
+)
 from inbound.plugins.utils import df
 
 spec = Spec(
@@ -52,5 +59,88 @@ def test_drop_table():
         assert ret.result == "DONE"
 
 
+def test_stream_results_in_chunks():
+    spec = Spec(
+        connection_string="sqlite://",
+        table="stream_table",
+        chunksize=100,
+        arraysize=50,
+    )
+    profile = Profile(type="sqlalchemy", name="sqlite stream", spec=spec)
+    data = pandas.DataFrame({"id": range(1000)})
+
+    with SQLAlchemyConnection(profile=profile) as db:
+        db.from_pandas(data)
+
+        chunks = [df for df, job_res in db.to_pandas()]
+
+    assert [len(df) for df in chunks] == [100] * 10
+    assert pandas.concat(chunks)["id"].tolist() == list(range(1000))
+
+
+def test_partition_ranges():
+    assert partition_ranges(1, 10, 3) == [(1, 4), (4, 7), (7, 10)]
+    assert partition_ranges(1, 2, 4) == [(1, 2)]
+    assert partition_ranges(None, None, 4) == [(None, None)]
+    assert partition_ranges("2023-01-01 00:00:00", "2023-01-03 00:00:00", 2) == [
+        ("2023-01-01 00:00:00", "2023-01-02 00:00:00"),
+        ("2023-01-02 00:00:00", "2023-01-03 00:00:00"),
+    ]
+    assert partition_ranges(
+        datetime.date(2023, 1, 1), datetime.date(2023, 1, 5), 2
+    ) == [
+        (datetime.date(2023, 1, 1), datetime.date(2023, 1, 3)),
+        (datetime.date(2023, 1, 3), datetime.date(2023, 1, 5)),
+    ]
+    with pytest.raises(ValueError, match="not dates or timestamps"):
+        partition_ranges("A100", "Z999", 2)
+    with pytest.raises(ValueError, match="numeric, a date or a timestamp"):
+        partition_ranges(b"a", b"z", 2)
+
+
+def test_partitioned_read(tmp_path):
+    data = pandas.DataFrame(
+        {
+            "id": range(1000),
+            "updated": pandas.date_range("2023-01-01", periods=1000, freq="H"),
+        }
+    )
+    data.loc[0, "id"] = None
+
+    for column in ["id", "updated"]:
+        spec = Spec(
+            connection_string=f"sqlite:///{tmp_path / 'partitions.db'}",
+            table="partition_table",
+            chunksize=100,
+            partition_column=column,
+            partitions=4,
+        )
+        profile = Profile(type="sqlalchemy", name="sqlite partitions", spec=spec)
+
+        with SQLAlchemyConnection(profile=profile) as db:
+            db.from_pandas(data)
+            chunks = [df for df, job_res in db.to_pandas()]
+
+        result = pandas.concat(chunks)
+        updated = pandas.to_datetime(result["updated"]).sort_values()
+        assert len(chunks) > 4
+        assert updated.tolist() == data["updated"].tolist()
+
+
+def test_partitioned_read_on_text_column(tmp_path):
+    spec = Spec(
+        connection_string=f"sqlite:///{tmp_path / 'partitions.db'}",
+        table="partition_table",
+        partition_column="code",
+        partitions=4,
+    )
+    profile = Profile(type="sqlalchemy", name="sqlite partitions", spec=spec)
+
+    with SQLAlchemyConnection(profile=profile) as db:
+        db.from_pandas(pandas.DataFrame({"code": ["A1", "B2", "C3"]}))
+        with pytest.raises(ValueError, match="Invalid partition_column code"):
+            list(db.to_pandas())
+
+
 if __name__ == "__main__":
     test_pandas_replace()
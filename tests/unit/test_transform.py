@@ -1,9 +1,12 @@
+import os
+import time
+
 import pandas
 
 from inbound.core.job_result import JobResult
 from inbound.core.logging import LOGGER
 from inbound.core.models import Spec
-from inbound.core.transformer import transform
+from inbound.core.transformer import _get_transformer, transform
 from inbound.plugins.utils import df
 
 
@@ -16,5 +19,38 @@ def test_transformer(data_path):
     assert type(job_result) == JobResult
 
 
+def test_transformer_is_loaded_once(tmp_path):
+    path = tmp_path / "cached_transformer.py"
+    path.write_text(
+        """
+calls = []
+
+def setup():
+    calls.append("setup")
+
+def transform(df):
+    calls.append("transform")
+    return df
+"""
+    )
+    spec = Spec(transformer=str(path))
+
+    _, first = transform(spec, df)
+    _, second = transform(spec, df)
+    module = _get_transformer(str(path))
+
+    assert first.result == "DONE" and second.result == "DONE"
+    assert first.load_seconds > 0
+    assert second.load_seconds == 0
+    assert module.calls == ["setup", "transform", "transform"]
+
+    path.write_text("def transform(df):\n    return df.head(1)\n")
+    os.utime(path, (time.time() + 10, time.time() + 10))
+    df_out, job_result = transform(spec, df)
+
+    assert len(df_out) == 1
+    assert job_result.load_seconds > 0
+
+
 if __name__ == "__main__":
     test_transformer("/Users/paulbencze/Projects/inbound/data")